@@ -1,11 +1,15 @@
 import re
+import sys
+import time
+import logging
 import asyncio
 import json
-from typing import Tuple
-from utils.companyCompleter import CompanyInput
-from utils.newsUtil import get_past_news
-from utils.finUtil import get_stock_prices, get_company_list, format_stock_event_string, save_stock_event_to_cache, format_stock_event_string_to_table
-from utils.timeUtil import find_workdays
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from utils.companyCompleter import CompanyInput, BackgroundCompanyIndex
+from utils.agentTools import get_past_news, get_event_prices, format_stock_event_string
+from utils.finUtil import get_price_fetch_stats, get_company_list, save_stock_event_to_cache, format_stock_event_string_to_table
+from utils.finUtil import create_stock_news_cache, find_cached_stock_events, merge_stock_events, validate_stock_event, store_stock_event
 from llama_index.llms.deepseek import DeepSeek
 from llama_index.core.agent.workflow import AgentWorkflow
 from llama_index.core.workflow import Context
@@ -15,7 +19,12 @@ from llama_index.core.agent.workflow import (
     ToolCall,
     ToolCallResult,
 )
-from utils.cacheUtil import CacheUtil, StockNewsKeyGenerator
+from utils.cacheUtil import CacheUtil
+from utils.httpUtil import close_async_session
+from utils.relevanceUtil import record_judgments
+from utils.traceUtil import start_run, count, AgentEventTracer
+from utils.cassetteUtil import current_cassette
+from utils.credentialUtil import get_credential
 from utils.logUtil import setup_logger
 
 logger = setup_logger("getStockEvent")
@@ -23,15 +32,31 @@ logger = setup_logger("getStockEvent")
 
 MaxPastDays = 30
 
+#pipeline: the agent only finds the events, formatting and caching them are plain function calls
+#agents: formatting and caching are done by EventFormatAgent and CacheEventAgent
+PipelineMode = "pipeline"
+AgentsMode = "agents"
+DefaultMode = PipelineMode
+
+#every run appends its duration and number of LLM responses here, see benchmarks/benchWorkflowModes.py:
+WorkflowTimingFile = 'data/workflowTimings.jsonl'
+
+#the last instruction of the system prompt in each mode:
+NextStepPrompts = {
+    PipelineMode: "Otherwise you should save the events by calling tool, then your task is over.",
+    AgentsMode: "Otherwise you should save the events by calling tool, then hand off control to the EventFormatAgent to format that string.",
+}
+
 def cleanCompanyName(comppanyName: str) -> str:
     pattern = r'\s*(?:-\s*Class\s+[A-Za-z]+|Company|Inc|Corp|Ltd|LLC|\.?)\s*$'
     return re.sub(pattern, '', comppanyName, flags=re.IGNORECASE)
 
 
 def selectCompany() -> Tuple[str, str]:
-    companyList = get_company_list()
+    #index the memory-mapped ticker store once while the prompt is shown, every retry reuses it:
+    companyIndex = BackgroundCompanyIndex(get_company_list())
     while(True):
-        companyInput = CompanyInput(companyList)
+        companyInput = CompanyInput(companyIndex)
         companyOutput = companyInput.run()
 
         if(companyOutput == None):
@@ -50,11 +75,11 @@ def selectPastDays() -> int:
             continue
 
 
-def getSystemPrompt(companyTicker: str, companyName: str, pastDays: int) -> str:
+def getSystemPrompt(companyTicker: str, companyName: str, pastDays: int, mode: str = DefaultMode) -> str:
     with open('prompts/getStockEvent.txt', 'r', encoding='utf-8') as file:
             content: str = file.read()
 
-    return content.format(companyTicker=companyTicker, companyName=companyName, pastDays=pastDays) 
+    return content.format(companyTicker=companyTicker, companyName=companyName, pastDays=pastDays, nextStep=NextStepPrompts[mode])
 
 
 async def save_events(ctx: Context, stockEvents: str) -> str:
@@ -64,12 +89,37 @@ async def save_events(ctx: Context, stockEvents: str) -> str:
     """
     logger.info(f"Saving stock events to context")
 
-    stockEventsDict = json.loads(stockEvents)
+    try:
+        stockEventsDict = json.loads(stockEvents)
+    except json.JSONDecodeError as e:
+        return f"Stock events are not valid JSON ({e}), fix them and call this tool again."
+
+    #let the LLM fix the events, nothing downstream has to cope with a broken format:
+    errors = validate_stock_event(stockEventsDict)
+    if errors:
+        logger.warning(f"Invalid stock events: {errors}")
+        return f"Stock events do not match the JSON format: {'; '.join(errors)}. Fix them and call this tool again."
+
+    current_state = await ctx.get("state")
+
+    #the events are cached under their symbol and window, keep those of the query whatever the LLM wrote:
+    stockEventsDict["stock_symbol"] = current_state["stock_symbol"]
+    stockEventsDict["past_days"] = current_state["past_days"]
+    stockEvents = json.dumps(stockEventsDict)
+
+    #the news the LLM kept or not label the relevance filter for offline training:
+    record_judgments(current_state.get("news_seen", []), stockEventsDict.get("stock_price_events", []), current_state.get("news_audited", []))
+
+    #events of the recent days came from the cache, merge them with the fresh ones of the older days:
+    cachedEvents = current_state.get("cached_events")
+    if(cachedEvents != None):
+        stockEventsDict = merge_stock_events(stockEventsDict, cachedEvents)
+        stockEvents = json.dumps(stockEventsDict)
+
     if(stockEventsDict['stock_total_events'] == 0):
         print(f"Failed to find any news, please check logs for more details.")
         return "No stock events found."
-    
-    current_state = await ctx.get("state")
+
     if "stock_events" not in current_state:
         current_state["stock_events"] = ""
 
@@ -79,30 +129,79 @@ async def save_events(ctx: Context, stockEvents: str) -> str:
     
 
 
-async def myWorkFlow(systemPromt, formatPrompt, cachePrompt, llm, toolList):
+def record_timing(mode: str, companyTicker: str, pastDays: int, seconds: float, llmResponses: int):
+    try:
+        with open(WorkflowTimingFile, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"mode": mode, "ticker": companyTicker, "pastDays": pastDays, "seconds": round(seconds, 3), "llmResponses": llmResponses}) + "\n")
+    except IOError:
+        logger.error(f"Failed to record workflow timing to {WorkflowTimingFile}")
+    return
+
+
+def readPrompt(promptFile: str) -> str:
+    with open(promptFile, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def load_stock_news_cache() -> CacheUtil:
+    return create_stock_news_cache()
+
+
+async def runStockEventWorkflow(companyTicker: str, companyName: str, pastDays: int, llm, stockNewsCache: CacheUtil,
+                                mode: str = DefaultMode, show: bool = True) -> Optional[dict]:
+    """
+    Find the stock price change related events of a company, from the stock news cache or by running the agents.
+
+    Args:
+        stockNewsCache (CacheUtil): The loaded stock news cache, shared by all workflows of the process.
+        mode (str): PipelineMode or AgentsMode.
+        show (bool): Print the events as a table. Agents mode always prints them through EventFormatAgent.
+
+    Returns:
+        The stock event in the JSON format of the prompts, or None if no event was found.
+    """
+    #every run is traced to data/traces.jsonl, summarize the traces with: python -m utils.traceUtil
+    with start_run("stockEvents", ticker=companyTicker, pastDays=pastDays, mode=mode):
+        return await _runStockEventWorkflow(companyTicker, companyName, pastDays, llm, stockNewsCache, mode, show)
+
+
+async def _runStockEventWorkflow(companyTicker: str, companyName: str, pastDays: int, llm, stockNewsCache: CacheUtil,
+                                 mode: str, show: bool) -> Optional[dict]:
     #check if user query hit cache:
-    keyGenerator = StockNewsKeyGenerator()
-    stockNewsCache = CacheUtil(100, 'data/stockNewsCache.json', keyGenerator)
-    await stockNewsCache.load_cache()
-    queryResult = await stockNewsCache.get(companyTicker, pastDays)
-    if(queryResult != None):
+    cachedEvents, coveredDays = await find_cached_stock_events(stockNewsCache, companyTicker, pastDays)
+    if(cachedEvents != None and coveredDays >= pastDays):
         logger.info(f"Found stock news in cache by: {companyTicker}, {pastDays}")
-        format_stock_event_string_to_table(queryResult)
-        return
-
+        count("eventCache.hit")
+        if show:
+            format_stock_event_string_to_table(json.dumps(cachedEvents))
+        return cachedEvents
+
+    initialState = {
+        "stock_events": "",
+        "stock_symbol": companyTicker,
+        "past_days": pastDays
+    }
+    if(cachedEvents != None):
+        #a narrower window is cached today, the agents only look into the days before it:
+        logger.info(f"Found stock news in cache by: {companyTicker}, {coveredDays}, fetching the {pastDays - coveredDays} older days")
+        initialState["cached_events"] = cachedEvents
+        initialState["news_before"] = (datetime.now() - timedelta(days=coveredDays)).strftime("%Y-%m-%d")
+    count("eventCache.partial" if cachedEvents != None else "eventCache.miss")
+
+    startTime = time.perf_counter()
     stock_event_agent = FunctionAgent(
         name="StockEventAgent",
         description="Useful for searching the web for stock price change related news",
-        system_prompt=systemPromt,
+        system_prompt=getSystemPrompt(companyTicker, companyName, pastDays, mode),
         llm=llm,
-        tools=toolList,
-        can_handoff_to=["EventFormatAgent"]
+        tools=ToolList,
+        can_handoff_to=["EventFormatAgent"] if mode == AgentsMode else []
     )
 
     event_format_agent = FunctionAgent(
         name="EventFormatAgent",
         description="Useful for calling a tool to format the stock price change related news into a table",
-        system_prompt=formatPrompt,
+        system_prompt=readPrompt('prompts/formatStockEvent.txt'),
         llm=llm,
         tools=[format_stock_event_string]
     )
@@ -110,24 +209,37 @@ async def myWorkFlow(systemPromt, formatPrompt, cachePrompt, llm, toolList):
     cache_event_agent = FunctionAgent(
         name="CacheEventAgent",
         description="Useful for saving the stock price change related news to a cache file",
-        system_prompt=cachePrompt,
+        system_prompt=readPrompt('prompts/cacheStockEvent.txt'),
         llm=llm,
         tools=[save_stock_event_to_cache]
     )
 
+    agents = [stock_event_agent, event_format_agent, cache_event_agent] if mode == AgentsMode else [stock_event_agent]
     agent_workflow = AgentWorkflow(
-        agents=[stock_event_agent, event_format_agent, cache_event_agent],
+        agents=agents,
         root_agent=stock_event_agent.name,
-        initial_state={
-            "stock_events": ""
-        }
+        initial_state=initialState
     )
 
     handler = agent_workflow.run(user_msg="Show me stock price change related news")
 
-    #To enable debug logging, set logging level to DEBUG in utils/logUtil.py. It's very useful to hunt down bugs:
+    #To enable debug logging, run with LOG_LEVEL=DEBUG or set LogLevel in utils/logUtil.py. It's very useful to hunt down bugs:
+    debug = logger.isEnabledFor(logging.DEBUG)
     current_agent = None
+    llmResponses = 0
+    tracer = AgentEventTracer()
+    cassette = current_cassette()
     async for event in handler.stream_events():
+        tracer.observe(event)
+        if cassette is not None:
+            cassette.observe(event)
+        if isinstance(event, AgentOutput):
+            llmResponses += 1
+
+        #skip building the debug messages altogether when they would be dropped:
+        if not debug:
+            continue
+
         if (
             hasattr(event, "current_agent_name")
             and event.current_agent_name != current_agent
@@ -145,29 +257,50 @@ async def myWorkFlow(systemPromt, formatPrompt, cachePrompt, llm, toolList):
             logger.debug(f"🔧 Tool Result ({event.tool_name}) Arguments: ({event.tool_kwargs}) Output: {event.tool_output}")
         elif isinstance(event, ToolCall):
             logger.debug(f"🔨 Calling Tool: ({event.tool_name}) With arguments: {event.tool_kwargs}")
-    return
 
+    finalState = await handler.ctx.get("state")
+    stockEvents = finalState.get("stock_events", "")
+    if(mode == PipelineMode and stockEvents != ""):
+        #save_events only stores events that passed the schema check:
+        if show:
+            format_stock_event_string_to_table(stockEvents)
+        await store_stock_event(stockNewsCache, {**json.loads(stockEvents), "stock_symbol": companyTicker, "past_days": pastDays})
 
+    #no related news in the older days, the agents quit before saving, the cached events are the answer:
+    if(cachedEvents != None and stockEvents == ""):
+        stockEvents = json.dumps({**cachedEvents, "past_days": pastDays})
+        if show:
+            format_stock_event_string_to_table(stockEvents)
 
+    elapsed = time.perf_counter() - startTime
+    logger.info(f"Workflow of {companyTicker} in {mode} mode took {elapsed:.2f}s with {llmResponses} LLM responses")
+    record_timing(mode, companyTicker, pastDays, elapsed, llmResponses)
+    return json.loads(stockEvents) if stockEvents != "" else None
 
 
-if __name__ == "__main__":
-    companyTicker, companyName = selectCompany()
-    pastDays = selectPastDays()
+async def myWorkFlow(companyTicker: str, companyName: str, pastDays: int, llm, mode: str = DefaultMode):
+    stockNewsCache = load_stock_news_cache()
+    await stockNewsCache.load_cache()
+    await runStockEventWorkflow(companyTicker, companyName, pastDays, llm, stockNewsCache, mode)
+
+    logger.info(f"Price fetch stats: {get_price_fetch_stats()}")
+    logger.info(f"Stock event cache stats: {stockNewsCache.get_stats()}")
+    await close_async_session()
+    return
 
-    with open('credentials/deepseek.txt', 'r') as f:
-        deepseekKey = f.read().strip()
-    llm = DeepSeek(model="deepseek-chat", api_key=deepseekKey)
 
-    toolList = [get_past_news, get_stock_prices, find_workdays, save_events]
+ToolList = [get_past_news, get_event_prices, save_events]
 
-    systemPromt = getSystemPrompt(companyTicker, companyName, pastDays)
 
-    with open('prompts/formatStockEvent.txt', 'r', encoding='utf-8') as file:
-        formatPrompt: str = file.read()
+# Usage: python -m apps.getStockEvent [pipeline|agents]
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else DefaultMode
+    if mode not in NextStepPrompts:
+        sys.exit(f"Unknown mode {mode}, use {PipelineMode} or {AgentsMode}")
 
-    with open('prompts/cacheStockEvent.txt', 'r', encoding='utf-8') as file:
-        cachePrompt: str = file.read()
+    companyTicker, companyName = selectCompany()
+    pastDays = selectPastDays()
 
+    llm = DeepSeek(model="deepseek-chat", api_key=get_credential('deepseek'))
 
-    asyncio.run(myWorkFlow(systemPromt, formatPrompt, cachePrompt, llm, toolList))
\ No newline at end of file
+    asyncio.run(myWorkFlow(companyTicker, companyName, pastDays, llm, mode))
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import asyncio
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+from llama_index.llms.deepseek import DeepSeek
+from apps.getStockEvent import MaxPastDays, PipelineMode, cleanCompanyName, load_stock_news_cache, runStockEventWorkflow
+from utils.finUtil import get_company_list, get_price_fetch_stats
+from utils.httpUtil import close_async_session
+from utils.rateUtil import requestPriority, Background
+from utils.credentialUtil import get_credential
+from utils.logUtil import setup_logger
+
+logger = setup_logger("getStockEventBatch")
+
+
+DefaultPastDays = 7
+MaxConcurrentWorkflows = 4
+
+
+def read_watchlist(watchlistFile: str, defaultDays: int = DefaultPastDays) -> List[Tuple[str, int]]:
+    """
+    Read the watchlist: one ticker per line, optionally followed by its past days, '#' starts a comment.
+
+    Returns:
+        A list of (ticker, pastDays) in file order, without duplicates.
+    """
+    watchlist = []
+    with open(watchlistFile, 'r', encoding='utf-8') as f:
+        for lineNumber, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if len(fields) == 0:
+                continue
+            if len(fields) > 2 or (len(fields) == 2 and not fields[1].isdigit()):
+                logger.warning(f"Skip line {lineNumber} of {watchlistFile}, expected a ticker and optional past days: {line.strip()}")
+                continue
+            pastDays = int(fields[1]) if len(fields) > 1 else defaultDays
+            if not 0 < pastDays <= MaxPastDays:
+                logger.warning(f"Skip {fields[0]}: past days must be from 1 to {MaxPastDays}")
+                continue
+            entry = (fields[0].upper(), pastDays)
+            if entry not in watchlist:
+                watchlist.append(entry)
+    return watchlist
+
+
+def read_unfinished_run(resultFile: str, watchlist: str) -> Tuple[Optional[str], Set[Tuple[str, int]]]:
+    """
+    The last run of the watchlist in the result file if it did not finish, and the (ticker, pastDays) it already finished,
+    so a restart resumes it, also after midnight. Returns (None, empty set) if the last run finished or there is none.
+    """
+    runId = None
+    finished = set()
+    if not os.path.exists(resultFile):
+        return (runId, finished)
+
+    with open(resultFile, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                #the last line may be torn by a crash, that ticker is run again:
+                continue
+            status = record.get("status")
+            if status == "started" and record.get("watchlist") == watchlist:
+                runId = record["run"]
+                finished = set()
+            elif runId is not None and record.get("run") == runId:
+                if status == "finished":
+                    runId = None
+                    finished = set()
+                elif status in ("ok", "empty"):
+                    finished.add((record["ticker"], record["pastDays"]))
+    return (runId, finished)
+
+
+def end_torn_line(resultFile: str):
+    #a crash may leave the last line without its end, end it so the next record starts on its own line:
+    if not os.path.exists(resultFile) or os.path.getsize(resultFile) == 0:
+        return
+    with open(resultFile, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    return
+
+
+def write_result(resultFile: str, record: dict):
+    with open(resultFile, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return
+
+
+async def run_batch(watchlistFile: str, resultFile: str, llm, concurrency: int = MaxConcurrentWorkflows):
+    """
+    Run the stock event workflow for every ticker of the watchlist, at most 'concurrency' at a time,
+    appending one JSON line per ticker to 'resultFile'.
+
+    A run is marked started and, once every ticker succeeded, finished in the result file. Restarting the batch
+    on the same watchlist resumes its unfinished run and skips the tickers it finished, a finished run starts over.
+    All workflows share the LLM client, the stock news cache and the price store.
+    """
+    #batch requests give way to interactive ones in the rate limiters:
+    requestPriority.set(Background)
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    watchlistPath = os.path.abspath(watchlistFile)
+    watchlist = read_watchlist(watchlistFile)
+    runId, finished = read_unfinished_run(resultFile, watchlistPath)
+    end_torn_line(resultFile)
+    if runId is None:
+        runId = datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+        write_result(resultFile, {"run": runId, "watchlist": watchlistPath, "status": "started", "date": today})
+    pending = [entry for entry in watchlist if entry not in finished]
+    logger.info(f"Batch run {runId} of {len(watchlist)} tickers, {len(watchlist) - len(pending)} already finished")
+
+    companies = get_company_list()
+    stockNewsCache = load_stock_news_cache()
+    await stockNewsCache.load_cache()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(ticker: str, pastDays: int):
+        record = {"run": runId, "ticker": ticker, "pastDays": pastDays, "date": datetime.now().strftime("%Y-%m-%d")}
+        companyName = companies.find(ticker)
+        if companyName is None:
+            logger.error(f"Unknown ticker {ticker}")
+            write_result(resultFile, {**record, "status": "error", "error": "unknown ticker"})
+            return False
+
+        async with semaphore:
+            try:
+                stockEvent = await runStockEventWorkflow(ticker, cleanCompanyName(companyName), pastDays, llm, stockNewsCache, PipelineMode, show=False)
+            except Exception as e:
+                logger.error(f"Workflow of {ticker} failed: {e}")
+                write_result(resultFile, {**record, "status": "error", "error": str(e)})
+                return False
+
+        if stockEvent is None:
+            write_result(resultFile, {**record, "status": "empty"})
+        else:
+            write_result(resultFile, {**record, "status": "ok", "events": stockEvent["stock_price_events"]})
+        print(f"{ticker}: {0 if stockEvent is None else len(stockEvent['stock_price_events'])} events")
+        return True
+
+    results = await asyncio.gather(*(run_one(ticker, pastDays) for ticker, pastDays in pending))
+    #a run with failed tickers stays unfinished, so a restart retries them:
+    if all(results):
+        write_result(resultFile, {"run": runId, "status": "finished"})
+
+    logger.info(f"Price fetch stats: {get_price_fetch_stats()}")
+    await close_async_session()
+    return
+
+
+# Usage: python -m apps.getStockEventBatch watchlist.txt results.jsonl [concurrency]
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python -m apps.getStockEventBatch watchlist.txt results.jsonl [concurrency]")
+
+    llm = DeepSeek(model="deepseek-chat", api_key=get_credential('deepseek'))
+
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else MaxConcurrentWorkflows
+    asyncio.run(run_batch(sys.argv[1], sys.argv[2], llm, concurrency))
@@ -1,22 +1,100 @@
-from utils.finUtil import get_company_list, get_stock_quote
-from utils.companyCompleter import CompanyInput
+import sys
+import time
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+from utils.finUtil import get_company_list, get_stock_quote, get_quotes, get_quote_stats
+from utils.companyCompleter import CompanyInput, BackgroundCompanyIndex
+from utils.rateUtil import scheduler, Finnhub
 
 
-if __name__ == "__main__":
-    companyTicker = ""
-    companyName = ""
+#seconds between refreshes of the watch mode, stretched when the symbols would not fit in the Finnhub budget:
+WatchInterval = 5.0
+#share of the Finnhub requests per minute the watch mode may use, the rest is left to other quotes:
+WatchBudgetShare = 0.8
+
+
+def refresh_interval(symbolCount: int) -> float:
+    perMinute = scheduler.limiter(Finnhub).per_minute
+    return max(WatchInterval, symbolCount * 60 / (perMinute * WatchBudgetShare))
+
+
+def format_quotes(quotes: Dict[str, Optional[dict]], lastQuotes: Dict[str, dict]) -> str:
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = ["Symbol", "Price", "Change", "Change %", "High", "Low", "Quote time"]
+    table.align = "r"
+    table.align["Symbol"] = "l"
+    for symbol, quote in quotes.items():
+        #keep showing the last good quote of a symbol whose refresh failed:
+        stale = quote == None
+        quote = lastQuotes.get(symbol) if stale else quote
+        if quote == None:
+            table.add_row([symbol, "-", "-", "-", "-", "-", "-"])
+            continue
+        quoteTime = datetime.fromtimestamp(quote["t"]).strftime("%H:%M:%S") if quote.get("t") else "-"
+        table.add_row([symbol, f"{quote['c']:.2f}", f"{quote['d'] or 0:+.2f}", f"{quote['dp'] or 0:+.2f}%",
+                       f"{quote['h']:.2f}", f"{quote['l']:.2f}", f"{quoteTime}{' (stale)' if stale else ''}"])
+    return table.get_string()
+
+
+async def watch(symbols: List[str]):
+    interval = refresh_interval(len(symbols))
+    lastQuotes: Dict[str, dict] = {}
+    printedLines = 0
+    while(True):
+        started = time.monotonic()
+        #a quote fetched by the last refresh is almost one interval old, only reuse the ones other callers got since:
+        quotes = await get_quotes(symbols, max_age=interval / 2)
+        lastQuotes.update({symbol: quote for symbol, quote in quotes.items() if quote != None})
+
+        stats = get_quote_stats()
+        screen = format_quotes(quotes, lastQuotes)
+        screen += f"\nRefreshed at {datetime.now().strftime('%H:%M:%S')} every {interval:.0f}s, "
+        screen += f"{stats['misses']} quote requests, {stats['hits']} served from cache. Ctrl+C to stop."
+
+        #move the cursor back to the top of the last table and draw over it, instead of scrolling:
+        if printedLines > 0:
+            sys.stdout.write(f"\x1b[{printedLines}F\x1b[J")
+        sys.stdout.write(screen + "\n")
+        sys.stdout.flush()
+        printedLines = screen.count("\n") + 1
+
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
 
-    companyList = get_company_list()
+def select_company():
+    companyIndex = BackgroundCompanyIndex(get_company_list())
     while(True):
-        companyInput = CompanyInput(companyList)
+        companyInput = CompanyInput(companyIndex)
         companyOutput = companyInput.run()
 
         if(companyOutput == None):
             continue
 
-        companyTicker = companyOutput[0]
-        companyName = companyOutput[1]
-        break
+        return (companyOutput[0], companyOutput[1])
+
+
+# Usage: python -m apps.getStockPrice
+#        python -m apps.getStockPrice watch AAPL MSFT NVDA ...
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        companies = get_company_list()
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in sys.argv[2:]))
+        unknown = [symbol for symbol in symbols if companies.find(symbol) == None]
+        if unknown:
+            print(f"Unknown tickers skipped: {', '.join(unknown)}")
+        symbols = [symbol for symbol in symbols if symbol not in unknown]
+        if not symbols:
+            sys.exit("Usage: python -m apps.getStockPrice watch SYMBOL [SYMBOL ...]")
+
+        try:
+            asyncio.run(watch(symbols))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
+    companyTicker, companyName = select_company()
     stockPrice = get_stock_quote(companyTicker)
     print(f"Current stock price for {companyTicker} ({companyName}): {stockPrice}$")
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+from llama_index.llms.deepseek import DeepSeek
+from apps.getStockEvent import DefaultMode, NextStepPrompts, selectCompany, selectPastDays, runStockEventWorkflow, load_stock_news_cache
+from utils.cassetteUtil import Cassette, use_cassette, replay_llm
+from utils.httpUtil import close_async_session
+from utils.rateUtil import scheduler, AlphaVantage, NewsApi, Finnhub
+from utils.credentialUtil import CredentialFolder, get_credential
+from utils.logUtil import setup_logger
+
+logger = setup_logger("stockEventCassette")
+
+#a cassette holds the API keys of no provider, replays read these instead:
+ReplayCredentials = ("alpha.vantage", "newsapi", "finnhub", "deepseek")
+
+
+@contextmanager
+def fresh_workdir(replaying: bool) -> Iterator[str]:
+    """
+    Run in an empty temporary folder holding only the prompts, so no cache answers a request the cassette should hold,
+    and neither recording nor replaying touches the caches in data/.
+    """
+    repoDir = os.getcwd()
+    credentialDir = os.path.abspath(CredentialFolder)
+    with tempfile.TemporaryDirectory(prefix="stockEventCassette") as workDir:
+        shutil.copytree("prompts", os.path.join(workDir, "prompts"))
+        os.makedirs(os.path.join(workDir, "data"))
+        if replaying:
+            os.makedirs(os.path.join(workDir, CredentialFolder))
+            for name in ReplayCredentials:
+                with open(os.path.join(workDir, CredentialFolder, f"{name}.txt"), "w") as f:
+                    f.write("replay")
+        else:
+            os.symlink(credentialDir, os.path.join(workDir, CredentialFolder))
+
+        os.chdir(workDir)
+        try:
+            yield workDir
+        finally:
+            os.chdir(repoDir)
+
+
+async def run_cassette(cassette: Cassette, llm) -> dict:
+    stockNewsCache = load_stock_news_cache()
+    await stockNewsCache.load_cache()
+
+    start = time.perf_counter()
+    with use_cassette(cassette):
+        stockEvent = await runStockEventWorkflow(cassette.attrs["ticker"], cassette.attrs["company"], cassette.attrs["pastDays"],
+                                                 llm, stockNewsCache, cassette.attrs["mode"], show=not cassette.replaying)
+    seconds = time.perf_counter() - start
+    await close_async_session()
+    return {"seconds": round(seconds, 3), "events": stockEvent["stock_total_events"] if stockEvent else 0}
+
+
+def record(cassetteFile: str, mode: str):
+    companyTicker, companyName = selectCompany()
+    pastDays = selectPastDays()
+    llm = DeepSeek(model="deepseek-chat", api_key=get_credential('deepseek'))
+
+    cassette = Cassette(os.path.abspath(cassetteFile))
+    cassette.attrs = {"ticker": companyTicker, "company": companyName, "pastDays": pastDays, "mode": mode, "recordedAt": time.time()}
+
+    #the recorded requests still count against today's budgets:
+    scheduler.usage.usage_file = os.path.abspath(scheduler.usage.usage_file)
+    with fresh_workdir(replaying=False):
+        result = asyncio.run(run_cassette(cassette, llm))
+    print(f"Recorded {len(cassette.http)} HTTP exchanges and {len(cassette.llm)} LLM turns in {result['seconds']}s to {cassetteFile}")
+    return
+
+
+def replay(cassetteFile: str, timeScale: float):
+    cassette = Cassette.load(cassetteFile, timeScale)
+
+    #nothing goes to the providers, their budgets would only slow the replay down:
+    for provider in (AlphaVantage, NewsApi, Finnhub):
+        scheduler.set_budget(provider, 100000, None)
+    with fresh_workdir(replaying=True):
+        result = asyncio.run(run_cassette(cassette, replay_llm(cassette)))
+
+    print(json.dumps({"cassette": cassetteFile, "timeScale": timeScale, **cassette.attrs, **result, **cassette.stats}))
+    return
+
+
+# Usage: python -m apps.stockEventCassette record <cassette file> [pipeline|agents]
+#        python -m apps.stockEventCassette replay <cassette file> [time scale, 1 replays in recorded time, 0 without waiting]
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "replay"):
+        sys.exit("Usage: python -m apps.stockEventCassette record|replay <cassette file> [mode | time scale]")
+
+    if sys.argv[1] == "record":
+        mode = sys.argv[3] if len(sys.argv) > 3 else DefaultMode
+        if mode not in NextStepPrompts:
+            sys.exit(f"Unknown mode {mode}")
+        record(sys.argv[2], mode)
+    else:
+        replay(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 1.0)
@@ -0,0 +1,144 @@
+import sys
+import json
+import asyncio
+from typing import Optional
+from aiohttp import web
+from llama_index.llms.deepseek import DeepSeek
+from apps.getStockEvent import MaxPastDays, PipelineMode, cleanCompanyName, load_stock_news_cache, runStockEventWorkflow
+from utils.companyCompleter import CompanyIndex
+from utils.finUtil import get_company_list, get_stock_quote, get_price_fetch_stats, get_quote_stats, load_price_store
+from utils.newsUtil import load_news_shard_cache
+from utils.flightUtil import SingleFlight
+from utils.rateUtil import Throttled, RateLimitExceeded
+from utils.httpUtil import close_async_session
+from utils.credentialUtil import get_credential
+from utils.logUtil import setup_logger
+
+logger = setup_logger("stockService")
+
+
+ServiceHost = '127.0.0.1'
+ServicePort = 8765
+MaxConcurrentWorkflows = 4
+
+
+def json_error(errorClass, message: str) -> web.HTTPException:
+    #error responses carry a JSON body like every other response of the service:
+    return errorClass(text=json.dumps({"error": message}), content_type="application/json")
+
+
+class StockService:
+    """
+    Keeps the LLM client, the ticker store, the caches and the price store warm between queries,
+    and answers them over a local HTTP API on one event loop:
+
+        GET /events?ticker=AAPL&days=7   stock price change related events, in the JSON format of the prompts
+        GET /quote?ticker=AAPL           current stock price
+        GET /companies?q=apple           companies matching a ticker or name prefix
+        GET /stats                       price fetch, quote cache, event query and cache hit counters
+    """
+    def __init__(self, llm, concurrency: int = MaxConcurrentWorkflows):
+        self.llm = llm
+        self.companies = None
+        self.companyIndex: Optional[CompanyIndex] = None
+        self.stockNewsCache = None
+
+        #identical event queries arriving together share one workflow:
+        self.eventFlight = SingleFlight("stockEvents")
+        self._workflows = asyncio.Semaphore(concurrency)
+        return
+
+
+    async def start(self, app: web.Application):
+        self.companies = get_company_list()
+        self.companyIndex = CompanyIndex(self.companies)
+        self.stockNewsCache = load_stock_news_cache()
+        await self.stockNewsCache.load_cache()
+        await load_price_store()
+        await load_news_shard_cache()
+        logger.info(f"Stock service ready with {len(self.companies)} tickers")
+        return
+
+
+    async def stop(self, app: web.Application):
+        await close_async_session()
+        self.companies.close()
+        return
+
+
+    def _company(self, request: web.Request) -> str:
+        ticker = request.query.get("ticker", "").upper()
+        if self.companies.find(ticker) is None:
+            raise json_error(web.HTTPNotFound, f"Unknown ticker {ticker}")
+        return ticker
+
+
+    async def _run_events(self, ticker: str, pastDays: int) -> Optional[dict]:
+        async with self._workflows:
+            companyName = cleanCompanyName(self.companies.find(ticker))
+            return await runStockEventWorkflow(ticker, companyName, pastDays, self.llm, self.stockNewsCache, PipelineMode, show=False)
+
+
+    async def events(self, request: web.Request) -> web.Response:
+        ticker = self._company(request)
+        days = request.query.get("days", "")
+        if not days.isdigit() or not 0 < int(days) <= MaxPastDays:
+            raise json_error(web.HTTPBadRequest, f"days must be from 1 to {MaxPastDays}")
+
+        stockEvent = await self.eventFlight.do((ticker, int(days)), self._run_events, ticker, int(days))
+        if stockEvent is None:
+            stockEvent = {"stock_symbol": ticker, "past_days": int(days), "stock_total_events": 0, "stock_price_events": []}
+        return web.json_response(stockEvent)
+
+
+    async def quote(self, request: web.Request) -> web.Response:
+        import finnhub
+        import requests
+
+        ticker = self._company(request)
+        #the finnhub client is synchronous, keep it off the event loop:
+        try:
+            price = await asyncio.to_thread(get_stock_quote, ticker)
+        except (Throttled, RateLimitExceeded) as e:
+            raise json_error(web.HTTPServiceUnavailable, str(e))
+        except (finnhub.FinnhubAPIException, finnhub.FinnhubRequestException, requests.exceptions.RequestException) as e:
+            logger.warning(f"Failed to get quote of {ticker}: {e}")
+            raise json_error(web.HTTPBadGateway, f"Quote provider failed: {e}")
+        return web.json_response({"ticker": ticker, "price": price})
+
+
+    async def search(self, request: web.Request) -> web.Response:
+        matches = self.companyIndex.search(request.query.get("q", ""))
+        return web.json_response([{"ticker": ticker, "name": name} for ticker, name in matches])
+
+
+    async def stats(self, request: web.Request) -> web.Response:
+        shardCache = await load_news_shard_cache()
+        return web.json_response({"priceFetch": get_price_fetch_stats(), "quotes": get_quote_stats(), "events": dict(self.eventFlight.stats),
+                                  "eventCache": self.stockNewsCache.get_stats(), "newsShards": shardCache.get_stats()})
+
+
+def create_app(llm, concurrency: int = MaxConcurrentWorkflows) -> web.Application:
+    service = StockService(llm, concurrency)
+    app = web.Application()
+    app.add_routes([
+        web.get("/events", service.events),
+        web.get("/quote", service.quote),
+        web.get("/companies", service.search),
+        web.get("/stats", service.stats),
+    ])
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    return app
+
+
+# Usage: python -m apps.stockService [port | unix socket path]
+if __name__ == "__main__":
+    llm = DeepSeek(model="deepseek-chat", api_key=get_credential('deepseek'))
+
+    app = create_app(llm)
+    address = sys.argv[1] if len(sys.argv) > 1 else str(ServicePort)
+    if address.isdigit():
+        web.run_app(app, host=ServiceHost, port=int(address))
+    else:
+        web.run_app(app, path=address)
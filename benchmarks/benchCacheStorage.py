@@ -0,0 +1,47 @@
+"""
+Benchmark of CacheUtil.save_to_file: the json storage rewrites the whole cache on every save,
+the log storage appends only the entries changed since the last save.
+
+Usage: python -m benchmarks.benchCacheStorage
+"""
+import asyncio
+import os
+import tempfile
+import time
+from utils.cacheUtil import CacheUtil, StockPriceKeyGenerator
+
+
+CacheSizes = [1000, 10000, 100000]
+DeltaSizes = [10, 100, 1000]
+Rounds = 5
+
+
+async def measure_save(storage: str, cacheSize: int, deltaSize: int, folder: str) -> float:
+    cacheFile = os.path.join(folder, f"cache.{storage}.{cacheSize}.{deltaSize}")
+    cache = CacheUtil(cacheSize + deltaSize * Rounds, cacheFile, StockPriceKeyGenerator(), storage=storage)
+    for i in range(cacheSize):
+        await cache.add(100.0 + i, "SYM", f"base-{i}")
+    await cache.save_to_file()
+
+    elapsed = 0.0
+    for r in range(Rounds):
+        for i in range(deltaSize):
+            await cache.add(200.0 + i, "SYM", f"delta-{r}-{i}")
+        start = time.perf_counter()
+        await cache.save_to_file()
+        elapsed += time.perf_counter() - start
+    return elapsed / Rounds * 1000
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"{'cache size':>10}{'delta':>8}{'json ms':>10}{'log ms':>10}")
+        for cacheSize in CacheSizes:
+            for deltaSize in DeltaSizes:
+                jsonMs = await measure_save("json", cacheSize, deltaSize, folder)
+                logMs = await measure_save("log", cacheSize, deltaSize, folder)
+                print(f"{cacheSize:>10}{deltaSize:>8}{jsonMs:>10.2f}{logMs:>10.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
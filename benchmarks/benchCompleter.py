@@ -0,0 +1,85 @@
+"""
+Benchmark of company completion: the startup of the ticker prompt, from opening the company list
+to the prompt and to the first completion, and the previous linear scan against CompanyIndex per query.
+
+Usage: python -m benchmarks.benchCompleter
+"""
+import os
+import time
+import tempfile
+from utils.companyCompleter import CompanyIndex, BackgroundCompanyIndex
+from utils.tickerStore import TickerStore, parse_listing, write_ticker_store
+
+
+Queries = ["a", "aa", "aapl", "nv", "tesla", "micro", "bank of", "semiconductor", "etf", "zzzz"]
+Rounds = 50
+
+
+def load_companies(path: str = "data/tickers.csv") -> list:
+    companyList = []
+    with open(path, "r") as f:
+        next(f) #skip the first line
+        for line in f:
+            companyList.append(line.strip().split(","))
+    return companyList
+
+
+def linear_scan(companies, text):
+    #the completion loop used before the index was added
+    text = text.lower()
+    results = []
+    for ticker, name in companies:
+        if text in ticker.lower() or text in name.lower():
+            results.append(f"{ticker} - {name}")
+    return results
+
+
+def measure(func, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(Rounds):
+        func(*args)
+    return (time.perf_counter() - start) / Rounds * 1000
+
+
+def measure_startup(storeFile: str, csvFile: str = "data/tickers.csv"):
+    #the prompt can show once the company list is open and, without the background build, indexed:
+    print(f"{'startup':<36}{'prompt ms':>10}{'first search ms':>17}")
+
+    start = time.perf_counter()
+    companies = load_companies(csvFile)
+    promptMs = (time.perf_counter() - start) * 1000
+    linear_scan(companies, Queries[0])
+    print(f"{'csv parse, linear scan':<36}{promptMs:>10.1f}{(time.perf_counter() - start) * 1000:>17.1f}")
+
+    start = time.perf_counter()
+    index = CompanyIndex(TickerStore(storeFile))
+    promptMs = (time.perf_counter() - start) * 1000
+    index.search(Queries[0])
+    print(f"{'ticker store, index up front':<36}{promptMs:>10.1f}{(time.perf_counter() - start) * 1000:>17.1f}")
+
+    start = time.perf_counter()
+    index = BackgroundCompanyIndex(TickerStore(storeFile))
+    promptMs = (time.perf_counter() - start) * 1000
+    index.search(Queries[0])
+    print(f"{'ticker store, index in background':<36}{promptMs:>10.1f}{(time.perf_counter() - start) * 1000:>17.1f}\n")
+    return
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as folder:
+        storeFile = os.path.join(folder, "tickers.bin")
+        with open("data/tickers.csv", "r") as f:
+            write_ticker_store(storeFile, parse_listing(f.read()))
+        measure_startup(storeFile)
+
+    companies = load_companies()
+
+    start = time.perf_counter()
+    index = CompanyIndex(companies)
+    print(f"Indexed {len(companies)} companies in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    print(f"{'query':<16}{'scan ms':>10}{'index ms':>10}{'speedup':>10}")
+    for query in Queries:
+        scanMs = measure(linear_scan, companies, query)
+        indexMs = measure(index.search, query)
+        print(f"{query:<16}{scanMs:>10.3f}{indexMs:>10.3f}{scanMs / indexMs:>9.0f}x")
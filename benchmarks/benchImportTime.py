@@ -0,0 +1,74 @@
+"""
+Import-time budget of the entry points: imports each one in a fresh interpreter with python -X importtime,
+reports its cumulative import time and its heaviest imports, and exits with status 1 if any entry point is over budget.
+
+Usage: python -m benchmarks.benchImportTime [rounds]
+"""
+import subprocess
+import sys
+from typing import List, Tuple
+
+
+#entry point module: budget in seconds, about 1.2 times the measured import time, so a regression shows:
+Budgets = {
+    "utils.finUtil": 0.22,
+    "utils.newsUtil": 0.11,
+    "apps.getStockPrice": 0.34,
+    "utils.agentTools": 2.6,
+    "apps.getStockEvent": 3.9,
+    "apps.stockService": 4.4,
+}
+Rounds = 3
+TopImports = 5
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """
+    Import 'module' in a new interpreter.
+
+    Returns:
+        A tuple of its cumulative import time in seconds, and (cumulative seconds, module) of its direct and nested imports.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}: {result.stderr.strip().splitlines()[-1]}")
+
+    total = 0.0
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        seconds = int(cumulative) / 1e6
+        if name.strip() == module:
+            total = seconds
+        else:
+            imports.append((seconds, name.rstrip()))
+    return (total, imports)
+
+
+def main() -> int:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else Rounds
+    overBudget = []
+    for module, budget in Budgets.items():
+        #the fastest round is the one least disturbed by the rest of the machine:
+        measurements = [measure_import(module) for _ in range(rounds)]
+        total, imports = min(measurements, key=lambda m: m[0])
+        status = "ok" if total <= budget else "OVER BUDGET"
+        if total > budget:
+            overBudget.append(module)
+
+        print(f"{module}: {total:.3f}s of {budget:.2f}s budget, {status}")
+        #only the top-level imports of the entry point, nested ones are part of their cumulative time:
+        direct = [(seconds, name.strip()) for seconds, name in imports if name.startswith("   ") and not name.startswith("    ")]
+        for seconds, name in sorted(direct, reverse=True)[:TopImports]:
+            print(f"    {seconds:.3f}s  {name}")
+
+    if overBudget:
+        print(f"Over budget: {', '.join(overBudget)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""
+Offline benchmark of the stock event paths: runs get_stock_quote, get_past_news, get_stock_prices and myWorkFlow
+against local fixture servers standing in for Alpha Vantage, NewsAPI and Finnhub, with a scripted LLM standing in for DeepSeek.
+Needs no network and no API keys, everything it writes goes to a temporary folder.
+
+Each stage reports its wall time, the HTTP requests per provider and the cache hit rates, workflow stages also
+their critical path (LLM, tools, HTTP in tools). The results are printed as JSON, and appended as one line to the
+results file if given, so runs of different commits can be compared.
+
+Usage: python -m benchmarks.benchOffline [llm latency seconds] [results file]
+"""
+import os
+import io
+import re
+import ast
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+import subprocess
+import zlib
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+
+RepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#seconds the scripted LLM thinks before each response, and the fixture servers before each answer:
+LlmLatency = 0.5
+HttpLatency = 0.02
+
+ToolTicker, ToolCompany = "TSM", "Taiwan Semiconductor Manufacturing"
+WorkflowTicker, WorkflowCompany = "NVDA", "NVIDIA"
+QuoteTickers = ["AAPL", "MSFT", "NVDA", "TSM", "AMZN"]
+PastDays = 7
+
+#NewsAPI fixture: articles per day, enough for a few pages per query:
+ArticlesPerDay = 30
+PriceHistoryDays = 140
+
+NewsTemplates = [
+    "{company} shares jumped after quarterly earnings beat analyst estimates ({n})",
+    "{company} stock fell as guidance for the next quarter disappointed investors ({n})",
+    "Analysts upgraded {company} and raised the price target on strong revenue ({n})",
+    "{company} opens a new office and hires engineers in the region ({n})",
+]
+
+
+def _close_price(symbol: str, day: date) -> float:
+    #deterministic price walk per symbol:
+    base = 50 + zlib.crc32(symbol.encode()) % 400
+    return round(base + (day.toordinal() % 37) * 0.75 - (day.toordinal() % 11) * 0.5, 2)
+
+
+class FixtureServers:
+    """
+    One local HTTP server answering the requests of the three providers, in a thread with its own event loop,
+    so it does not compete with the benchmarked code for its loop:
+
+        GET /query?function=TIME_SERIES_DAILY&symbol=   Alpha Vantage daily series
+        GET /v2/everything?q=&from=&to=&page=&pageSize=  NewsAPI search, newest first
+        GET /api/v1/quote?symbol=                        Finnhub quote
+    """
+    def __init__(self, latency: float = HttpLatency):
+        self.latency = latency
+        self.requests: Dict[str, int] = {"alphavantage": 0, "newsapi": 0, "finnhub": 0}
+        self.baseUrl = ""
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="fixtureServers", daemon=True)
+        return
+
+
+    def start(self) -> str:
+        self._thread.start()
+        self._ready.wait()
+        return self.baseUrl
+
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        return
+
+
+    def _serve(self):
+        from aiohttp import web
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.add_routes([
+            web.get("/query", self._alpha_vantage),
+            web.get("/v2/everything", self._news),
+            #the finnhub client joins its paths with an extra slash:
+            web.get("/api/v1/{slash:/?}quote", self._quote),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.baseUrl = f"http://127.0.0.1:{port}"
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+        return
+
+
+    async def _answer(self, provider: str, body: Any):
+        from aiohttp import web
+
+        self.requests[provider] += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(body)
+
+
+    async def _alpha_vantage(self, request):
+        symbol = request.query.get("symbol", "")
+        today = date.today()
+        series = {}
+        for offset in range(PriceHistoryDays):
+            day = today - timedelta(days=offset)
+            if day.weekday() < 5:
+                series[str(day)] = {"4. close": f"{_close_price(symbol, day):.4f}"}
+        return await self._answer("alphavantage", {"Meta Data": {"2. Symbol": symbol}, "Time Series (Daily)": series})
+
+
+    async def _news(self, request):
+        company = request.query.get("q", "").split("(")[-1].rstrip(")")
+        start = datetime.strptime(request.query["from"][:10], "%Y-%m-%d").date()
+        end = datetime.strptime(request.query["to"][:10], "%Y-%m-%d").date()
+        page = int(request.query.get("page", 1))
+        pageSize = int(request.query.get("pageSize", 100))
+
+        articles = []
+        day = end
+        while day >= start:
+            for n in range(ArticlesPerDay):
+                description = NewsTemplates[n % len(NewsTemplates)].format(company=company, n=f"{day} #{n}")
+                articles.append({"publishedAt": f"{day}T{23 - n % 24:02d}:00:00Z", "description": description,
+                                 "url": f"https://news.example.com/{company}/{day}/{n}"})
+            day -= timedelta(days=1)
+        pageArticles = articles[(page - 1) * pageSize:page * pageSize]
+        return await self._answer("newsapi", {"status": "ok", "totalResults": len(articles), "articles": pageArticles})
+
+
+    async def _quote(self, request):
+        price = _close_price(request.query.get("symbol", ""), date.today())
+        return await self._answer("finnhub", {"c": price, "d": 0.5, "dp": 0.4, "h": price + 1, "l": price - 1, "o": price, "pc": price - 0.5, "t": int(time.time())})
+
+
+def create_scripted_llm(latency: float = LlmLatency):
+    """
+    A function calling LLM following the script of the stock event prompt, with the same tool calls on every run:
+    get_past_news, then get_event_prices for the dates of the news, then save_events with one event per date, then done.
+    """
+    from llama_index.core.llms import ChatMessage, ChatResponse, MessageRole
+    from llama_index.core.llms.mock import MockFunctionCallingLLM
+    from llama_index.core.tools import ToolSelection
+
+    def tool_call(step: int, name: str, **kwargs) -> ChatMessage:
+        return ChatMessage(role=MessageRole.ASSISTANT, content="",
+                           additional_kwargs={"tool_calls": [ToolSelection(tool_id=f"call-{step}-{name}", tool_name=name, tool_kwargs=kwargs)]})
+
+    def next_message(messages) -> ChatMessage:
+        systemPrompt = "\n".join(str(m.content) for m in messages if m.role == MessageRole.SYSTEM)
+        ticker = re.search(r"company stock ticker name: (.+)", systemPrompt).group(1).strip()
+        company = re.search(r"company name: (.+)", systemPrompt).group(1).strip()
+        pastDays = int(re.search(r"for the past (\d+) days", systemPrompt).group(1))
+        toolResults = [m.content for m in messages if m.role == MessageRole.TOOL]
+
+        if len(toolResults) == 0:
+            return tool_call(0, "get_past_news", ticker=ticker, company=company, pastDays=pastDays)
+
+        if len(toolResults) == 1:
+            newsList = ast.literal_eval(toolResults[0])
+            if len(newsList) == 0:
+                return ChatMessage(role=MessageRole.ASSISTANT, content="Failed to find any news")
+            return tool_call(1, "get_event_prices", symbol=ticker, newsDates=sorted({news["date"] for news in newsList}))
+
+        if len(toolResults) == 2:
+            firstNews = {}
+            for news in ast.literal_eval(toolResults[0]):
+                firstNews.setdefault(news["date"], news["news"])
+            events = [{"time": p["date"], "summary": firstNews[p["date"]], "previous": p["previous"], "close": p["close"]}
+                      for p in ast.literal_eval(toolResults[1]) if p["previous"] is not None and p["close"] is not None]
+            stockEvents = {"stock_symbol": ticker, "past_days": pastDays, "stock_total_events": len(events), "stock_price_events": events}
+            return tool_call(2, "save_events", stockEvents=json.dumps(stockEvents))
+
+        return ChatMessage(role=MessageRole.ASSISTANT, content="Stock events saved, the task is over.")
+
+    def usage(messages, message: ChatMessage) -> dict:
+        #rough token counts, 4 characters a token, so the traces carry tokens like DeepSeek's:
+        promptChars = sum(len(str(m.content or "")) for m in messages)
+        completionChars = len(str(message.content or "")) + len(str(message.additional_kwargs.get("tool_calls", "")))
+        return {"usage": {"prompt_tokens": promptChars // 4, "completion_tokens": completionChars // 4}}
+
+    class ScriptedLLM(MockFunctionCallingLLM):
+        def chat(self, messages, **kwargs) -> ChatResponse:
+            time.sleep(latency)
+            message = next_message(messages)
+            return ChatResponse(message=message, delta=message.content or "", raw=usage(messages, message))
+
+        async def achat(self, messages, **kwargs) -> ChatResponse:
+            await asyncio.sleep(latency)
+            message = next_message(messages)
+            return ChatResponse(message=message, delta=message.content or "", raw=usage(messages, message))
+
+        async def astream_chat(self, messages, **kwargs):
+            response = await self.achat(messages, **kwargs)
+
+            async def gen():
+                yield response
+
+            return gen()
+
+    return ScriptedLLM()
+
+
+def prepare_workdir(workDir: str):
+    #prompts are read from the working folder, everything else is created fresh:
+    shutil.copytree(os.path.join(RepoDir, "prompts"), os.path.join(workDir, "prompts"))
+    os.makedirs(os.path.join(workDir, "data"))
+    os.makedirs(os.path.join(workDir, "credentials"))
+    for name in ("alpha.vantage", "newsapi", "finnhub", "deepseek"):
+        with open(os.path.join(workDir, "credentials", f"{name}.txt"), "w") as f:
+            f.write("offline")
+    return
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RepoDir, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+async def run_stages(servers: FixtureServers, llm) -> List[dict]:
+    #imported after moving to the working folder, the modules resolve their data files relative to it:
+    from llama_index.core.agent.workflow import AgentWorkflow, FunctionAgent
+    from llama_index.core.workflow import Context
+    from apps.getStockEvent import myWorkFlow
+    from utils.agentTools import get_past_news, get_stock_prices
+    from utils.finUtil import get_stock_quote
+    from utils.traceUtil import TraceFile, start_run, read_traces, critical_path
+
+    workflow = AgentWorkflow(agents=[FunctionAgent(name="BenchAgent", description="Calls the tools directly", llm=llm,
+                                                   tools=[get_past_news, get_stock_prices])])
+    ctx = Context(workflow)
+    await ctx.set("state", {})
+
+    #the two latest weekdays, both in the Alpha Vantage fixture:
+    weekdays = [date.today() - timedelta(days=offset) for offset in range(1, 10) if (date.today() - timedelta(days=offset)).weekday() < 5]
+    workday, previousWorkday = str(weekdays[0]), str(weekdays[1])
+
+    async def quotes():
+        #the finnhub client is synchronous, like the stock service keep it off the event loop:
+        for ticker in QuoteTickers:
+            await asyncio.to_thread(get_stock_quote, ticker)
+
+    async def workflow_run():
+        with redirect_stdout(io.StringIO()):
+            await myWorkFlow(WorkflowTicker, WorkflowCompany, PastDays, llm)
+
+    stages = [
+        ("quotes", quotes),
+        ("pastNews.cold", lambda: get_past_news(ctx, ToolTicker, ToolCompany, PastDays)),
+        ("pastNews.warm", lambda: get_past_news(ctx, ToolTicker, ToolCompany, PastDays)),
+        ("stockPrices.cold", lambda: get_stock_prices(ctx, ToolTicker, workday, previousWorkday)),
+        ("stockPrices.warm", lambda: get_stock_prices(ctx, ToolTicker, workday, previousWorkday)),
+        ("workflow.cold", workflow_run),
+        ("workflow.warm", workflow_run),
+    ]
+
+    results = []
+    for name, stage in stages:
+        runsBefore = len(read_traces(TraceFile)[0]) if os.path.exists(TraceFile) else 0
+        requestsBefore = dict(servers.requests)
+        start = time.perf_counter()
+        with start_run("bench", stage=name):
+            await stage()
+        seconds = time.perf_counter() - start
+
+        #the workflow traces its own run inside the stage's run:
+        runs, spans = read_traces(TraceFile)
+        counters: Dict[str, int] = {}
+        for run in runs[runsBefore:]:
+            for counter, n in run.get("counters", {}).items():
+                counters[counter] = counters.get(counter, 0) + n
+
+        result = {
+            "stage": name,
+            "seconds": round(seconds, 4),
+            "http": {provider: n - requestsBefore[provider] for provider, n in servers.requests.items()},
+            "counters": counters,
+            "hitRates": hit_rates(counters),
+        }
+        workflowRuns = [run for run in runs[runsBefore:] if run["name"] == "stockEvents"]
+        if workflowRuns:
+            path = critical_path(workflowRuns[-1], spans.get(workflowRuns[-1]["run"], []))
+            result["criticalPath"] = {key: round(value, 4) for key, value in path.items()}
+            result["llmResponses"] = sum(1 for s in spans.get(workflowRuns[-1]["run"], []) if s["kind"] == "llm")
+        results.append(result)
+    return results
+
+
+def hit_rates(counters: Dict[str, int]) -> Dict[str, float]:
+    """Hit rate of each cache counted as "<cache>.hit" against all "<cache>.*" lookups."""
+    lookups: Dict[str, int] = {}
+    for counter, n in counters.items():
+        prefix = counter.rsplit(".", 1)[0]
+        lookups[prefix] = lookups.get(prefix, 0) + n
+    return {prefix: round(counters.get(f"{prefix}.hit", 0) / total, 4) for prefix, total in lookups.items() if total > 0}
+
+
+def main() -> int:
+    llmLatency = float(sys.argv[1]) if len(sys.argv) > 1 else LlmLatency
+    resultsFile = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    servers = FixtureServers()
+    baseUrl = servers.start()
+    with tempfile.TemporaryDirectory(prefix="benchOffline") as workDir:
+        prepare_workdir(workDir)
+        os.chdir(workDir)
+        sys.path.insert(0, RepoDir)
+
+        import utils.finUtil as finUtil
+        import utils.newsUtil as newsUtil
+        from utils.rateUtil import scheduler, AlphaVantage, NewsApi, Finnhub
+        from utils.finUtil import get_price_fetch_stats
+
+        finUtil.AlphaVantageUrl = f"{baseUrl}/query"
+        finUtil.FinnhubUrl = f"{baseUrl}/api/v1"
+        newsUtil.NewsUrl = f"{baseUrl}/v2/everything"
+        #the fixture servers have no rate limit, the free tier budgets would make the benchmark measure waiting:
+        for provider in (AlphaVantage, NewsApi, Finnhub):
+            scheduler.set_budget(provider, 100000, None)
+
+        start = time.perf_counter()
+        stages = asyncio.run(run_stages(servers, create_scripted_llm(llmLatency)))
+        total = time.perf_counter() - start
+        os.chdir(RepoDir)
+    servers.stop()
+
+    report = {
+        "commit": git_commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "llmLatency": llmLatency,
+        "httpLatency": HttpLatency,
+        "seconds": round(total, 4),
+        "http": dict(servers.requests),
+        "priceFetch": get_price_fetch_stats(),
+        "stages": stages,
+    }
+    print(json.dumps(report, indent=2))
+    if resultsFile is not None:
+        with open(resultsFile, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
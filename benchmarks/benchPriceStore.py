@@ -0,0 +1,89 @@
+"""
+Benchmark of the price store against the previous cache layout of one "SYM:YYYY-MM-DD" entry per close:
+memory per price, and resolving the (workday, previousWorkday) pairs of 30 events one by one or in one call.
+
+Usage: python -m benchmarks.benchPriceStore
+"""
+import asyncio
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import date, timedelta
+from utils.cacheUtil import CacheUtil, StockPriceKeyGenerator
+from utils.priceStore import PriceSeriesStore
+
+
+Symbols = 100
+Days = 100
+Events = 30
+Rounds = 200
+
+
+def make_series(symbolIndex: int) -> dict:
+    start = date(2025, 1, 1)
+    return {(start + timedelta(days=i)).strftime("%Y-%m-%d"): 100.0 + symbolIndex + i / 100 for i in range(Days)}
+
+
+def build_dict():
+    cache = OrderedDict()
+    for s in range(Symbols):
+        for day, close in make_series(s).items():
+            cache[f"SYM{s}:{day}"] = close
+    return cache
+
+
+def build_store():
+    store = PriceSeriesStore("unused.npz")  # never loaded or saved
+    for s in range(Symbols):
+        store.update(f"SYM{s}", make_series(s))
+    return store
+
+
+def measure_memory(build) -> int:
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+if __name__ == "__main__":
+    prices = Symbols * Days
+    dictBytes = measure_memory(build_dict)
+    storeBytes = measure_memory(build_store)
+    print(f"memory per price: dict {dictBytes / prices:.1f} B, store {storeBytes / prices:.1f} B")
+
+    cache = build_dict()
+    store = build_store()
+    days = list(make_series(0).keys())
+    workdays = days[1:Events + 1]
+    previousWorkdays = days[:Events]
+
+    start = time.perf_counter()
+    for _ in range(Rounds):
+        results = [(cache.get(f"SYM7:{w}"), cache.get(f"SYM7:{p}")) for w, p in zip(workdays, previousWorkdays)]
+    dictMs = (time.perf_counter() - start) / Rounds * 1000
+
+    #the previous get_stock_prices path: two awaited CacheUtil lookups per event
+    priceCache = CacheUtil(prices, "unused.json", StockPriceKeyGenerator())
+    priceCache.cache = cache
+
+    async def cache_lookups():
+        return [(await priceCache.get("SYM7", w), await priceCache.get("SYM7", p)) for w, p in zip(workdays, previousWorkdays)]
+
+    async def measure_cache():
+        start = time.perf_counter()
+        for _ in range(Rounds):
+            await cache_lookups()
+        return (time.perf_counter() - start) / Rounds * 1000
+
+    cacheMs = asyncio.run(measure_cache())
+
+    start = time.perf_counter()
+    for _ in range(Rounds):
+        closes, previousCloses = store.lookup_pairs("SYM7", workdays, previousWorkdays)
+    storeMs = (time.perf_counter() - start) / Rounds * 1000
+
+    assert [c for c, _ in results] == list(closes)
+    print(f"{Events} event pairs: CacheUtil {cacheMs:.3f} ms, plain dict {dictMs:.3f} ms, store {storeMs:.3f} ms in one call")
@@ -0,0 +1,45 @@
+"""
+Comparison of the getStockEvent workflow modes from the timings every run appends to data/workflowTimings.jsonl:
+pipeline mode formats and caches the events with plain function calls,
+agents mode hands them to EventFormatAgent and CacheEventAgent, two more LLM round trips.
+
+Collect runs of both modes first, ideally for the same tickers and days:
+    python -m apps.getStockEvent pipeline
+    python -m apps.getStockEvent agents
+
+Usage: python -m benchmarks.benchWorkflowModes
+"""
+import json
+import os
+import statistics
+
+WorkflowTimingFile = 'data/workflowTimings.jsonl'
+
+
+def load_timings() -> dict:
+    timings = {}
+    if not os.path.exists(WorkflowTimingFile):
+        return timings
+    with open(WorkflowTimingFile, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                timings.setdefault(record["mode"], []).append(record)
+    return timings
+
+
+def main():
+    timings = load_timings()
+    if not timings:
+        print(f"No runs recorded in {WorkflowTimingFile}")
+        return
+
+    print(f"{'mode':>10}{'runs':>6}{'median s':>10}{'mean s':>10}{'LLM responses':>15}")
+    for mode, records in sorted(timings.items()):
+        seconds = [record["seconds"] for record in records]
+        responses = [record["llmResponses"] for record in records]
+        print(f"{mode:>10}{len(records):>6}{statistics.median(seconds):>10.2f}{statistics.mean(seconds):>10.2f}{statistics.mean(responses):>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Check of the timeouts of get_http_request_async against a local server answering after SlowSeconds:
+a default call must give up after the session's TotalTimeout, a call with its own timeout after that one,
+and a call with a timeout longer than the answer must get it.
+
+Exits with status 1 if any call waited longer than its timeout or missed the answer.
+
+Usage: python -m benchmarks.checkHttpTimeout
+"""
+import sys
+import time
+import asyncio
+from aiohttp import web
+import utils.httpUtil as httpUtil
+from utils.httpUtil import get_http_request_async, close_async_session
+
+
+SlowSeconds = 2.0
+#seconds a timed out call may take beyond its timeout:
+Slack = 0.5
+
+
+async def slow_answer(request: web.Request) -> web.Response:
+    await asyncio.sleep(SlowSeconds)
+    return web.json_response({"ok": True})
+
+
+async def timed_call(url: str, timeout=None):
+    start = time.perf_counter()
+    httpData = await get_http_request_async(url, timeout=timeout)
+    return (httpData, time.perf_counter() - start)
+
+
+async def check() -> int:
+    app = web.Application()
+    app.add_routes([web.get("/slow", slow_answer)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/slow"
+
+    httpUtil.TotalTimeout = 0.5
+    failures = 0
+    cases = [("session timeout", None, httpUtil.TotalTimeout, False),
+             ("call timeout", 1.0, 1.0, False),
+             ("long call timeout", SlowSeconds * 2, SlowSeconds * 2, True)]
+    try:
+        for name, timeout, limit, answered in cases:
+            httpData, seconds = await timed_call(url, timeout)
+            ok = seconds <= limit + Slack and (httpData is not None) == answered
+            print(f"{name}: {'answered' if httpData is not None else 'timed out'} after {seconds:.2f}s, limit {limit:.2f}s {'ok' if ok else 'FAILED'}")
+            failures += not ok
+    finally:
+        await close_async_session()
+        await runner.cleanup()
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(check()) else 0)
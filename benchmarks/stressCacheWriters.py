@@ -0,0 +1,113 @@
+"""
+Stress test of the on-disk caches shared by several processes: every writer process adds its own entries to the same
+json, log and sqlite cache files through two CacheUtil instances, as getStockEvent does, saving after every entry, and its own symbol to
+the same price store. Afterwards every entry and every symbol of every writer must be in the files.
+
+The log storage compacts after a few dozen records here, so the writers also run into each other's compactions.
+Exits with status 1 if any entry was lost.
+
+Usage: python -m benchmarks.stressCacheWriters [writers] [entries per writer]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from datetime import date, timedelta
+from utils.cacheUtil import CacheUtil, StockPriceKeyGenerator, AppendLogStorage
+from utils.priceStore import PriceSeriesStore
+
+
+Writers = 8
+Entries = 50
+CompactAfter = 40
+
+
+def create_caches(folder: str):
+    #two instances per storage, like the workflow's cache and the one save_stock_event_to_cache creates:
+    caches = {}
+    for storage in ("json", "log", "sqlite"):
+        cacheFile = os.path.join(folder, f"cache.{storage}")
+        caches[storage] = [CacheUtil(Writers * Entries * 2, cacheFile, StockPriceKeyGenerator(),
+                                     storage=AppendLogStorage(cacheFile, min_records=CompactAfter) if storage == "log" else storage)
+                           for _ in range(2)]
+    return caches
+
+
+async def write(folder: str, writer: int):
+    caches = create_caches(folder)
+    for instances in caches.values():
+        for cache in instances:
+            await cache.load_cache()
+    priceStore = PriceSeriesStore(os.path.join(folder, "prices.npz"))
+    await priceStore.load()
+
+    start = date(2025, 1, 1)
+    for i in range(Entries):
+        for instances in caches.values():
+            cache = instances[i % 2]
+            await cache.add({"writer": writer, "entry": i}, f"W{writer}", f"{i:04d}")
+            await cache.save_to_file()
+            #reads stamp the sqlite entries, their writes must not block the other writers either:
+            await cache.get(f"W{writer}", f"{i:04d}")
+        priceStore.update(f"SYM{writer}", {(start + timedelta(days=i)).strftime("%Y-%m-%d"): 100.0 + i})
+        await priceStore.save()
+
+    for cache in caches["sqlite"]:
+        await cache.save_to_file()
+        await cache.storage.close()
+    return
+
+
+def run_writer(folder: str, writer: int, barrier):
+    barrier.wait()
+    asyncio.run(write(folder, writer))
+
+
+async def check(folder: str) -> int:
+    lost = 0
+    for storage, instances in create_caches(folder).items():
+        cache = instances[0]
+        await cache.load_cache()
+        missing = [(w, i) for w in range(Writers) for i in range(Entries) if await cache.get(f"W{w}", f"{i:04d}") == None]
+        print(f"{storage} storage: {Writers * Entries - len(missing)} of {Writers * Entries} entries")
+        lost += len(missing)
+        if storage == "sqlite":
+            await cache.storage.close()
+
+    priceStore = PriceSeriesStore(os.path.join(folder, "prices.npz"))
+    await priceStore.load()
+    print(f"price store: {priceStore.size()} of {Writers * Entries} prices")
+    lost += Writers * Entries - priceStore.size()
+    return lost
+
+
+def main() -> int:
+    global Writers, Entries
+    Writers = int(sys.argv[1]) if len(sys.argv) > 1 else Writers
+    Entries = int(sys.argv[2]) if len(sys.argv) > 2 else Entries
+
+    with tempfile.TemporaryDirectory() as folder:
+        barrier = multiprocessing.Barrier(Writers)
+        processes = [multiprocessing.Process(target=run_writer, args=(folder, writer, barrier)) for writer in range(Writers)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print(f"{Writers} writers saved {Entries} entries each in {time.perf_counter() - started:.2f}s")
+
+        if any(process.exitcode != 0 for process in processes):
+            print("A writer failed")
+            return 1
+        lost = asyncio.run(check(folder))
+
+    if lost:
+        print(f"Lost {lost} entries")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from llama_index.core.workflow import Context
+from utils.logUtil import setup_logger
+from utils.finUtil import fetch_daily_prices, should_fetch_prices, priceFetchFlight, format_stock_event_string_to_table, load_price_store
+from utils.newsUtil import get_news_by_days
+from utils.priceStore import to_optional_floats
+from utils.relevanceUtil import filter_news
+from utils.timeUtil import find_workdays
+from utils.calendarUtil import get_calendar
+from utils.traceUtil import count
+
+logger = setup_logger("agentTools")
+
+#tools of the stock event agents, they take the workflow Context and so import llama_index,
+#utils modules used without agents stay free of it
+
+
+async def get_stock_prices(ctx: Context, symbol: str, workday: str, previousWorkday: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    For a given stock symbol, get the stock price on the given date and price on the previous workday.
+
+    Args:
+        ctx (Context): The context between multi-agents.
+        symbol (str): The stock symbol.
+        workday (str): The date in the format 'YYYY-MM-DD'.
+        previousWorkday (str): The date in the format 'YYYY-MM-DD'.
+
+    Returns:
+        A tuple of float of the close price of the stock
+        on the given date and the previous day.
+        If the price is not available, set it to None.
+    """
+    #check if prices can be got from the price store:
+    current_state = await ctx.get("state")
+    if "price_store" not in current_state:
+        logger.error(f"No price store found in context.")
+        return (None, None)
+    
+    priceStore = current_state["price_store"]
+    workdayData, previousWorkdayData = to_optional_floats(priceStore.lookup(symbol, [workday, previousWorkday]))
+    if(workdayData != None and previousWorkdayData != None):
+        logger.info(f"Got stock price from price store for {symbol} on {workday} and {previousWorkday}")
+        count("priceStore.hit")
+        priceFetchFlight.record_hit()
+        return (workdayData, previousWorkdayData)
+
+    count("priceStore.miss")
+    missingDates = [date for date, price in ((workday, workdayData), (previousWorkday, previousWorkdayData)) if price == None]
+    if not should_fetch_prices(priceStore, symbol, missingDates):
+        logger.info(f"Price of {symbol} on {', '.join(missingDates)} is not published, not fetching again")
+        count("priceStore.skip")
+        return (workdayData, previousWorkdayData)
+    priceDataDict = await fetch_daily_prices(priceStore, symbol)
+    if(priceDataDict == None):
+        return (None, None)
+    
+    workdayData = priceDataDict.get(workday)
+    previousWorkdayData = priceDataDict.get(previousWorkday)
+
+    if(not workdayData):
+        logger.warning(f"Could not find stock price for {symbol} on {workday}")
+        workdayData = 0.0
+    if(not previousWorkdayData):
+        logger.warning(f"Could not find stock price for {symbol} on {previousWorkday}")
+        previousWorkdayData = 0.0
+
+    if(workdayData and previousWorkdayData):
+        logger.info(f"Getting price for {symbol} on {workday} and {previousWorkday}: {workdayData}, {previousWorkdayData}")
+
+    return (workdayData, previousWorkdayData)
+
+
+async def get_event_prices(ctx: Context, symbol: str, newsDates: List[str]) -> List[Dict[str, Any]]:
+    """
+    For a given stock symbol and the dates of a list of news, get in one call for every date:
+    the closest workday, the previous workday and the close prices of both.
+
+    Args:
+        ctx (Context): The context between multi-agents.
+        symbol (str): The stock symbol.
+        newsDates (List[str]): The dates of the news in the format 'YYYY-MM-DD'.
+
+    Returns:
+        A list with one dictionary per distinct date, in the order given, with keys:
+        "date", "workday", "previousWorkday",
+        "close" (the close price of the workday) and "previous" (the close price of the previous workday).
+        If a price is not available, it is set to None.
+    """
+    current_state = await ctx.get("state")
+    if "price_store" not in current_state:
+        logger.error(f"No price store found in context.")
+        return []
+
+    priceStore = current_state["price_store"]
+    dates = list(dict.fromkeys(newsDates))
+    calendar = get_calendar()
+    if all(calendar.covers(date) for date in dates):
+        closestSessions, previousSessions = calendar.session_pairs(dates)
+        workdays = [str(day) for day in closestSessions]
+        previousWorkdays = [str(day) for day in previousSessions]
+    else:
+        workdayPairs = [find_workdays(date) for date in dates]
+        workdays = [pair[0] for pair in workdayPairs]
+        previousWorkdays = [pair[1] for pair in workdayPairs]
+
+    closes, previousCloses = priceStore.lookup_pairs(symbol, workdays, previousWorkdays)
+
+    #one fetch of the daily series covers every date that is missing from the store,
+    #unless the dates are not published yet or were already looked for, those stay None:
+    if(np.isnan(closes).any() or np.isnan(previousCloses).any()):
+        count("priceStore.miss")
+        missingDates = sorted({day for day, close in zip(workdays + previousWorkdays, np.concatenate((closes, previousCloses))) if np.isnan(close)})
+        if not should_fetch_prices(priceStore, symbol, missingDates):
+            logger.info(f"Prices of {symbol} on {', '.join(missingDates)} are not published, not fetching again")
+            count("priceStore.skip")
+        elif(await fetch_daily_prices(priceStore, symbol) != None):
+            closes, previousCloses = priceStore.lookup_pairs(symbol, workdays, previousWorkdays)
+    else:
+        count("priceStore.hit")
+        priceFetchFlight.record_hit()
+
+    results = []
+    for date, workday, previousWorkday, close, previous in zip(dates, workdays, previousWorkdays, to_optional_floats(closes), to_optional_floats(previousCloses)):
+        results.append({"date": date, "workday": workday, "previousWorkday": previousWorkday, "close": close, "previous": previous})
+
+    logger.info(f"Got prices of {symbol} for {len(results)} news dates")
+    return results
+
+
+
+async def format_stock_event_string(ctx: Context) -> str:
+    """
+    For a stock event representd in json format string, format it to a table.
+
+    Args:
+        ctx(Context) : The context between multi-agents. The stock event is saved in the context in the following format:
+        stockEvent(str) : The stock event representd in json format string. It has the following format:
+            {{
+            "stock_symbol": companyTicker,
+            "past_days": pastDays,
+            "stock_total_events": total_number,
+            "stock_price_events": [
+                {{
+                "time": "yyyy-mm-dd",
+                "summary": "brief summary of the event",
+                "previous": "the stock price of the previous workday. If price is not available, return None",
+                "close": "the stock price of the closest workday. If price is not available, return None"
+                }}
+            ]
+            }}
+
+    Returns:
+        A string indicating the stock event has been formatted
+    """
+    current_state = await ctx.get("state")
+    if "stock_events" not in current_state:
+        logger.error("No stock events found in context.")
+        return None
+
+    stockEvent = current_state["stock_events"]
+    logger.info(f"Formatting and print stock event")
+    format_stock_event_string_to_table(stockEvent)
+    return "Stock event formatted and printed"
+    
+
+
+
+
+async def get_past_news(ctx: Context, ticker: str, company: str, pastDays: int) -> List[Dict[str, str]]:
+    """
+    Retrieves a list of news articles about a company based on the ticker and company name
+    published in the past 'pastDays' days.
+
+    Args:
+    ctx(Context) : The context between multi-agents.
+    ticker (str): The ticker symbol of the company.
+    company (str): The name of the company.
+    pastDays (int): The number of days in the past to retrieve news from.
+
+    Returns:
+    List[Dict[str, str]]: A list of dictionaries, each containing a date (str, in format 'YYYY-MM-DD')
+    and a news article (str).
+    """
+    newsList = await get_news_by_days(ticker, company, pastDays)
+
+    #load price store and save to context, so the next steps could retrieve it:
+    current_state = await ctx.get("state")
+
+    #the recent days are answered by cached stock events, only the older news needs a look:
+    newsBefore = current_state.get("news_before")
+    if newsBefore:
+        newsList = [news for news in newsList if news["date"] < newsBefore]
+
+    #drop the news clearly unrelated to stock prices, the LLM judges the rest:
+    filterReport = {}
+    newsList = filter_news(newsList, report=filterReport)
+    current_state["news_seen"] = newsList
+    current_state["news_audited"] = filterReport["audited"]
+
+    if "price_store" not in current_state:
+        current_state["price_store"] = await load_price_store()
+    await ctx.set("state", current_state)
+
+    logger.info(f"Get {len(newsList)} originnal news")
+    return newsList
@@ -1,69 +1,176 @@
 import json
 import os
+import time
 import asyncio
+import itertools
+import sqlite3
 import aiofiles
 from collections import OrderedDict
 from datetime import datetime
 from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from utils.lockUtil import FileLock, file_version
 from utils.logUtil import setup_logger
 
 logger = setup_logger("cacheUtil")
 
 
 class CacheUtil:
-    def __init__(self, max_size, cache_file, key_generator):
+    def __init__(self, max_size, cache_file, key_generator, storage="json", policy=None, ttl=None):
         """
         Initialize the news cache with configurable key generation.
         
         Args:
-            max_size (int): Maximum number of cache entries
+            max_size (int): Maximum number of cache entries, for the default LRU policy and the sqlite storage, None with another policy
             cache_file (str): File to persist the cache to
             key_generator: Instance of KeyGenerator
+            storage: "json", "log", "sqlite" or an instance of CacheStorage
+            policy: Instance of EvictionPolicy, defaults to LruPolicy(max_size). Not used by the sqlite storage
+            ttl (float): Seconds an entry stays valid unless add gives its own, None to keep entries until evicted
         """
         self._lock = asyncio.Lock() 
 
         self.max_size = max_size
         self.cache_file = cache_file
         self.key_generator = key_generator
+        self.storage = create_storage(storage, cache_file)
+        self.policy = policy if policy is not None else LruPolicy(max_size)
+        self.ttl = ttl
 
         self.cache = OrderedDict()  # Maintains insertion order for LRU
+        #expiry time of the entries added with a ttl, persisted by the storage:
+        self.expires = self.storage.expires
+
+        #keys changed or evicted since the last save, so storages can write only the delta:
+        self._changed = {}  # dict as an ordered set, so deltas keep their LRU order
+        self._removed = set()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
         return
 
 
     async def load_cache(self):
         """Load cache from file if it exists."""
+        if not self.storage.resident:
+            #entries stay on disk, only open the storage:
+            async with self._lock:
+                await self.storage.open()
+            return
+
         if not os.path.exists(self.cache_file):
             return
         
         async with self._lock:
             try:
-                async with aiofiles.open(self.cache_file, mode='r') as f:
-                    contents = await f.read()
-                    data = json.loads(contents)
-                    count = 0
-                    for key, value in data.get('cache', {}).items():
-                        self.cache[key] = value
-                        count += 1
-
-                    logger.info(f"Loaded {count} items from cache file {self.cache_file}")
+                async with self.storage.locked():
+                    self.cache = await self.storage.load()
+                self._changed.clear()
+                self._removed.clear()
+                logger.info(f"Loaded {len(self.cache)} items from cache file {self.cache_file}")
 
             except (json.JSONDecodeError, IOError):
                 logger.error(f"Failed to load cache from {self.cache_file}")
                 self.cache = OrderedDict()
                 return
+
+            #the policy may have a smaller budget than the file holds, the evictions are written on the next save:
+            self._rebuild_policy()
+            self._evict(None)
         return
 
 
     async def save_to_file(self):
-        """Save cache to file."""
+        """
+        Save cache to file. Other processes and CacheUtil instances may share the file:
+        under its file lock, the entries they saved since this instance last loaded or saved it are merged in first,
+        then this instance's own changes are written on top, so no writer drops the entries of another.
+        """
         async with self._lock:
+            changed = [(key, self.cache[key]) for key in self._changed if key in self.cache]
+            removed = list(self._removed)
+            changedExpires = {key: self.expires.get(key) for key, _ in changed}
             try:
-                async with aiofiles.open(self.cache_file, mode='w') as f:
-                    await f.write(json.dumps({'cache': dict(self.cache)}))
+                async with self.storage.locked():
+                    if await self.storage.merge_external(self.cache):
+                        changed, removed = self._reapply(changed, removed, changedExpires)
+                    await self.storage.save(self.cache, changed, removed)
             except IOError:
                 logger.error(f"Failed to save cache to {self.cache_file}")
                 return
+
+            self._changed.clear()
+            self._removed.clear()
+        return
+
+
+    def _reapply(self, changed, removed, changedExpires):
+        #the cache now holds the file as other writers left it, put this instance's changes back on top:
+        for key in removed:
+            self.cache.pop(key, None)
+            self.expires.pop(key, None)
+        for key, value in changed:
+            self.cache.pop(key, None)
+            self.cache[key] = value
+            if changedExpires[key] is not None:
+                self.expires[key] = changedExpires[key]
+            else:
+                self.expires.pop(key, None)
+
+        self._rebuild_policy()
+        self._evict(None)
+        removed = list(dict.fromkeys(removed + list(self._removed)))
+        changed = [(key, value) for key, value in changed if key in self.cache]
+        return (changed, removed)
+
+
+    def _rebuild_policy(self):
+        #drop what expired while on disk, then let the policy learn the entries in their LRU order:
+        now = time.time()
+        for key in [key for key, expiry in self.expires.items() if expiry <= now]:
+            if key in self.cache:
+                self._remove(key)
+                self.stats["expired"] += 1
+        self.policy.reset()
+        for key, value in self.cache.items():
+            self.policy.on_add(key, value)
+        return
+
+
+    def _remove(self, key):
+        self.cache.pop(key, None)
+        self.expires.pop(key, None)
+        self.policy.on_remove(key)
+        self._changed.pop(key, None)
+        self._removed.add(key)
+        return
+
+
+    def _is_expired(self, key) -> bool:
+        expiry = self.expires.get(key)
+        return expiry is not None and expiry <= time.time()
+
+
+    def _evict(self, keep):
+        victims = self.policy.victims(self.cache, keep)
+        if victims and self.expires:
+            #expired entries go before any live one:
+            now = time.time()
+            for key in [key for key, expiry in self.expires.items() if expiry <= now and key != keep]:
+                if key in self.cache:
+                    self._remove(key)
+                    self.stats["expired"] += 1
+            victims = self.policy.victims(self.cache, keep)
+
+        for key in victims:
+            self._remove(key)
+            self.stats["evicted"] += 1
         return
+
+
+    def get_stats(self) -> dict:
+        """Hit, miss, expiry and eviction counters of this instance, its hit ratio and its size."""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "hitRatio": round(self.stats["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self.cache), "bytes": self.policy.bytes}
     
 
     async def get(self, *args, **kwargs):
@@ -79,36 +186,88 @@ class CacheUtil:
         """
         key = self.key_generator.generate_key(*args, **kwargs)
         async with self._lock:
+            if not self.storage.resident:
+                value = await self.storage.get(key)
+                self.stats["misses" if value is None else "hits"] += 1
+                return None if value is None else json.dumps(value)
+
+            if key in self.cache and self._is_expired(key):
+                self._remove(key)
+                self.stats["expired"] += 1
+
             if key in self.cache:
                 #use pop and reinsert it to the dict, so it will be regarded as recently used by putting it to the end of the dict:
                 value = self.cache.pop(key)
                 self.cache[key] = value
-
+                self.policy.on_get(key)
+                self.stats["hits"] += 1
 
                 return json.dumps(value)
+            self.stats["misses"] += 1
         return None
     
 
-    async def add(self, value, *args, **kwargs):
+    async def add(self, value, *args, ttl=None, **kwargs):
         """
         Add item to cache using application-specific key generation.
         
         Args:
             value: Value to cache (should be JSON-serializable)
             *args: Positional arguments for key generation
+            ttl (float): Seconds this entry stays valid, defaults to the ttl of the cache
             **kwargs: Keyword arguments for key generation
         """
         key = self.key_generator.generate_key(*args, **kwargs)
+        ttl = ttl if ttl is not None else self.ttl
         
         # If key exists, remove it first to update position
         async with self._lock:
+            if not self.storage.resident:
+                await self.storage.put(key, value, self.max_size)
+                return
+
             if key in self.cache:
                 self.cache.pop(key)
-            elif len(self.cache) >= self.max_size:
-                self.cache.popitem(last=False)
             self.cache[key] = value
+            if ttl is not None:
+                self.expires[key] = time.time() + ttl
+            else:
+                self.expires.pop(key, None)
+            self.policy.on_add(key, value)
+            self._changed.pop(key, None)
+            self._changed[key] = True
+            self._removed.discard(key)
+
+            self._evict(key)
         
         return
+
+
+    async def get_range(self, start, end):
+        """
+        Get all items whose keys fall between the keys generated from 'start' and 'end', inclusive.
+        Expired items are left out. A call counts as one hit if it finds any item.
+        
+        Args:
+            start (tuple): Key generation arguments of the lower bound, e.g. ("AAPL", "2025-05-01")
+            end (tuple): Key generation arguments of the upper bound, e.g. ("AAPL", "2025-05-31")
+            
+        Returns:
+            list: (key, value) pairs sorted by key
+        """
+        startKey = self.key_generator.generate_key(*start)
+        endKey = self.key_generator.generate_key(*end)
+        async with self._lock:
+            if not self.storage.resident:
+                items = await self.storage.range(startKey, endKey)
+                self.stats["hits" if items else "misses"] += 1
+                return items
+
+            items = sorted((key, value) for key, value in self.cache.items() if startKey <= key <= endKey and not self._is_expired(key))
+            for key, _ in items:
+                self.policy.on_get(key)
+            self.stats["hits" if items else "misses"] += 1
+            return items
     
 
     # def clear(self):
@@ -122,6 +281,569 @@ class CacheUtil:
     
 
 
+class CacheStorage(ABC):
+    """
+    Abstract base class for cache persistence.
+
+    A resident storage is loaded into CacheUtil's in-memory dict and persisted on save,
+    together with 'expires', the expiry time of the entries added with a ttl, which it shares with CacheUtil.
+    A storage that is not resident serves get/put/range itself, so the cache is never held in memory.
+    """
+    resident = True
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.file_lock = FileLock(cache_file)
+        self.expires = {}
+
+    def locked(self):
+        """Lock CacheUtil holds around loads and saves, so processes sharing the file take turns."""
+        return self.file_lock
+
+    async def merge_external(self, cache) -> bool:
+        """
+        Bring 'cache' up to date with what other writers saved since this storage last loaded or saved the file.
+        Called under the lock, right before a save.
+
+        Returns:
+            True if 'cache' changed.
+        """
+        return False
+
+    @abstractmethod
+    async def load(self) -> OrderedDict:
+        """Read the persisted cache, least recently used entry first"""
+        pass
+
+    @abstractmethod
+    async def save(self, cache, changed, removed):
+        """
+        Persist the cache.
+
+        Args:
+            cache (OrderedDict): The whole cache
+            changed (list): (key, value) pairs added or updated since the last save
+            removed (list): Keys evicted since the last save
+        """
+        pass
+
+
+class JsonFileStorage(CacheStorage):
+    """
+    Keeps the whole cache in one json file, rewritten on every save.
+    The new file is written aside and renamed over the old one, so readers never see a partial file.
+    """
+    def __init__(self, cache_file):
+        super().__init__(cache_file)
+        self._version = None  # of the file as this storage last loaded or saved it
+        return
+
+    async def load(self):
+        cache = OrderedDict()
+        async with aiofiles.open(self.cache_file, mode='r') as f:
+            contents = await f.read()
+            data = json.loads(contents)
+            for key, value in data.get('cache', {}).items():
+                cache[key] = value
+        self.expires.clear()
+        self.expires.update(data.get('expires', {}))
+        self._version = file_version(self.cache_file)
+        return cache
+
+    async def merge_external(self, cache):
+        version = file_version(self.cache_file)
+        if version is None or version == self._version:
+            return False
+
+        onDisk = await self.load()
+        cache.clear()
+        cache.update(onDisk)
+        return True
+
+    async def save(self, cache, changed, removed):
+        tmpFile = f"{self.cache_file}.tmp"
+        async with aiofiles.open(tmpFile, mode='w') as f:
+            expires = {key: expiry for key, expiry in self.expires.items() if key in cache}
+            await f.write(json.dumps({'cache': dict(cache), 'expires': expires}))
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())
+        os.replace(tmpFile, self.cache_file)
+        self._version = file_version(self.cache_file)
+        return
+
+
+class AppendLogStorage(CacheStorage):
+    """
+    Appends changed and evicted entries to a json lines log, so a save costs O(delta) instead of O(cache).
+    Each line is {"k": key, "v": value} for a write, with "x": expiry time if it has one, or {"k": key, "d": 1} for an eviction.
+
+    The log is compacted into a snapshot of the live entries once it holds more than
+    'compact_ratio' records per live entry. A torn last line left by a crash is dropped on load.
+
+    Several writers can share the log: before appending, a writer reads the records others appended
+    since its last read or write, and after a compaction by another writer it reads the new log.
+    """
+    def __init__(self, cache_file, compact_ratio=2.0, min_records=1000):
+        super().__init__(cache_file)
+        self.compact_ratio = compact_ratio
+        self.min_records = min_records
+        self._records = 0  # number of lines in the log
+        self._offset = 0  # bytes of the log this storage has read or written
+        self._inode = None  # of the log file this storage has read or written
+        return
+
+    async def load(self):
+        cache = OrderedDict()
+        async with aiofiles.open(self.cache_file, mode='rb') as f:
+            contents = await f.read()
+
+        self._records = 0
+        self.expires.clear()
+        await self._replay(cache, contents, 0)
+        self._inode = os.stat(self.cache_file).st_ino
+
+        if self._needs_compaction(cache):
+            await self.compact(cache)
+        return cache
+
+    async def merge_external(self, cache):
+        try:
+            stat = os.stat(self.cache_file)
+        except FileNotFoundError:
+            return False
+
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            #another writer compacted the log into a new file:
+            onDisk = await self.load()
+            cache.clear()
+            cache.update(onDisk)
+            return True
+        if stat.st_size == self._offset:
+            return False
+
+        async with aiofiles.open(self.cache_file, mode='rb') as f:
+            await f.seek(self._offset)
+            contents = await f.read()
+        await self._replay(cache, contents, self._offset)
+        return True
+
+    async def _replay(self, cache, contents, offset):
+        #apply the records of 'contents', read from 'offset' of the log, to the cache:
+        validLength = 0
+        for line in contents.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("torn record")
+                record = json.loads(line)
+            except ValueError:
+                if validLength + len(line) == len(contents):
+                    break  # last record was cut off by a crash
+                logger.warning(f"Skipped corrupt record in {self.cache_file}")
+                validLength += len(line)
+                continue
+
+            validLength += len(line)
+            self._records += 1
+            key = record["k"]
+            cache.pop(key, None)
+            self.expires.pop(key, None)
+            if "v" in record:
+                cache[key] = record["v"]
+                if "x" in record:
+                    self.expires[key] = record["x"]
+
+        #cut the torn record, so the next append starts on a clean line:
+        if validLength < len(contents):
+            logger.warning(f"Recovered {self.cache_file}: dropped {len(contents) - validLength} bytes of torn record")
+            async with aiofiles.open(self.cache_file, mode='r+b') as f:
+                await f.truncate(offset + validLength)
+        self._offset = offset + validLength
+        return
+
+    async def save(self, cache, changed, removed):
+        if not changed and not removed:
+            return
+
+        lines = [json.dumps(self._record(key, value)) + "\n" for key, value in changed]
+        lines += [json.dumps({"k": key, "d": 1}) + "\n" for key in removed]
+        data = "".join(lines).encode("utf-8")
+        async with aiofiles.open(self.cache_file, mode='ab') as f:
+            await f.write(data)
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._records += len(lines)
+        self._offset += len(data)
+
+        if self._needs_compaction(cache):
+            await self.compact(cache)
+        return
+
+    def _record(self, key, value):
+        if key in self.expires:
+            return {"k": key, "v": value, "x": self.expires[key]}
+        return {"k": key, "v": value}
+
+    def _needs_compaction(self, cache):
+        return self._records > max(self.min_records, self.compact_ratio * len(cache))
+
+    async def compact(self, cache):
+        """Rewrite the log as one record per live entry, replacing the old log atomically."""
+        tmpFile = f"{self.cache_file}.tmp"
+        data = "".join(json.dumps(self._record(key, value)) + "\n" for key, value in cache.items()).encode("utf-8")
+        async with aiofiles.open(tmpFile, mode='wb') as f:
+            await f.write(data)
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())
+        os.replace(tmpFile, self.cache_file)
+        self._inode = os.stat(self.cache_file).st_ino
+        self._offset = len(data)
+
+        logger.info(f"Compacted {self.cache_file} from {self._records} to {len(cache)} records")
+        self._records = len(cache)
+        return
+
+
+class SqliteStorage(CacheStorage):
+    """
+    Keeps the cache in a sqlite table indexed by key, so point and range lookups are index seeks
+    and memory use does not grow with the cache. Keys of one symbol sort together by date,
+    so "SYM:start" to "SYM:end" is a single index range.
+
+    Every put is committed in its own short transaction, so processes sharing the file only wait on each other
+    for the length of one write, up to 'busy_timeout' seconds. LRU order is kept in the 'used' column,
+    reads do not write: their stamps are batched and written by save, or once 'max_pending_stamps' piled up.
+    All statements run on a worker thread, off the event loop.
+    """
+    resident = False
+
+    def __init__(self, cache_file, busy_timeout=30.0, max_pending_stamps=256):
+        super().__init__(cache_file)
+        self.busy_timeout = busy_timeout
+        self.max_pending_stamps = max_pending_stamps
+        self._conn = None
+        self._clock = 0  # last 'used' value handed out
+        self._stamps = {}  # key: 'used' value of the reads not written yet
+        return
+
+    def locked(self):
+        #every write is a transaction of its own, sqlite makes the processes take turns on it:
+        return nullcontext()
+
+    def _stamp(self) -> int:
+        #nanoseconds, so the stamps of processes sharing the file order their uses too:
+        self._clock = max(self._clock + 1, time.time_ns())
+        return self._clock
+
+    def _connect(self):
+        #autocommit, transactions are opened explicitly around each write:
+        conn = sqlite3.connect(self.cache_file, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, used INTEGER NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        logger.info(f"Opened {count} items from cache file {self.cache_file}")
+        return conn
+
+    async def open(self):
+        if self._conn is not None:
+            return
+        #CacheUtil's lock serializes access, so one connection is used by one worker thread at a time:
+        self._conn = await asyncio.to_thread(self._connect)
+        return
+
+    async def load(self):
+        await self.open()
+        return OrderedDict()
+
+    def _write_stamps(self):
+        if not self._stamps:
+            return
+        stamps, self._stamps = self._stamps, {}
+        with self._transaction():
+            self._conn.executemany("UPDATE cache SET used = ? WHERE key = ?", [(used, key) for key, used in stamps.items()])
+        return
+
+    @contextmanager
+    def _transaction(self):
+        #take the write lock up front, waiting for other writers up to the busy timeout:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return
+
+    async def save(self, cache, changed, removed):
+        if self._conn is None:
+            return
+        try:
+            await asyncio.to_thread(self._write_stamps)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write cache use stamps to {self.cache_file}: {e}")
+        return
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._stamps[key] = self._stamp()
+        if len(self._stamps) >= self.max_pending_stamps:
+            self._write_stamps()
+        return json.loads(row[0])
+
+    async def get(self, key):
+        await self.open()
+        try:
+            return await asyncio.to_thread(self._get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read {key} from cache file {self.cache_file}: {e}")
+            return None
+
+    def _put(self, key, value, max_size):
+        with self._transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone() is not None
+            if not exists:
+                #counted inside the transaction, other processes may have added entries:
+                evict = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - max_size + 1
+                if evict > 0:
+                    conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used LIMIT ?)", (evict,))
+            conn.execute("INSERT OR REPLACE INTO cache (key, value, used) VALUES (?, ?, ?)", (key, json.dumps(value), self._stamp()))
+        self._stamps.pop(key, None)
+        return
+
+    async def put(self, key, value, max_size):
+        await self.open()
+        try:
+            await asyncio.to_thread(self._put, key, value, max_size)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write {key} to cache file {self.cache_file}: {e}")
+        return
+
+    def _range(self, start_key, end_key):
+        rows = self._conn.execute("SELECT key, value FROM cache WHERE key BETWEEN ? AND ? ORDER BY key", (start_key, end_key))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    async def range(self, start_key, end_key):
+        await self.open()
+        try:
+            return await asyncio.to_thread(self._range, start_key, end_key)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read {start_key} to {end_key} from cache file {self.cache_file}: {e}")
+            return []
+
+    async def close(self):
+        if self._conn is None:
+            return
+        await self.save(None, [], [])
+        await asyncio.to_thread(self._conn.close)
+        self._conn = None
+        return
+
+
+def create_storage(storage, cache_file):
+    """Create the storage named by 'storage' ("json", "log" or "sqlite"), or return it if it already is a CacheStorage."""
+    if isinstance(storage, CacheStorage):
+        return storage
+    if storage == "json":
+        return JsonFileStorage(cache_file)
+    if storage == "log":
+        return AppendLogStorage(cache_file)
+    if storage == "sqlite":
+        return SqliteStorage(cache_file)
+    raise ValueError(f"Unknown cache storage: {storage}")
+
+
+
+def entry_size(key, value) -> int:
+    """Bytes of an entry as the storages write it: its key and its value in json."""
+    return len(key) + len(json.dumps(value))
+
+
+def symbol_group(key) -> str:
+    #the keys of the key generators below start with the stock symbol:
+    return key.split(":", 1)[0]
+
+
+class EvictionPolicy(ABC):
+    """
+    Decides which entries a resident CacheUtil evicts. CacheUtil calls it under its lock,
+    tells it about every added, read and removed entry, and evicts its victims after every add.
+    """
+    #bytes of the entries it holds, if it counts them:
+    bytes = None
+
+    @abstractmethod
+    def reset(self):
+        """Forget all entries, before CacheUtil adds the loaded ones again."""
+        pass
+
+    @abstractmethod
+    def on_add(self, key, value):
+        """An entry was added or replaced."""
+        pass
+
+    @abstractmethod
+    def on_get(self, key):
+        """An entry was read."""
+        pass
+
+    @abstractmethod
+    def on_remove(self, key):
+        """An entry was evicted or expired."""
+        pass
+
+    @abstractmethod
+    def victims(self, cache, keep) -> list:
+        """
+        Keys to evict so the cache fits its budget, never 'keep', the key just added, which may be None.
+
+        Args:
+            cache (OrderedDict): The entries, least recently used first
+        """
+        pass
+
+
+class LruPolicy(EvictionPolicy):
+    """Evicts the least recently used entries once the cache holds more than 'max_entries', CacheUtil's dict order is its recency order."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        return
+
+    def reset(self):
+        return
+
+    def on_add(self, key, value):
+        return
+
+    def on_get(self, key):
+        return
+
+    def on_remove(self, key):
+        return
+
+    def victims(self, cache, keep):
+        over = len(cache) - self.max_entries
+        return [key for key in itertools.islice(cache.keys(), max(0, over) + 1) if key != keep][:max(0, over)]
+
+
+class GroupSlruPolicy(EvictionPolicy):
+    """
+    Segmented LRU over groups of entries, by default the entries of one stock symbol, bounded by the bytes of the entries
+    (see entry_size), so one large entry weighs as much as many small ones.
+
+    A new group enters the probation segment, a read of any of its entries promotes it to the protected segment.
+    The protected segment holds at most 'protected_share' of the budget, the groups it pushes out go back to probation.
+    Over budget, whole groups are evicted from the least recently used end of probation first, then of protected:
+    a scan through many symbols used once, like a batch run over a watchlist, cycles through probation
+    and leaves the symbols read again alone.
+
+    The segments are not persisted, after a load every group starts in probation in LRU order.
+    """
+    def __init__(self, max_bytes, group_of=symbol_group, protected_share=0.8):
+        self.max_bytes = max_bytes
+        self.group_of = group_of
+        self.protected_share = protected_share
+        self.reset()
+        return
+
+    def reset(self):
+        self._probation = OrderedDict()  # groups, least recently used first
+        self._protected = OrderedDict()
+        self._groupKeys = {}  # group: OrderedDict of key: size
+        self._groupBytes = {}
+        self._protectedBytes = 0
+        self.bytes = 0
+        return
+
+    def _resize(self, group, delta):
+        self._groupBytes[group] = self._groupBytes.get(group, 0) + delta
+        self.bytes += delta
+        if group in self._protected:
+            self._protectedBytes += delta
+        return
+
+    def on_add(self, key, value):
+        group = self.group_of(key)
+        keys = self._groupKeys.setdefault(group, OrderedDict())
+        size = entry_size(key, value)
+        oldSize = keys.pop(key, 0)
+        keys[key] = size
+        self._resize(group, size - oldSize)
+
+        if group in self._protected:
+            self._protected.move_to_end(group)
+        else:
+            self._probation[group] = None
+            self._probation.move_to_end(group)
+        return
+
+    def on_get(self, key):
+        group = self.group_of(key)
+        if group not in self._groupKeys:
+            return
+        self._groupKeys[group].move_to_end(key)
+
+        if group in self._protected:
+            self._protected.move_to_end(group)
+            return
+
+        #second use of the group, promote it:
+        self._probation.pop(group, None)
+        self._protected[group] = None
+        self._protectedBytes += self._groupBytes[group]
+        while self._protectedBytes > self.protected_share * self.max_bytes and len(self._protected) > 1:
+            demoted, _ = self._protected.popitem(last=False)
+            self._protectedBytes -= self._groupBytes[demoted]
+            self._probation[demoted] = None
+        return
+
+    def on_remove(self, key):
+        group = self.group_of(key)
+        keys = self._groupKeys.get(group)
+        if keys is None or key not in keys:
+            return
+        self._resize(group, -keys.pop(key))
+
+        if not keys:
+            if group in self._protected:
+                self._protectedBytes -= self._groupBytes[group]
+                self._protected.pop(group)
+            self._probation.pop(group, None)
+            del self._groupKeys[group]
+            del self._groupBytes[group]
+        return
+
+    def victims(self, cache, keep):
+        over = self.bytes - self.max_bytes
+        if over <= 0:
+            return []
+
+        keepGroup = self.group_of(keep) if keep is not None else None
+        victims = []
+        for segment in (self._probation, self._protected):
+            for group in segment:
+                if over <= 0:
+                    break
+                if group == keepGroup:
+                    continue
+                victims.extend(self._groupKeys[group])
+                over -= self._groupBytes[group]
+
+        if over > 0 and keepGroup is not None:
+            #the group of the new entry alone is over budget, drop its least recently used entries but the new one:
+            for key, size in self._groupKeys[keepGroup].items():
+                if over <= 0:
+                    break
+                if key != keep:
+                    victims.append(key)
+                    over -= size
+        return victims
+
+
 class KeyGenerator(ABC):
     """Abstract base class for cache key generators"""
     @abstractmethod
@@ -135,12 +857,18 @@ class StockNewsKeyGenerator(KeyGenerator):
         #get the current date in format YYYY-MM-DD
         current_date = datetime.now().strftime("%Y-%m-%d")
 
-        #key is stock_symbol:current_date:days
-        return f"{stock_symbol}:{current_date}:{days}"
+        #key is stock_symbol:current_date:days, days zero-padded so the windows of a symbol sort by width in get_range:
+        return f"{stock_symbol}:{current_date}:{int(days):03d}"
     
 
 class StockPriceKeyGenerator(KeyGenerator):
     """Key generator for stock price application"""
     def generate_key(self, stock_symbol, day):
         #key is stock_symbol:day
-        return f"{stock_symbol}:{day}"
\ No newline at end of file
+        return f"{stock_symbol}:{day}"
+
+class NewsShardKeyGenerator(KeyGenerator):
+    """Key generator for the raw news of one stock on one publish date"""
+    def generate_key(self, stock_symbol, day):
+        #key is stock_symbol:day
+        return f"{stock_symbol}:{day}"
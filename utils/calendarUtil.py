@@ -0,0 +1,200 @@
+import os
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from utils.logUtil import setup_logger
+
+logger = setup_logger("calendarUtil")
+
+
+CalendarFile = 'data/nyseSessions.npy'
+FirstYear = 1990
+LastYear = 2050
+
+#unscheduled full-day closures of NYSE and Nasdaq
+SpecialClosures = [
+    "1985-09-27",  # Hurricane Gloria
+    "1994-04-27",  # President Nixon's funeral
+    "2001-09-11", "2001-09-12", "2001-09-13", "2001-09-14",  # September 11
+    "2004-06-11",  # President Reagan's funeral
+    "2007-01-02",  # President Ford's funeral
+    "2012-10-29", "2012-10-30",  # Hurricane Sandy
+    "2018-12-05",  # President George H. W. Bush's funeral
+    "2025-01-09",  # President Carter's funeral
+]
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    #n-th given weekday (Monday is 0) of the month, n = -1 for the last one
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + (n - 1) * 7)
+    last = (date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    #anonymous Gregorian algorithm
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(holiday: date) -> date:
+    #a holiday on Saturday is observed on Friday, on Sunday on Monday
+    if holiday.weekday() == 5:
+        return holiday - timedelta(days=1)
+    if holiday.weekday() == 6:
+        return holiday + timedelta(days=1)
+    return holiday
+
+
+def nyse_holidays(year: int) -> List[date]:
+    """
+    Rule-based full-day market holidays of NYSE and Nasdaq in a year.
+
+    Returns:
+        A sorted list of dates.
+    """
+    holidays = []
+
+    #New Year's Day is not observed on the Friday before when it falls on Saturday:
+    newYear = date(year, 1, 1)
+    if newYear.weekday() != 5:
+        holidays.append(_observed(newYear))
+
+    if year >= 1998:
+        holidays.append(_nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    holidays.append(_nth_weekday(year, 2, 0, 3))  # Washington's Birthday
+    holidays.append(_easter(year) - timedelta(days=2))  # Good Friday
+    holidays.append(_nth_weekday(year, 5, 0, -1))  # Memorial Day
+    if year >= 2022:
+        holidays.append(_observed(date(year, 6, 19)))  # Juneteenth
+    holidays.append(_observed(date(year, 7, 4)))  # Independence Day
+    holidays.append(_nth_weekday(year, 9, 0, 1))  # Labor Day
+    holidays.append(_nth_weekday(year, 11, 3, 4))  # Thanksgiving Day
+    holidays.append(_observed(date(year, 12, 25)))  # Christmas Day
+
+    return sorted(holidays)
+
+
+def is_rule_session(day: date) -> bool:
+    """Whether a day is a session by the holiday rules and the special closures, for days outside of the calendar range."""
+    return day.weekday() < 5 and day not in nyse_holidays(day.year) and day.isoformat() not in SpecialClosures
+
+
+def generate_sessions(firstYear: int, lastYear: int) -> np.ndarray:
+    """
+    Generate the trading sessions of NYSE and Nasdaq: weekdays that are not holidays or special closures.
+
+    Returns:
+        A sorted datetime64[D] array of the sessions from January 1st of 'firstYear' to December 31st of 'lastYear'.
+    """
+    days = np.arange(np.datetime64(f"{firstYear}-01-01"), np.datetime64(f"{lastYear + 1}-01-01"), dtype="datetime64[D]")
+    weekdays = np.is_busday(days)
+
+    closed = [holiday for year in range(firstYear, lastYear + 1) for holiday in nyse_holidays(year)]
+    closed = np.array(closed + SpecialClosures, dtype="datetime64[D]")
+    return days[weekdays & ~np.isin(days, closed)]
+
+
+class TradingCalendar:
+    """
+    Sorted array of trading sessions with O(1) lookups of the session on or before any day,
+    through a table holding that session's index for every calendar day of the range.
+    """
+    def __init__(self, sessions: np.ndarray):
+        self.sessions = np.asarray(sessions, dtype="datetime64[D]")
+        self.first = self.sessions[0]
+        self.last = self.sessions[-1]
+
+        days = np.arange(self.first, self.last + 1, dtype="datetime64[D]")
+        self._lastSessionIndex = np.searchsorted(self.sessions, days, side="right") - 1
+        return
+
+
+    def covers(self, day) -> bool:
+        day = np.datetime64(day, "D")
+        #the previous session of the first session is not known
+        return self.first < day <= self.last
+
+
+    def is_session(self, day) -> bool:
+        day = np.datetime64(day, "D")
+        if not self.first <= day <= self.last:
+            return False
+        return self.sessions[self._lastSessionIndex[(day - self.first).astype(int)]] == day
+
+
+    def session_pairs(self, days: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized lookup of the closest session on or before each day and the session before that one.
+
+        Args:
+            days: Dates as 'YYYY-MM-DD' strings or datetime64 values, within the calendar range.
+
+        Returns:
+            A tuple of two datetime64[D] arrays: the closest sessions and the previous sessions.
+        """
+        days = np.asarray(list(days), dtype="datetime64[D]")
+        if days.size and (days.min() <= self.first or days.max() > self.last):
+            raise ValueError(f"Dates out of the calendar range {self.first} to {self.last}")
+
+        closest = self._lastSessionIndex[(days - self.first).astype(int)]
+        return (self.sessions[closest], self.sessions[closest - 1])
+
+
+    def closest_session(self, day) -> str:
+        return str(self.session_pairs([day])[0][0])
+
+
+    def previous_session(self, day) -> str:
+        return str(self.session_pairs([day])[1][0])
+
+
+    def sessions_between(self, start, end) -> np.ndarray:
+        """Sessions from 'start' to 'end', both inclusive."""
+        low = np.searchsorted(self.sessions, np.datetime64(start, "D"), side="left")
+        high = np.searchsorted(self.sessions, np.datetime64(end, "D"), side="right")
+        return self.sessions[low:high]
+
+
+_calendar: Optional[TradingCalendar] = None
+
+
+def get_calendar() -> TradingCalendar:
+    """
+    The NYSE/Nasdaq calendar, loaded from CalendarFile if it was generated offline,
+    otherwise generated for FirstYear to LastYear on first use.
+    """
+    global _calendar
+    if _calendar is None:
+        sessions = None
+        if os.path.exists(CalendarFile):
+            try:
+                sessions = np.load(CalendarFile, allow_pickle=False)
+            except (OSError, ValueError):
+                logger.error(f"Failed to load trading calendar from {CalendarFile}")
+        if sessions is None:
+            sessions = generate_sessions(FirstYear, LastYear)
+        _calendar = TradingCalendar(sessions)
+    return _calendar
+
+
+# Generate the calendar file offline: python -m utils.calendarUtil [firstYear] [lastYear]
+if __name__ == "__main__":
+    import sys
+
+    firstYear = int(sys.argv[1]) if len(sys.argv) > 1 else FirstYear
+    lastYear = int(sys.argv[2]) if len(sys.argv) > 2 else LastYear
+    sessions = generate_sessions(firstYear, lastYear)
+    np.save(CalendarFile, sessions)
+    print(f"Saved {len(sessions)} sessions from {sessions[0]} to {sessions[-1]} to {CalendarFile}")
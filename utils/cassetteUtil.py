@@ -0,0 +1,212 @@
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from utils.logUtil import setup_logger
+
+logger = setup_logger("cassetteUtil")
+
+
+#query parameters never written to a cassette:
+SecretParams = {"apikey", "apiKey", "token"}
+#query parameters left out when matching a replayed request, they move with the day of the run:
+VolatileParams = {"from", "to"}
+
+
+def request_key(url: str, params: Optional[dict] = None) -> str:
+    """Host, path and sorted query parameters of a request, without secrets and date ranges."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({key: str(value) for key, value in (params or {}).items()})
+    kept = sorted((key, value) for key, value in query.items() if key not in SecretParams and key not in VolatileParams)
+    return f"{parts.netloc}{parts.path}?{urlencode(kept)}"
+
+
+def messages_digest(messages: List[Any]) -> str:
+    #short digest of the role and content of the messages sent to the LLM:
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(f"{message.role}:{message.content or ''}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class Cassette:
+    """
+    HTTP exchanges and LLM turns of one stock event run, saved as gzipped JSON.
+
+    Recording: get_http_request and get_http_request_async add every request with its JSON response and duration,
+    the workflow adds every LLM turn seen in its event stream: a digest of the messages, the response and its latency.
+
+    Replaying: requests are answered from the cassette instead of the network, in the recorded order of each request key,
+    after the recorded duration times 'time_scale' (0 replays as fast as possible), and replay_llm() answers the LLM turns in order.
+    """
+    def __init__(self, cassette_file: str, replaying: bool = False, time_scale: float = 1.0):
+        self.cassette_file = cassette_file
+        self.replaying = replaying
+        self.time_scale = time_scale
+        self.attrs: Dict[str, Any] = {}
+        self.http: List[dict] = []
+        self.llm: List[dict] = []
+        self.stats = {"httpMatched": 0, "httpMissed": 0, "llmMatched": 0, "llmDiverged": 0}
+
+        self._responses: Dict[str, Deque[dict]] = {}
+        self._nextTurn = 0
+        self._turnStart = time.perf_counter()
+        self._turnDigest = ""
+        self._turnMessages = 0
+        return
+
+
+    @classmethod
+    def load(cls, cassette_file: str, time_scale: float = 1.0) -> "Cassette":
+        cassette = cls(cassette_file, replaying=True, time_scale=time_scale)
+        with gzip.open(cassette_file, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        cassette.attrs = data["attrs"]
+        cassette.http = data["http"]
+        cassette.llm = data["llm"]
+        for exchange in cassette.http:
+            cassette._responses.setdefault(exchange["key"], deque()).append(exchange)
+        logger.info(f"Loaded {len(cassette.http)} HTTP exchanges and {len(cassette.llm)} LLM turns from {cassette_file}")
+        return cassette
+
+
+    def save(self):
+        data = {"version": 1, "attrs": self.attrs, "http": self.http, "llm": self.llm}
+        with gzip.open(self.cassette_file, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, separators=(",", ":"))
+        logger.info(f"Saved {len(self.http)} HTTP exchanges and {len(self.llm)} LLM turns to {self.cassette_file}")
+        return
+
+
+    def record_http(self, url: str, params: Optional[dict], response: Optional[Dict[str, Any]], seconds: float):
+        self.http.append({"key": request_key(url, params), "seconds": round(seconds, 4), "response": response})
+        return
+
+
+    def _next_response(self, url: str, params: Optional[dict]) -> Optional[dict]:
+        key = request_key(url, params)
+        recorded = self._responses.get(key)
+        if not recorded:
+            self.stats["httpMissed"] += 1
+            logger.warning(f"No recorded response for {key}")
+            return None
+        self.stats["httpMatched"] += 1
+        #a request repeated more often than recorded gets the last response again:
+        return recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+
+    async def replay_http_async(self, url: str, params: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+        exchange = self._next_response(url, params)
+        if exchange is None:
+            return None
+        await asyncio.sleep(exchange["seconds"] * self.time_scale)
+        return exchange["response"]
+
+
+    def replay_http(self, url: str, params: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+        exchange = self._next_response(url, params)
+        if exchange is None:
+            return None
+        time.sleep(exchange["seconds"] * self.time_scale)
+        return exchange["response"]
+
+
+    def observe(self, event: Any):
+        """Record the LLM turns of an AgentWorkflow stream, from its AgentInput and AgentOutput events."""
+        if self.replaying:
+            return
+
+        from llama_index.core.agent.workflow import AgentInput, AgentOutput
+
+        if isinstance(event, AgentInput):
+            self._turnStart = time.perf_counter()
+            self._turnDigest = messages_digest(event.input)
+            self._turnMessages = len(event.input)
+        elif isinstance(event, AgentOutput):
+            self.llm.append({
+                "agent": event.current_agent_name,
+                "digest": self._turnDigest,
+                "messages": self._turnMessages,
+                "seconds": round(time.perf_counter() - self._turnStart, 4),
+                "content": event.response.content or "",
+                "tool_calls": [{"id": call.tool_id, "name": call.tool_name, "kwargs": call.tool_kwargs} for call in event.tool_calls],
+            })
+        return
+
+
+    def next_turn(self, messages: List[Any]) -> Optional[dict]:
+        """The next recorded LLM turn, or None once they are used up. Turns asked with other messages than recorded count as diverged."""
+        if self._nextTurn >= len(self.llm):
+            return None
+        turn = self.llm[self._nextTurn]
+        self._nextTurn += 1
+        if messages_digest(messages) == turn["digest"]:
+            self.stats["llmMatched"] += 1
+        else:
+            self.stats["llmDiverged"] += 1
+            logger.warning(f"LLM turn {self._nextTurn} diverged from the cassette")
+        return turn
+
+
+_currentCassette: ContextVar[Optional[Cassette]] = ContextVar("cassette", default=None)
+
+
+def current_cassette() -> Optional[Cassette]:
+    return _currentCassette.get()
+
+
+@contextmanager
+def use_cassette(cassette: Cassette) -> Iterator[Cassette]:
+    """
+    Record to or replay from the cassette everything done in this context, including the tasks and threads it starts.
+    A recording cassette is saved at the end.
+    """
+    token = _currentCassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _currentCassette.reset(token)
+        if not cassette.replaying:
+            cassette.save()
+
+
+def replay_llm(cassette: Cassette):
+    """A function calling LLM answering with the recorded LLM turns of the cassette, after their recorded latency times the time scale."""
+    from llama_index.core.llms import ChatMessage, ChatResponse, MessageRole
+    from llama_index.core.llms.mock import MockFunctionCallingLLM
+    from llama_index.core.tools import ToolSelection
+
+    def next_message(messages) -> Tuple[ChatMessage, float]:
+        turn = cassette.next_turn(messages)
+        if turn is None:
+            return (ChatMessage(role=MessageRole.ASSISTANT, content="The cassette has no more LLM turns."), 0.0)
+        toolCalls = [ToolSelection(tool_id=call["id"], tool_name=call["name"], tool_kwargs=call["kwargs"]) for call in turn["tool_calls"]]
+        return (ChatMessage(role=MessageRole.ASSISTANT, content=turn["content"], additional_kwargs={"tool_calls": toolCalls}), turn["seconds"])
+
+    class ReplayLLM(MockFunctionCallingLLM):
+        def chat(self, messages, **kwargs) -> ChatResponse:
+            message, seconds = next_message(messages)
+            time.sleep(seconds * cassette.time_scale)
+            return ChatResponse(message=message, delta=message.content or "")
+
+        async def achat(self, messages, **kwargs) -> ChatResponse:
+            message, seconds = next_message(messages)
+            await asyncio.sleep(seconds * cassette.time_scale)
+            return ChatResponse(message=message, delta=message.content or "")
+
+        async def astream_chat(self, messages, **kwargs):
+            response = await self.achat(messages, **kwargs)
+
+            async def gen():
+                yield response
+
+            return gen()
+
+    return ReplayLLM()
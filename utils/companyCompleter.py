@@ -1,28 +1,261 @@
-from typing import Optional, Tuple
+import re
+import heapq
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from prompt_toolkit import prompt
 from prompt_toolkit.completion import Completer, Completion
 from prompt_toolkit.shortcuts import CompleteStyle
 from prompt_toolkit.document import Document
+from utils.tickerStore import TickerStore
+
+
+MaxCompletions = 50
+NgramSize = 3
+
+_tokenPattern = re.compile(r"[a-z0-9]+")
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: List[int] = []  # ids of every ticker below this node, in ticker order
+
+
+class CompanyIndex:
+    """
+    Prebuilt search index over a list of (ticker, name) pairs or a TickerStore.
+
+    Results are ranked as: exact ticker > ticker prefix > name-word prefix > substring,
+    and capped to 'limit' entries, so a lookup only touches the matching part of the index
+    instead of the whole company list.
+    """
+    def __init__(self, companies: Iterable[Tuple[str, str]], limit: int = MaxCompletions):
+        self.limit = limit
+        #a TickerStore is used in place, other inputs are copied once:
+        self.companies = companies if isinstance(companies, TickerStore) else [tuple(company) for company in companies]
+
+        self._exact: Dict[str, List[int]] = {}
+        self._trie = _TrieNode()
+        self._tokenIds: Dict[str, List[int]] = {}  # name word -> ids of names containing it
+        self._nameTokens: List[Tuple[str, ...]] = []
+        self._ngrams: Dict[str, Set[int]] = {}
+        self._haystacks: List[str] = []
+        self._tickers: List[str] = []
+
+        for i, (ticker, name) in enumerate(self.companies):
+            self._add(i, ticker, name)
+
+        #sort trie id lists by ticker so prefix results come out ordered:
+        ids = range(len(self._haystacks))
+        self._tickerRank = self._ranks(sorted(ids, key=lambda i: (len(self._tickers[i]), self._tickers[i])))
+        self._nameRank = self._ranks(sorted(ids, key=lambda i: self._haystacks[i][len(self._tickers[i]) + 1:]))
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            node.ids.sort(key=self._tickerRank.__getitem__)
+            stack.extend(node.children.values())
+
+        for ids in self._tokenIds.values():
+            ids.sort(key=self._nameRank.__getitem__)
+        self._tokenKeys = sorted(self._tokenIds)
+        return
+
+
+    @staticmethod
+    def _ranks(order: List[int]) -> List[int]:
+        rank = [0] * len(order)
+        for position, i in enumerate(order):
+            rank[i] = position
+        return rank
+
+
+    def _add(self, i: int, ticker: str, name: str):
+        lowTicker = ticker.lower()
+        lowName = name.lower()
+
+        self._exact.setdefault(lowTicker, []).append(i)
+
+        node = self._trie
+        node.ids.append(i)
+        for ch in lowTicker:
+            node = node.children.setdefault(ch, _TrieNode())
+            node.ids.append(i)
+
+        tokens = tuple(set(_tokenPattern.findall(lowName)))
+        self._nameTokens.append(tokens)
+        for token in tokens:
+            self._tokenIds.setdefault(token, []).append(i)
+
+        haystack = f"{lowTicker}\n{lowName}"
+        self._haystacks.append(haystack)
+        self._tickers.append(lowTicker)
+        for start in range(len(haystack) - NgramSize + 1):
+            self._ngrams.setdefault(haystack[start:start + NgramSize], set()).add(i)
+        return
+
+
+    def _ticker_prefix(self, text: str) -> List[int]:
+        node = self._trie
+        for ch in text:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return node.ids
+
+
+    def _name_prefix(self, text: str) -> Iterator[int]:
+        queryTokens = _tokenPattern.findall(text)
+        if not queryTokens:
+            return
+
+        #drive the lookup by the longest query word, which usually has the fewest matches:
+        driver = max(queryTokens, key=len)
+        others = [token for token in queryTokens if token != driver]
+
+        start = bisect_left(self._tokenKeys, driver)
+        end = bisect_left(self._tokenKeys, driver + "\uffff", lo=start)
+        lists = [self._tokenIds[key] for key in self._tokenKeys[start:end]]
+
+        #lists are sorted by name, so merging them lazily stops as soon as the caller has enough:
+        for i in heapq.merge(*lists, key=self._nameRank.__getitem__):
+            #every other query word has to be a prefix of some word of the name as well:
+            if all(any(word.startswith(token) for word in self._nameTokens[i]) for token in others):
+                yield i
+        return
+
+
+    def _substring(self, text: str, limit: int) -> List[int]:
+        #queries shorter than one n-gram have no n-gram to look up, scan the haystacks instead;
+        #this only runs when the prefix tiers did not fill the result:
+        if len(text) < NgramSize:
+            matches = (i for i, haystack in enumerate(self._haystacks) if text in haystack)
+            return heapq.nsmallest(limit, matches, key=self._tickerRank.__getitem__)
+
+        grams = [self._ngrams.get(text[start:start + NgramSize]) for start in range(len(text) - NgramSize + 1)]
+        if not all(grams):
+            return []
+
+        #intersect from the rarest n-gram up, so the candidate set stays small:
+        grams.sort(key=len)
+        candidates = set(grams[0])
+        for ids in grams[1:]:
+            candidates &= ids
+            if not candidates:
+                return []
+        matches = (i for i in candidates if text in self._haystacks[i])
+        return heapq.nsmallest(limit, matches, key=self._tickerRank.__getitem__)
+
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Find companies matching the text by ticker or name.
+
+        Args:
+            text (str): The text the user typed, case insensitive.
+            limit (int): Maximum number of results, defaults to the index limit.
+
+        Returns:
+            A ranked list of (ticker, name) tuples.
+        """
+        limit = self.limit if limit is None else limit
+        text = text.strip().lower()
+        if not text:
+            return [self.companies[i] for i in range(min(limit, len(self.companies)))]
+
+        results: List[int] = []
+        seen: Set[int] = set()
+
+        #tiers are evaluated lazily, so lower ranked tiers are skipped once the result is full:
+        tiers = (
+            lambda: self._exact.get(text, []),
+            lambda: self._ticker_prefix(text),
+            lambda: self._name_prefix(text),
+            lambda: self._substring(text, limit + len(seen)),
+        )
+        for tier in tiers:
+            for i in tier():
+                if i not in seen:
+                    seen.add(i)
+                    results.append(i)
+                    if len(results) >= limit:
+                        return [self.companies[i] for i in results]
+
+        return [self.companies[i] for i in results]
+
+
+    def lookup(self, display: str) -> Optional[Tuple[str, str]]:
+        """Map a 'TICKER - Name' display string back to its (ticker, name) tuple."""
+        ticker = display.split(" - ", 1)[0]
+        for i in self._exact.get(ticker.lower(), []):
+            company = self.companies[i]
+            if f"{company[0]} - {company[1]}" == display:
+                return company
+        return None
+
+
+class BackgroundCompanyIndex:
+    """
+    Builds a CompanyIndex on a worker thread, so the ticker prompt shows right away instead of after the build,
+    which takes over half a second on the full listing. Searches and lookups wait for the build to finish.
+    """
+    def __init__(self, companies: Iterable[Tuple[str, str]], limit: int = MaxCompletions):
+        self._index: Optional[CompanyIndex] = None
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._build, args=(companies, limit), name="CompanyIndex", daemon=True)
+        self._thread.start()
+        return
+
+
+    def _build(self, companies, limit):
+        try:
+            self._index = CompanyIndex(companies, limit)
+        except BaseException as e:
+            self._error = e
+        return
+
+
+    @property
+    def index(self) -> CompanyIndex:
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._index
+
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        return self.index.search(text, limit)
+
+
+    def lookup(self, display: str) -> Optional[Tuple[str, str]]:
+        return self.index.lookup(display)
+
+
+def _as_index(companies):
+    return companies if isinstance(companies, (CompanyIndex, BackgroundCompanyIndex)) else CompanyIndex(companies)
 
 
 class CompanyCompleter(Completer):
     def __init__(self, companies):
         self.companies = companies
+        self.index = _as_index(companies)
 
     def get_completions(self, document: Document, complete_event):
-        text = document.text.lower()
-        for ticker, name in self.companies:
-            if text in ticker.lower() or text in name.lower():
-                display_text = f"{ticker} - {name}"
-                yield Completion(display_text, start_position=-len(text))
+        text = document.text
+        for ticker, name in self.index.search(text):
+            display_text = f"{ticker} - {name}"
+            yield Completion(display_text, start_position=-len(text))
 
 
 class CompanyInput:
     def __init__(self, companyList) -> Optional[Tuple[str, str]]:
         self.companyList = companyList
+        self.index = _as_index(companyList)
 
     def run(self):
-        completer = CompanyCompleter(self.companyList)
+        completer = CompanyCompleter(self.index)
         userInput = prompt(
             "Type to search tickers/companies. Tab/Arrow keys to select: \n",
             completer=completer,
@@ -30,12 +263,7 @@ class CompanyInput:
         )
 
         # Match selected input back to the original tuple
-        for ticker, name in self.companyList:
-            display = f"{ticker} - {name}"
-            if userInput == display:
-                return (ticker, name)
-
-        return None  # If somehow input doesn't match
+        return self.index.lookup(userInput)  # None if somehow input doesn't match
 
 
 # Example usage:
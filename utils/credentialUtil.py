@@ -0,0 +1,16 @@
+from functools import lru_cache
+
+
+CredentialFolder = 'credentials'
+
+
+@lru_cache(maxsize=None)
+def get_credential(name: str) -> str:
+    """
+    Read an API key from the credentials folder on first use, see the preparation section of the README.
+
+    Args:
+        name (str): The file name without extension, e.g. "finnhub" for credentials/finnhub.txt.
+    """
+    with open(f"{CredentialFolder}/{name}.txt", 'r') as f:
+        return f.read().strip()
@@ -1,137 +1,274 @@
 import os
 import json
-from prettytable import PrettyTable
-from typing import Optional, Tuple
-import requests
-import finnhub
-from llama_index.core.workflow import Context
-from utils.httpUtil import get_http_request
+import time
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from utils.httpUtil import get_http_request_async
 from utils.logUtil import setup_logger
-from utils.cacheUtil import CacheUtil, StockNewsKeyGenerator, StockPriceKeyGenerator
+from utils.cacheUtil import CacheUtil, StockNewsKeyGenerator, GroupSlruPolicy
+from utils.priceStore import PriceSeriesStore
+from utils.tickerStore import TickerStore, write_ticker_store, parse_listing
+from utils.flightUtil import SingleFlight
+from utils.rateUtil import scheduler, AlphaVantage, Finnhub, Throttled, RateLimitExceeded, alpha_vantage_throttled
+from utils.credentialUtil import get_credential
+from utils.traceUtil import count
 
 logger = setup_logger("finUtil")
 
 
-with open('credentials/finnhub.txt', 'r') as f:
-    finnhubKey = f.read().strip()
-    finnhubClient = finnhub.Client(api_key=finnhubKey)
+#keys and clients are created on first use, importing this module reads no file and opens no connection:
+_finnhubClient = None
 
-with open('credentials/alpha.vantage.txt', 'r') as f:
-    alphaVantageKey = f.read().strip()
+#API endpoints, benchmarks/benchOffline.py points them to local fixture servers:
+AlphaVantageUrl = "https://www.alphavantage.co/query"
+FinnhubUrl = "https://api.finnhub.io/api/v1"
 
 
+def get_finnhub_client():
+    global _finnhubClient
+    if _finnhubClient is None:
+        import finnhub
+        _finnhubClient = finnhub.Client(api_key=get_credential('finnhub'))
+        _finnhubClient.API_URL = FinnhubUrl
+    return _finnhubClient
 
-def get_company_list() -> list:
-    #check if data/tickers.csv exists
-    if os.path.exists('data/tickers.csv'):
-        pass
-    else:
-        with open("credentials/alpha.vantage.txt", "r") as f:
-            alpha_vantage_key = f.read().strip()
-        url = f"https://www.alphavantage.co/query?function=LISTING_STATUS&apikey={alpha_vantage_key}"
 
-        response = requests.get(url)
-        data = response.text
+#concurrent price fetches of one symbol are coalesced into a single Alpha Vantage request:
+priceFetchFlight = SingleFlight("priceFetch")
+#a close of the day of the last fetch may be published since, it is looked for again after this many seconds:
+PriceRefetchSeconds = 6 * 3600
 
-        logger.info(f"Save ticker list to data/tickers.csv")
 
-        #save first and second columns of data to a csv file in data folder
-        with open("data/tickers.csv", "w") as f:
-            for line in data.splitlines():
-                f.write(",".join(line.split(",")[:2]) + "\n")
+TickerCsvFile = 'data/tickers.csv'
+TickerStoreFile = 'data/tickers.bin'
+TickerRefreshDays = 7
 
-    companyList = []
-    with open("data/tickers.csv", "r") as f:
-        next(f) #skip the first line
-        for line in f:
-            companyList.append(line.strip().split(","))
+StockNewsCacheFile = 'data/stockNewsCache.json'
+#stock events are evicted by symbol once their json outgrows this many bytes:
+StockNewsCacheBytes = 2 * 1024 * 1024
+#events are looked up by the day they were cached on, older ones only take space:
+StockNewsTTL = 24 * 3600
+#widest window of past days a stock event cache key can hold:
+MaxEventWindowDays = 999
 
-    return companyList
+
+def download_listing() -> Optional[list]:
+    import requests
+
+    url = f"{AlphaVantageUrl}?function=LISTING_STATUS&apikey={get_credential('alpha.vantage')}"
+    try:
+        response = scheduler.call_blocking(AlphaVantage, requests.get, url, timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Failed to download ticker listing: {e}")
+        return None
+    except RateLimitExceeded as e:
+        logger.warning(f"Skip ticker listing download: {e}")
+        return None
+
+    listing = parse_listing(response.text)
+    if(len(listing) == 0):
+        #rate limited or invalid key, the response is a json message instead of csv:
+        logger.warning(f"Got no tickers from listing: {response.text[:200]}")
+        return None
+    return listing
+
+
+def refresh_company_list(store: TickerStore) -> None:
+    listing = download_listing()
+    if(listing == None):
+        return
+
+    summary = store.refresh(listing)
+    logger.info(f"Ticker listing refreshed: {summary}")
+
+    #mark the store as fresh even if nothing changed:
+    os.utime(store.store_file)
+    return
+
+
+def get_company_list() -> TickerStore:
+    #build the ticker store on first run, from data/tickers.csv if it exists or from a fresh listing otherwise:
+    if not os.path.exists(TickerStoreFile):
+        if os.path.exists(TickerCsvFile):
+            with open(TickerCsvFile, "r") as f:
+                listing = parse_listing(f.read())
+        else:
+            listing = download_listing()
+
+        #an empty store would look fresh and skip the refresh for TickerRefreshDays, try again on the next start instead:
+        if not listing:
+            logger.error(f"Got no ticker listing, {TickerStoreFile} is not created")
+            raise RuntimeError(f"No ticker listing available, add {TickerCsvFile} or check the Alpha Vantage key and budget")
+
+        logger.info(f"Save ticker list to {TickerStoreFile}")
+        write_ticker_store(TickerStoreFile, listing)
+
+    store = TickerStore(TickerStoreFile)
+
+    #apply new listings and delistings once the store gets old:
+    age = time.time() - os.path.getmtime(TickerStoreFile)
+    if(age > TickerRefreshDays * 24 * 3600):
+        refresh_company_list(store)
+
+    return store
     
 
+def _finnhub_quote(symbol: str) -> dict:
+    import finnhub
+
+    try:
+        return get_finnhub_client().quote(symbol)
+    except finnhub.FinnhubAPIException as e:
+        if(e.status_code == 429):
+            raise Throttled(str(e))
+        raise
+
+
+#quotes fetched less than QuoteTTL seconds ago are served from memory, shared by every caller of the process:
+QuoteTTL = 15.0
+MaxConcurrentQuotes = 8
+_quoteCache: Dict[str, Tuple[float, dict]] = {}
+_quoteLock = threading.Lock()
+_quoteStats = {"hits": 0, "misses": 0}
+
+
+def get_quote(symbol: str, max_age: float = QuoteTTL) -> dict:
+    """
+    Get the Finnhub quote of a symbol, from the quote cache if it was fetched less than 'max_age' seconds ago.
+
+    Returns:
+        The quote with the keys of Finnhub: "c" current price, "d" change, "dp" percent change,
+        "h" high and "l" low of the day, "o" open, "pc" previous close and "t" the time of the quote.
+    """
+    with _quoteLock:
+        cached = _quoteCache.get(symbol)
+        if cached != None and time.monotonic() - cached[0] < max_age:
+            _quoteStats["hits"] += 1
+            count("quoteCache.hit")
+            return cached[1]
+        _quoteStats["misses"] += 1
+    count("quoteCache.miss")
+
+    quote = scheduler.call_blocking(Finnhub, _finnhub_quote, symbol)
+    with _quoteLock:
+        _quoteCache[symbol] = (time.monotonic(), quote)
+    return quote
+
+
+async def get_quotes(symbols: List[str], max_age: float = QuoteTTL) -> Dict[str, Optional[dict]]:
+    """
+    Get the quotes of many symbols, fetching the ones not in the quote cache concurrently, at most MaxConcurrentQuotes at a time.
+
+    Returns:
+        The quote of each symbol, None for the symbols whose quote could not be fetched.
+    """
+    import finnhub
+    import requests
+
+    semaphore = asyncio.Semaphore(MaxConcurrentQuotes)
+
+    async def fetch(symbol):
+        #the finnhub client is synchronous, keep it off the event loop:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(get_quote, symbol, max_age)
+            except (Throttled, RateLimitExceeded, finnhub.FinnhubAPIException, finnhub.FinnhubRequestException, requests.exceptions.RequestException) as e:
+                logger.warning(f"Failed to get quote of {symbol}: {e}")
+                return None
+
+    quotes = await asyncio.gather(*(fetch(symbol) for symbol in symbols))
+    return dict(zip(symbols, quotes))
+
+
+def get_quote_stats() -> Dict[str, int]:
+    """Hit and miss counters of the quote cache of this process."""
+    with _quoteLock:
+        return dict(_quoteStats)
+
+
 def get_stock_quote(symbol: str) -> float:
-    return finnhubClient.quote(symbol)['c']
+    return get_quote(symbol)['c']
 
     
 
-async def get_stock_prices(ctx: Context, symbol: str, workday: str, previousWorkday: str) -> Tuple[Optional[float], Optional[float]]:
+async def fetch_daily_prices(priceStore: PriceSeriesStore, symbol: str) -> Optional[Dict[str, float]]:
     """
-    For a given stock symbol, get the stock price on the given date and price on the previous workday.
+    Fetch the daily close prices of a symbol from Alpha Vantage and merge them into the price store.
+    Concurrent fetches of the same symbol share one request.
+
+    Returns:
+        Close price by date in the format 'YYYY-MM-DD', or None if the prices could not be fetched.
+    """
+    return await priceFetchFlight.do(("TIME_SERIES_DAILY", symbol), _fetch_daily_prices, priceStore, symbol)
+
+
+def should_fetch_prices(priceStore: PriceSeriesStore, symbol: str, missingDates: List[str]) -> bool:
+    """
+    Whether fetching the daily series of a symbol can bring any of its missing close prices.
+
+    A date before the day of the last fetch was already looked for and is a holiday or out of the series,
+    a date after today is not traded yet. Only a date from the day of the last fetch up to today can be new,
+    and it is looked for at most every PriceRefetchSeconds.
 
     Args:
-        ctx (Context): The context between multi-agents.
-        symbol (str): The stock symbol.
-        workday (str): The date in the format 'YYYY-MM-DD'.
-        previousWorkday (str): The date in the format 'YYYY-MM-DD'.
+        missingDates: dates without a price in the store, in the format 'YYYY-MM-DD'.
+    """
+    if not missingDates:
+        return False
+    fetchedAt = priceStore.fetched_at(symbol)
+    if fetchedAt is None:
+        return True
+    if time.time() - fetchedAt < PriceRefetchSeconds:
+        return False
+    fetchDay = datetime.fromtimestamp(fetchedAt).strftime("%Y-%m-%d")
+    today = datetime.now().strftime("%Y-%m-%d")
+    return any(fetchDay <= date <= today for date in missingDates)
 
-    Returns:
-        A tuple of float of the close price of the stock
-        on the given date and the previous day.
-        If the price is not available, set it to None.
-    """
-    #check if prices can be got from cache:
-    current_state = await ctx.get("state")
-    if "stock_price_cache" not in current_state:
-        logger.error(f"No stock price cache found in context.")
-        return (None, None)
-    
-    stockPriceCache = current_state["stock_price_cache"]
-    workdayData = await stockPriceCache.get(symbol, workday)
-    previousWorkdayData = await stockPriceCache.get(symbol, previousWorkday)
-    if(workdayData != None and previousWorkdayData != None):
-        logger.info(f"Got stock price from cache for {symbol} on {workday} and {previousWorkday}")
-        return (workdayData, previousWorkdayData)
-
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol}&apikey={alphaVantageKey}"
+
+def get_price_fetch_stats() -> Dict[str, int]:
+    """Hit, miss and coalesced counters of the price fetches of this process."""
+    return dict(priceFetchFlight.stats)
+
+
+async def _fetch_daily_prices(priceStore: PriceSeriesStore, symbol: str) -> Optional[Dict[str, float]]:
+    url = f"{AlphaVantageUrl}?function=TIME_SERIES_DAILY&symbol={symbol}&apikey={get_credential('alpha.vantage')}"
     try:
-        httpData = get_http_request(url=url)
+        httpData = await scheduler.call(AlphaVantage, get_http_request_async, url=url, is_throttled=alpha_vantage_throttled)
+    except RateLimitExceeded as e:
+        logger.warning(f"{e}")
+        return None
     except Exception as e:
         logger.warning(f"Something went wrong: {e}")
-        return (None, None)
+        return None
+
+    if(httpData == None):
+        return None
     
     #check if httpData has a key 'Information':
     if('Information' in httpData):
         #check if the value contains 'rate limit':
         if('rate limit' in httpData['Information']):
             logger.warning(f"{httpData['Information']}")
-            return (None, None)
-
-    #save all valid data to cache
-    count = 0
-    priceDataDict = httpData['Time Series (Daily)']
-    for date in priceDataDict:
-        await stockPriceCache.add(float(priceDataDict[date]["4. close"]), symbol, date)
-        count += 1
-    logger.info(f"Saved {count} stock prices to cache for {symbol}")
-
-    #save prices cache to file:
-    await stockPriceCache.save_to_file()
-
-    #save prices cache to context:
-    current_state["stock_price_cache"] = stockPriceCache
-    await ctx.set("state", current_state)
-    
-    workdayData = httpData['Time Series (Daily)'].get(workday)
-    previousWorkdayData = httpData['Time Series (Daily)'].get(previousWorkday)
+            return None
 
-    if(not workdayData):
-        logger.warning(f"Could not find stock price for {symbol} on {workday}")
-        workdayData = 0.0
-    else:
-        workdayData = float(workdayData["4. close"])
-    if(not previousWorkdayData):
-        logger.warning(f"Could not find stock price for {symbol} on {previousWorkday}")
-        previousWorkdayData = 0.0
-    else:
-        previousWorkdayData = float(previousWorkdayData["4. close"])
+    #save the whole daily series of the symbol to the price store:
+    timeSeries = httpData['Time Series (Daily)']
+    priceDataDict = {date: float(timeSeries[date]["4. close"]) for date in timeSeries}
+    storedCount = priceStore.update(symbol, priceDataDict)
+    priceStore.mark_fetched(symbol)
+    logger.info(f"Price store holds {storedCount} stock prices for {symbol}")
 
-    if(workdayData and previousWorkdayData):
-        logger.info(f"Getting price for {symbol} on {workday} and {previousWorkday}: {workdayData}, {previousWorkdayData}")
-
-    return (workdayData, previousWorkdayData)
+    #save price store to file:
+    await priceStore.save()
+    return priceDataDict
 
 
 def format_stock_event_string_to_table(stockEvent: str):
+    from prettytable import PrettyTable
+
     #get the json format string
     stockEvent = json.loads(stockEvent)
 
@@ -155,43 +292,6 @@ def format_stock_event_string_to_table(stockEvent: str):
     return
 
 
-async def format_stock_event_string(ctx: Context) -> str:
-    """
-    For a stock event representd in json format string, format it to a table.
-
-    Args:
-        ctx(Context) : The context between multi-agents. The stock event is saved in the context in the following format:
-        stockEvent(str) : The stock event representd in json format string. It has the following format:
-            {{
-            "stock_symbol": companyTicker,
-            "past_days": pastDays,
-            "stock_total_events": total_number,
-            "stock_price_events": [
-                {{
-                "time": "yyyy-mm-dd",
-                "summary": "brief summary of the event",
-                "previous": "the stock price of the previous workday. If price is not available, return None",
-                "close": "the stock price of the closest workday. If price is not available, return None"
-                }}
-            ]
-            }}
-
-    Returns:
-        A string indicating the stock event has been formatted
-    """
-    current_state = await ctx.get("state")
-    if "stock_events" not in current_state:
-        logger.error("No stock events found in context.")
-        return None
-
-    stockEvent = current_state["stock_events"]
-    logger.info(f"Formatting and print stock event")
-    format_stock_event_string_to_table(stockEvent)
-    return "Stock event formatted and printed"
-    
-
-
-
 async def save_stock_event_to_cache(stockEvent: str) -> str:
     """
     For a stock event representd in json format string, save it to a cache file.
@@ -217,28 +317,131 @@ async def save_stock_event_to_cache(stockEvent: str) -> str:
     """
     stockEvent = json.loads(stockEvent)
 
+    #the cache key is made of its symbol and window, a malformed event must not reach it:
+    errors = validate_stock_event(stockEvent)
+    if errors:
+        return f"Stock event does not match the JSON format: {'; '.join(errors)}. Fix it and call this tool again."
+
     #if stock_price_events is empty, then don't save to cache:
     if(len(stockEvent["stock_price_events"]) == 0):
         return "No stock price events found in stock event"
     
     #save to cache:
-    stock_symbol = stockEvent["stock_symbol"]
-    past_days = stockEvent["past_days"]
-    keyGenerator = StockNewsKeyGenerator()
-    stockNewsCache = CacheUtil(100, 'data/stockNewsCache.json', keyGenerator)
+    stockNewsCache = create_stock_news_cache()
     await stockNewsCache.load_cache()
 
+    await store_stock_event(stockNewsCache, stockEvent)
+    return "Stock news saved to cache file"
+
+
+def create_stock_news_cache() -> CacheUtil:
+    return CacheUtil(100, StockNewsCacheFile, StockNewsKeyGenerator(), policy=GroupSlruPolicy(StockNewsCacheBytes), ttl=StockNewsTTL)
+
+
+async def store_stock_event(stockNewsCache: CacheUtil, stockEvent: dict):
+    """Add a stock event to an already loaded stock news cache and save it."""
+    stock_symbol = stockEvent["stock_symbol"]
+    past_days = stockEvent["past_days"]
     await stockNewsCache.add(stockEvent, stock_symbol, past_days)
     logger.info(f"Added stock news to cache by: {stock_symbol}, {past_days}")
     await stockNewsCache.save_to_file()
-    return "Stock news saved to cache file"
+    return
+
+
+def validate_stock_event(stockEvent: Any) -> List[str]:
+    """
+    Check a stock event against the JSON format of the prompts.
+
+    Returns:
+        The list of problems found, empty if the stock event is valid.
+    """
+    if not isinstance(stockEvent, dict):
+        return ["the stock event is not a JSON object"]
+
+    errors = []
+    for field, fieldType in (("stock_symbol", str), ("past_days", int), ("stock_total_events", int), ("stock_price_events", list)):
+        if not isinstance(stockEvent.get(field), fieldType):
+            errors.append(f"missing or invalid '{field}'")
+    if errors:
+        return errors
+
+    events = stockEvent["stock_price_events"]
+    if stockEvent["stock_total_events"] != len(events):
+        errors.append(f"'stock_total_events' is {stockEvent['stock_total_events']} but there are {len(events)} events")
+
+    for i, event in enumerate(events):
+        if not isinstance(event, dict):
+            errors.append(f"event {i} is not a JSON object")
+            continue
+        try:
+            datetime.strptime(str(event.get("time")), "%Y-%m-%d")
+        except ValueError:
+            errors.append(f"event {i} has no 'time' in the format yyyy-mm-dd")
+        if not isinstance(event.get("summary"), str) or not event["summary"].strip():
+            errors.append(f"event {i} has no 'summary'")
+        for field in ("previous", "close"):
+            try:
+                float(event.get(field))
+            except (TypeError, ValueError):
+                errors.append(f"event {i} has no price in '{field}'")
+    return errors
+
+
+def filter_stock_events(stockEvent: dict, pastDays: int) -> dict:
+    """Narrow a stock event of a wider window down to the events of the past 'pastDays' days."""
+    since = (datetime.now() - timedelta(days=pastDays)).strftime("%Y-%m-%d")
+    events = [event for event in stockEvent["stock_price_events"] if event["time"] >= since]
+    return {**stockEvent, "past_days": pastDays, "stock_total_events": len(events), "stock_price_events": events}
+
+
+def merge_stock_events(stockEvent: dict, cachedEvent: dict) -> dict:
+    """
+    Merge the cached events of a narrower window into a fresh stock event covering the older days.
+    For a date in both, the cached event is kept.
+    """
+    cachedTimes = {event["time"] for event in cachedEvent["stock_price_events"]}
+    events = cachedEvent["stock_price_events"] + [event for event in stockEvent["stock_price_events"] if event["time"] not in cachedTimes]
+    events.sort(key=lambda x: x["time"])
+    return {**stockEvent, "stock_total_events": len(events), "stock_price_events": events}
+
+
+async def find_cached_stock_events(stockNewsCache: CacheUtil, symbol: str, pastDays: int) -> Tuple[Optional[dict], int]:
+    """
+    Find stock events of a symbol cached today that can answer a window of 'pastDays' days.
+
+    Returns:
+        A tuple of the stock event and the number of past days it covers:
+        - a wider or equal window is filtered down to 'pastDays', covering all of them
+        - otherwise the widest narrower window is returned as is, the older days still need a fresh run
+        - (None, 0) if no window of the symbol is cached today
+    """
+    entries = await stockNewsCache.get_range((symbol, 0), (symbol, MaxEventWindowDays))
+    if(len(entries) == 0):
+        return (None, 0)
+
+    #the days of a window are the last part of its key:
+    windows = sorted(((int(key.rsplit(":", 1)[1]), stockEvent) for key, stockEvent in entries), key=lambda x: x[0])
+    for days, stockEvent in windows:
+        if(days >= pastDays):
+            return (filter_stock_events(stockEvent, pastDays), pastDays)
+
+    days, stockEvent = windows[-1]
+    return (stockEvent, days)
+
+
+_priceStore: Optional[PriceSeriesStore] = None
+_priceStoreLock = asyncio.Lock()
 
 
-async def load_stock_price_from_cache() -> CacheUtil:
-    keyGenerator = StockPriceKeyGenerator()
-    stockPriceCache = CacheUtil(1000, 'data/stockPriceCache.json', keyGenerator)
-    await stockPriceCache.load_cache()
-    return stockPriceCache
+async def load_price_store() -> PriceSeriesStore:
+    #one store per process, so concurrent workflows share its prices and do not overwrite each other's saves:
+    global _priceStore
+    async with _priceStoreLock:
+        if _priceStore is None:
+            priceStore = PriceSeriesStore('data/stockPrices.npz')
+            await priceStore.load()
+            _priceStore = priceStore
+    return _priceStore
 
 
 
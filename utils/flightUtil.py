@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from utils.logUtil import setup_logger
+
+logger = setup_logger("flightUtil")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight call.
+
+    The first caller for a key starts the call, callers arriving while it runs wait for it
+    and get the same result (or exception). The key is free again as soon as the call finishes.
+
+    Counters:
+        hits: requests served without a call, reported by the caller through record_hit
+        misses: requests that started a call
+        coalesced: requests that waited on a call already in flight
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        return
+
+
+    def record_hit(self):
+        self.stats["hits"] += 1
+        return
+
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Run 'func(*args, **kwargs)' unless a call with the same key is already in flight, in which case wait for that one.
+
+        Returns:
+            The result of the call.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            logger.info(f"{self.name}: joined in-flight call for {key}")
+        else:
+            self.stats["misses"] += 1
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        #shield the shared call, so one cancelled caller does not cancel it for the others:
+        return await asyncio.shield(task)
+
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
@@ -1,24 +1,64 @@
-import requests
-from requests.exceptions import HTTPError, ConnectionError, Timeout, RequestException
-from typing import Optional, Dict, Any
+import time
+import asyncio
+from typing import TYPE_CHECKING, Optional, Dict, Any
 from utils.logUtil import setup_logger
+from utils.rateUtil import Throttled
+from utils.traceUtil import span
+from utils.cassetteUtil import current_cassette
+
+#requests and aiohttp are imported on first use, they are a good part of the startup time of the apps:
+if TYPE_CHECKING:
+    import aiohttp
 
 logger = setup_logger("httpUtil")
 
 
+#connection pool and timeouts of the async client, in seconds:
+MaxConnections = 20
+MaxConnectionsPerHost = 4
+KeepAliveSeconds = 30
+TotalTimeout = 30
+ConnectTimeout = 10
+
+_session: Optional["aiohttp.ClientSession"] = None
+_sessionLoop: Optional[asyncio.AbstractEventLoop] = None
+
+
 def get_http_request(url: str, params: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+    cassette = current_cassette()
+    if cassette is not None and cassette.replaying:
+        return cassette.replay_http(url, params)
+
+    start = time.perf_counter()
+    with span("http", _endpoint(url)) as spanAttrs:
+        httpData = _get_http_request(url, params)
+        spanAttrs["ok"] = httpData is not None
+    if cassette is not None:
+        cassette.record_http(url, params, httpData, time.perf_counter() - start)
+    return httpData
+
+
+def _endpoint(url: str) -> str:
+    #host and path, without the query that may hold an api key:
+    return url.split("?", 1)[0].split("://", 1)[-1]
+
+
+def _get_http_request(url: str, params: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+    import requests
+    from requests.exceptions import HTTPError, ConnectionError, Timeout, RequestException
+
     try:
-        response = requests.get(url, params=params if params is not None else {})
+        response = requests.get(url, params=params if params is not None else {}, timeout=TotalTimeout)
         response.raise_for_status()
 
         try:
             httpData = response.json()
         except ValueError as e:
-            logger.warning("Invalid JSON in response:", e)
+            logger.warning(f"Invalid JSON in response: {e}")
             return None
 
     except HTTPError as e:
-        logger.wwarningarn(f"HTTP Error: {e} (Status Code: {response.status_code}) (Server Response: {response.text})")
+        logger.warning(f"HTTP Error: {e} (Status Code: {response.status_code}) (Server Response: {response.text})")
         return None
 
     except ConnectionError:
@@ -37,4 +77,97 @@ def get_http_request(url: str, params: Optional[dict] = None) -> Optional[Dict[s
         logger.warning(f"Something went wrong: {e}")
         return None
 
-    return httpData
\ No newline at end of file
+    return httpData
+
+
+def get_async_session() -> "aiohttp.ClientSession":
+    """
+    Get the shared async client session of the running event loop, creating it on first use.
+    The session keeps connections alive and pools them, with at most MaxConnectionsPerHost per host.
+    """
+    global _session, _sessionLoop
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _sessionLoop is not loop:
+        connector = aiohttp.TCPConnector(limit=MaxConnections, limit_per_host=MaxConnectionsPerHost, keepalive_timeout=KeepAliveSeconds)
+        timeout = aiohttp.ClientTimeout(total=TotalTimeout, connect=ConnectTimeout)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _sessionLoop = loop
+    return _session
+
+
+async def close_async_session() -> None:
+    """Close the shared async client session, call it before the event loop ends."""
+    global _session, _sessionLoop
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _sessionLoop = None
+    return
+
+
+async def get_http_request_async(url: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Non-blocking counterpart of get_http_request, sharing pooled keep-alive connections.
+
+    Args:
+        url (str): The url to request.
+        params (dict): Query parameters.
+        timeout (float): Total timeout in seconds of this request, defaults to TotalTimeout.
+
+    Returns:
+        The json response as a dictionary, or None if the request failed.
+
+    Raises:
+        Throttled: if the server answered 429 Too Many Requests, so a rate limiter can back off.
+    """
+    cassette = current_cassette()
+    if cassette is not None and cassette.replaying:
+        return await cassette.replay_http_async(url, params)
+
+    start = time.perf_counter()
+    with span("http", _endpoint(url)) as spanAttrs:
+        httpData = await _get_http_request_async(url, params, timeout)
+        spanAttrs["ok"] = httpData is not None
+    if cassette is not None:
+        cassette.record_http(url, params, httpData, time.perf_counter() - start)
+    return httpData
+
+
+async def _get_http_request_async(url: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    import aiohttp
+
+    session = get_async_session()
+    #timeout=None would mean no timeout at all to aiohttp, only pass it to override the session's timeouts:
+    requestArgs = {"timeout": aiohttp.ClientTimeout(total=timeout, connect=ConnectTimeout)} if timeout is not None else {}
+    try:
+        async with session.get(url, params=params if params is not None else {}, **requestArgs) as response:
+            if response.status == 429:
+                retryAfter = response.headers.get("Retry-After", "")
+                raise Throttled(f"Throttled by {url}: {await response.text()}", float(retryAfter) if retryAfter.isdigit() else None)
+
+            if response.status >= 400:
+                logger.warning(f"HTTP Error: (Status Code: {response.status}) (Server Response: {await response.text()})")
+                return None
+
+            try:
+                httpData = await response.json(content_type=None)
+            except ValueError as e:
+                logger.warning(f"Invalid JSON in response: {e}")
+                return None
+
+    except aiohttp.ClientConnectionError:
+        logger.warning(f"Failed to connect to the server {url}")
+        return None
+
+    except asyncio.TimeoutError:
+        logger.warning(f"Request timed out for {url}")
+        return None
+
+    except aiohttp.ClientError as e:
+        logger.warning(f"Unexpected request failure: {e}")
+        return None
+
+    return httpData
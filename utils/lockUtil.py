@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+
+try:
+    import fcntl
+except ImportError:
+    #Windows
+    import msvcrt
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive lock between processes on the file 'path', held through the sidecar file '<path>.lock'.
+
+    Every FileLock object opens its own handle, so two objects on the same path exclude each other
+    even inside one process. The lock is not reentrant. The operating system releases it if the holder dies.
+
+    Use it with 'with' in synchronous code, and with 'async with' on the event loop, where it waits on a worker thread.
+    """
+    def __init__(self, path: str):
+        self.lock_file = f"{path}.lock"
+        self._fd = None
+        return
+
+
+    def acquire(self):
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return
+
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+        return
+
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.release()
+        return
+
+
+    async def __aenter__(self):
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            #the thread may still get the lock after the caller gave up, give it back then:
+            acquiring.add_done_callback(lambda task: self.release() if not task.cancelled() and task.exception() is None else None)
+            raise
+        return self
+
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return
+
+
+def file_version(path: str):
+    """Changes whenever a writer replaces or rewrites the file, None if there is no file."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
@@ -1,30 +1,97 @@
 import os
+import copy
+import json
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 
-def setup_logger(module_name, log_dir="logs"):
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+#To enable debug logging, run with LOG_LEVEL=DEBUG or set LogLevel to logging.DEBUG. Below the level, log calls return before building a record:
+LogLevel = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+if not isinstance(LogLevel, int):
+    LogLevel = logging.INFO
+#one JSON object per line instead of plain text, for log processing tools, run with LOG_JSON=1 to turn it on:
+JsonLines = os.environ.get("LOG_JSON", "") not in ("", "0")
 
-    logger = logging.getLogger(module_name)
-    logger.setLevel(logging.DEBUG)
+LogFile = "app.log"
+TextFormat = "%(asctime)s [%(levelname)s] [%(name)s: %(lineno)d]: %(message)s"
 
-    formatter = logging.Formatter(
-        f"%(asctime)s [%(levelname)s] [{module_name}: %(lineno)d]: %(message)s"
-    )
+_queueHandler = None
+_listener = None
+_fileHandler = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Queues a copy of the record with its arguments merged into the message, so formatting happens on the listener thread.
+    The arguments are merged right away, they may be mutable objects that change before the listener gets to them.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _formatter(json_lines: bool) -> logging.Formatter:
+    return JsonFormatter() if json_lines else logging.Formatter(TextFormat)
 
-    file_handler = RotatingFileHandler(
-        f"{log_dir}/app.log",
+
+def _start_pipeline(log_dir: str):
+    #every logger puts records on one queue, a single background thread writes them to one file:
+    global _queueHandler, _listener, _fileHandler
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    _fileHandler = RotatingFileHandler(
+        f"{log_dir}/{LogFile}",
         maxBytes=5*1024*1024,
         backupCount=2,
         encoding='utf-8'
     )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    _fileHandler.setFormatter(_formatter(JsonLines))
 
     # console_handler = logging.StreamHandler()
-    # console_handler.setFormatter(formatter)
-    # logger.addHandler(console_handler)
+    # console_handler.setFormatter(_formatter(JsonLines))
+
+    logQueue = queue.SimpleQueue()
+    _queueHandler = _DeferredQueueHandler(logQueue)
+    _listener = QueueListener(logQueue, _fileHandler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return
+
 
+def setup_logger(module_name, log_dir="logs"):
+    if _queueHandler is None:
+        _start_pipeline(log_dir)
+
+    logger = logging.getLogger(module_name)
+    logger.setLevel(LogLevel)
+    if _queueHandler not in logger.handlers:
+        logger.addHandler(_queueHandler)
     return logger
+
+
+def stop_logging():
+    """Write out the queued records and stop the background thread, runs at exit."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    return
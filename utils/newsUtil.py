@@ -1,22 +1,27 @@
-from typing import List, Dict
-import requests
-from datetime import datetime, timedelta
-from llama_index.core.workflow import Context
+import time
+import json
+import asyncio
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from utils.logUtil import setup_logger
-from utils.httpUtil import get_http_request
-from utils.finUtil import load_stock_price_from_cache
+from utils.httpUtil import get_http_request_async, close_async_session
+from utils.rateUtil import scheduler, NewsApi, RateLimitExceeded
+from utils.cacheUtil import CacheUtil, NewsShardKeyGenerator, GroupSlruPolicy
+from utils.credentialUtil import get_credential
+from utils.traceUtil import count
 
 logger = setup_logger("newsUtil")
 
-with open('credentials/newsapi.txt', 'r') as f:
-    newsApibKey = f.read().strip()
+NewsUrl = "https://newsapi.org/v2/everything"
 
 
 def get_news_sources() -> None:
+    import requests
+
     url = "https://newsapi.org/v2/sources"
 
     params = {
-    "apiKey": newsApibKey,
+    "apiKey": get_credential('newsapi'),
 
     }
 
@@ -26,72 +31,238 @@ def get_news_sources() -> None:
 
 
 
-async def get_past_news(ctx: Context, ticker: str, company: str, pastDays: int) -> List[Dict[str, str]]:
-    """
-    Retrieves a list of news articles about a company based on the ticker and company name
-    published in the past 'pastDays' days.
-
-    Args:
-    ctx(Context) : The context between multi-agents.
-    ticker (str): The ticker symbol of the company.
-    company (str): The name of the company.
-    pastDays (int): The number of days in the past to retrieve news from.
-
-    Returns:
-    List[Dict[str, str]]: A list of dictionaries, each containing a date (str, in format 'YYYY-MM-DD')
-    and a news article (str).
+MaxNewsPages = 5
+NewsPageSize = 100
+MaxConcurrentPages = 3
+
+#raw news are cached per (ticker, publish date), past days never change, today's shard expires:
+NewsShardFile = 'data/newsShards.log'
+#shards are evicted by ticker once their json outgrows this many bytes:
+NewsShardCacheBytes = 64 * 1024 * 1024
+TodayShardTTL = 3600
+
+_newsShardCache: Optional[CacheUtil] = None
+
+
+async def _fetch_news_page(params: dict, page: int) -> Optional[dict]:
+    try:
+        return await scheduler.call(NewsApi, get_http_request_async, url=NewsUrl, params={**params, "page": page})
+
+    except RateLimitExceeded as e:
+        logger.warning(f"{e}")
+        return None
+
+    except Exception as e:
+        logger.warning(f"Something went wrong: {e}")
+        return None
+
+
+async def stream_news(ticker: str, company: str, startDate: str, endDate: str,
+                      maxPages: int = MaxNewsPages, concurrency: int = MaxConcurrentPages,
+                      report: Optional[dict] = None) -> AsyncIterator[Dict[str, str]]:
     """
-    url = "https://newsapi.org/v2/everything"
+    Stream news articles about a company published from 'startDate' to 'endDate', both in format 'YYYY-MM-DD'.
 
-    startDate = (datetime.now() - timedelta(days=pastDays)).strftime("%Y-%m-%d")
-    endDate = datetime.now().strftime("%Y-%m-%d")
+    The first page tells how many results there are, the remaining pages (up to 'maxPages') are then
+    fetched concurrently, at most 'concurrency' at a time, and their articles are yielded as each page arrives.
+    Articles repeating an already yielded url or description are dropped on the fly.
 
-    qStr = f"{ticker} OR ({company})"
+    If 'report' is given, report["complete"] is set to whether every result of the range was fetched, and
+    report["completeAfter"] to the oldest publish date of the pages fetched without a gap from the first one:
+    results come newest first, so every day after it was fetched completely, whatever pages failed later.
 
+    Yields:
+        Dictionaries with the date (str, in format 'YYYY-MM-DD') and the news article (str).
+    """
     params = {
-    "q": qStr,
-    "from": startDate,
-    "to": endDate,
+    "q": f"{ticker} OR ({company})",
+    "from": f"{startDate}T00:00:00",
+    "to": f"{endDate}T23:59:59",
     "sortBy": "publishedAt",
-    "apiKey": newsApibKey,
+    "apiKey": get_credential('newsapi'),
     "language": "en",
     "searchIn": "description",
-    "page": 1
+    "pageSize": NewsPageSize
     }
 
-    try:
-        httpData = get_http_request(url=url, params=params)
+    seenUrls = set()
+    seenDescriptions = set()
 
-    except Exception as e:
-        logger.warning(f"Something went wrong: {e}")
-        return []
-    
-    if(httpData == None):
+    def unique_articles(httpData):
+        for article in httpData.get('articles', []):
+            description = article.get("description")
+            if not description:
+                continue
+
+            url = article.get("url")
+            normalized = " ".join(description.lower().split())
+            if url in seenUrls or normalized in seenDescriptions:
+                continue
+            if url:
+                seenUrls.add(url)
+            seenDescriptions.add(normalized)
+            yield {"date": article["publishedAt"][0:10], "news": description}
+
+    def oldest_date(httpData):
+        dates = [article["publishedAt"][0:10] for article in httpData.get('articles', []) if article.get("publishedAt")]
+        return min(dates) if dates else None
+
+    if report is not None:
+        report["complete"] = False
+        report["completeAfter"] = None
+
+    firstPage = await _fetch_news_page(params, 1)
+    if(firstPage == None):
         logger.warning(f"Something went wrong")
-        return []
-    
-    newsList = []
-    articles = httpData['articles']
-    for article in articles:
-        newsList.append({"date": article["publishedAt"][0:10], "news": article["description"]})
+        return
 
-    #load stock price cache and save to context, so the next steps could retrieve it:
-    stockPriceCache = await load_stock_price_from_cache()
-    current_state = await ctx.get("state")
+    if report is not None:
+        report["completeAfter"] = oldest_date(firstPage)
+    for news in unique_articles(firstPage):
+        yield news
 
-    if "stock_price_cache" not in current_state:
-        current_state["stock_price_cache"] = stockPriceCache
-        await ctx.set("state", current_state)
+    totalResults = firstPage.get('totalResults', 0)
+    totalPages = -(-totalResults // NewsPageSize)
+    pages = min(maxPages, totalPages)
+    if pages <= 1:
+        if report is not None:
+            report["complete"] = totalPages <= 1
+        return
 
-    logger.info(f"Get {len(newsList)} originnal news")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_page(page):
+        async with semaphore:
+            return (page, await _fetch_news_page(params, page))
+
+    logger.info(f"Fetching {pages - 1} more news pages of {totalResults} results")
+    tasks = [asyncio.ensure_future(fetch_page(page)) for page in range(2, pages + 1)]
+    #oldest publish date of each page fetched:
+    pageOldest = {1: oldest_date(firstPage)}
+    failedPages = set()
+    try:
+        for task in asyncio.as_completed(tasks):
+            page, httpData = await task
+            if(httpData == None):
+                failedPages.add(page)
+                continue
+            pageOldest[page] = oldest_date(httpData)
+            for news in unique_articles(httpData):
+                yield news
+
+        if report is not None:
+            report["complete"] = not failedPages and pages == totalPages
+            #a failed page leaves a gap, only the pages before the first one hold their days completely:
+            leadingPages = range(1, min(failedPages) if failedPages else pages + 1)
+            dates = [pageOldest[page] for page in leadingPages if pageOldest[page] != None]
+            report["completeAfter"] = min(dates) if dates else None
+    finally:
+        #stop pending pages if the consumer quits early:
+        for task in tasks:
+            task.cancel()
+
+
+async def load_news_shard_cache() -> CacheUtil:
+    global _newsShardCache
+    if _newsShardCache is None:
+        _newsShardCache = CacheUtil(None, NewsShardFile, NewsShardKeyGenerator(), storage="log",
+                                    policy=GroupSlruPolicy(NewsShardCacheBytes))
+        await _newsShardCache.load_cache()
+    return _newsShardCache
+
+
+def _is_fresh(shard: dict, day: str, today: str) -> bool:
+    #a shard fetched after its day ended holds the whole day, a shard of today is only good for a while:
+    if shard["fetchedOn"] > day:
+        return True
+    return day == today and time.time() - shard["fetchedAt"] < TodayShardTTL
+
+
+def _missing_ranges(days: List[str]) -> List[Tuple[str, str]]:
+    #group sorted days into ranges of consecutive days
+    ranges = []
+    for day in days:
+        previousDay = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        if ranges and ranges[-1][1] == previousDay:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+async def get_news_by_days(ticker: str, company: str, pastDays: int) -> List[Dict[str, str]]:
+    """
+    News about a company from the past 'pastDays' days (UTC, today included), newest day first.
+    Days held in the news shard cache are served locally, only the missing date ranges are fetched.
+
+    Unlike stream_news the result is a list: pages arrive in any order while the result is sorted by day,
+    a fetched day is cached only once the fetch reports it complete, and the caller filters and stores the whole list.
+    """
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    days = [(now - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(pastDays, -1, -1)]
+
+    shardCache = await load_news_shard_cache()
+    newsByDay: Dict[str, List[Dict[str, str]]] = {}
+    missingDays = []
+    for day in days:
+        cached = await shardCache.get(ticker, day)
+        shard = json.loads(cached) if cached != None else None
+        if shard != None and _is_fresh(shard, day, today):
+            newsByDay[day] = shard["articles"]
+        else:
+            missingDays.append(day)
+
+    logger.info(f"News shards of {ticker}: {len(days) - len(missingDays)} cached, {len(missingDays)} to fetch")
+    count("newsShard.hit", len(days) - len(missingDays))
+    count("newsShard.miss", len(missingDays))
+
+    for startDate, endDate in _missing_ranges(missingDays):
+        report = {}
+        fetched: Dict[str, List[Dict[str, str]]] = {day: [] for day in days if startDate <= day <= endDate}
+        async for news in stream_news(ticker, company, startDate, endDate, report=report):
+            fetched.setdefault(news["date"], []).append(news)
+
+        #a truncated or partly failed fetch only holds the days after the oldest article of its leading pages completely:
+        if report.get("complete"):
+            completeFrom = startDate
+        elif report.get("completeAfter") != None:
+            completeFrom = (datetime.strptime(report["completeAfter"], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        else:
+            completeFrom = None
+
+        for day, articles in fetched.items():
+            newsByDay[day] = articles
+            if completeFrom != None and completeFrom <= day <= endDate:
+                #today's shard also expires from the cache, so the file does not keep stale ones:
+                await shardCache.add({"fetchedOn": today, "fetchedAt": time.time(), "articles": articles}, ticker, day,
+                                     ttl=TodayShardTTL if day == today else None)
+
+    await shardCache.save_to_file()
+
+    #shards were fetched separately, drop descriptions repeated across them:
+    newsList = []
+    seenDescriptions = set()
+    for day in sorted(newsByDay, reverse=True):
+        for news in newsByDay[day]:
+            normalized = " ".join(news["news"].lower().split())
+            if normalized not in seenDescriptions:
+                seenDescriptions.add(normalized)
+                newsList.append(news)
     return newsList
 
 
-if __name__ == "__main__":
-    newsList = get_past_news("TSM", "Taiwan Semiconductor Manufacturing", 10)
-    for news in newsList:
+async def print_past_news(ticker: str, company: str, pastDays: int) -> None:
+    startDate = (datetime.now() - timedelta(days=pastDays)).strftime("%Y-%m-%d")
+    endDate = datetime.now().strftime("%Y-%m-%d")
+    async for news in stream_news(ticker, company, startDate, endDate):
         print(f"Date: {news['date']}")
         print(f"News: {news['news']}")
         print("\n")
+    await close_async_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(print_past_news("TSM", "Taiwan Semiconductor Manufacturing", 10))
 
     #get_news_sources()
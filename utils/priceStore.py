@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from utils.lockUtil import FileLock, file_version
+from utils.logUtil import setup_logger
+
+logger = setup_logger("priceStore")
+
+
+class PriceSeriesStore:
+    """
+    Daily close prices kept per symbol as two sorted, aligned NumPy arrays: dates (datetime64[D]) and closes (float64).
+
+    A price costs 16 bytes instead of a dict entry, a "SYM:YYYY-MM-DD" key string and a float object,
+    and many dates of one symbol are resolved in a single searchsorted call.
+    The store is persisted as one .npz file holding the concatenated columns of all symbols,
+    and the time each symbol was last fetched, so callers can tell a missing price from one not published yet.
+    Processes sharing the file merge the prices the others saved into their own on save, see save.
+    """
+    def __init__(self, store_file):
+        self._lock = asyncio.Lock()
+        self._fileLock = FileLock(store_file)
+
+        self.store_file = store_file
+        self._series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._fetchedAt: Dict[str, float] = {}  # symbol: unix time of its last fetch
+        self._dirty = False
+        self._version = None  # of the file as this store last loaded or saved it
+        return
+
+
+    async def load(self):
+        """Load the store from file if it exists."""
+        if not os.path.exists(self.store_file):
+            return
+
+        async with self._lock:
+            try:
+                async with self._fileLock:
+                    self._series, self._fetchedAt = await asyncio.to_thread(_read_store, self.store_file)
+                    self._version = file_version(self.store_file)
+                logger.info(f"Loaded {self.size()} prices of {len(self._series)} symbols from {self.store_file}")
+            except (OSError, ValueError, KeyError):
+                logger.error(f"Failed to load prices from {self.store_file}")
+                self._series = {}
+                self._fetchedAt = {}
+        return
+
+
+    async def save(self):
+        """
+        Save the store to file, if anything changed since it was loaded or last saved.
+        If another process saved the file in between, its prices are merged in first, this store's prices win on the same dates.
+        """
+        async with self._lock:
+            if not self._dirty:
+                return
+            try:
+                async with self._fileLock:
+                    version = file_version(self.store_file)
+                    if version != None and version != self._version:
+                        self._merge(*await asyncio.to_thread(_read_store, self.store_file))
+                    await asyncio.to_thread(_write_store, self.store_file, dict(self._series), dict(self._fetchedAt))
+                    self._version = file_version(self.store_file)
+                self._dirty = False
+            except (OSError, ValueError, KeyError):
+                logger.error(f"Failed to save prices to {self.store_file}")
+        return
+
+
+    def _merge(self, series: Dict[str, Tuple[np.ndarray, np.ndarray]], fetchedAt: Dict[str, float]):
+        for symbol, when in fetchedAt.items():
+            self._fetchedAt[symbol] = max(when, self._fetchedAt.get(symbol, 0.0))
+        for symbol, (dates, closes) in series.items():
+            if symbol not in self._series:
+                self._series[symbol] = (dates, closes)
+                continue
+            #own prices go first, so np.unique keeps them over the saved ones for duplicate dates:
+            ownDates, ownCloses = self._series[symbol]
+            mergedDates, first = np.unique(np.concatenate((ownDates, dates)), return_index=True)
+            self._series[symbol] = (mergedDates, np.concatenate((ownCloses, closes))[first])
+        return
+
+
+    def update(self, symbol: str, prices: Dict[str, float]) -> int:
+        """
+        Merge close prices of a symbol into the store. Prices of dates already in the store are replaced.
+
+        Args:
+            symbol (str): The stock symbol.
+            prices (dict): Close price by date in the format 'YYYY-MM-DD'.
+
+        Returns:
+            The number of prices of the symbol after the merge.
+        """
+        if not prices:
+            return len(self._series[symbol][0]) if symbol in self._series else 0
+
+        newDates = np.array(list(prices.keys()), dtype="datetime64[D]")
+        newCloses = np.array(list(prices.values()), dtype=np.float64)
+
+        if symbol in self._series:
+            oldDates, oldCloses = self._series[symbol]
+            #new prices go first, so np.unique keeps them over the old ones for duplicate dates:
+            newDates = np.concatenate((newDates, oldDates))
+            newCloses = np.concatenate((newCloses, oldCloses))
+
+        dates, first = np.unique(newDates, return_index=True)
+        self._series[symbol] = (dates, newCloses[first])
+        self._dirty = True
+        return len(dates)
+
+
+    def mark_fetched(self, symbol: str, when: Optional[float] = None):
+        """Record that the whole series of a symbol was just fetched, even if it brought no new prices."""
+        self._fetchedAt[symbol] = time.time() if when is None else when
+        self._dirty = True
+        return
+
+
+    def fetched_at(self, symbol: str) -> Optional[float]:
+        """Unix time of the last fetch of a symbol, None if it was never recorded."""
+        return self._fetchedAt.get(symbol)
+
+
+    def last_date(self, symbol: str) -> Optional[str]:
+        """Latest date with a price of a symbol, in the format 'YYYY-MM-DD'."""
+        if symbol not in self._series or len(self._series[symbol][0]) == 0:
+            return None
+        return str(self._series[symbol][0][-1])
+
+
+    def lookup(self, symbol: str, dates: Iterable[str]) -> np.ndarray:
+        """
+        Get the close prices of a symbol for many dates at once.
+
+        Args:
+            symbol (str): The stock symbol.
+            dates: Dates in the format 'YYYY-MM-DD'.
+
+        Returns:
+            An array of close prices aligned with 'dates', NaN where the price is not in the store.
+        """
+        wanted = np.asarray(list(dates), dtype="datetime64[D]")
+        closes = np.full(wanted.shape, np.nan)
+        if symbol not in self._series or wanted.size == 0:
+            return closes
+
+        seriesDates, seriesCloses = self._series[symbol]
+        positions = np.searchsorted(seriesDates, wanted)
+        inRange = positions < len(seriesDates)
+        found = np.zeros(wanted.shape, dtype=bool)
+        found[inRange] = seriesDates[positions[inRange]] == wanted[inRange]
+        closes[found] = seriesCloses[positions[found]]
+        return closes
+
+
+    def lookup_pairs(self, symbol: str, workdays: Iterable[str], previousWorkdays: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Resolve many (workday, previousWorkday) pairs of a symbol in one call.
+
+        Returns:
+            A tuple of two arrays: the closes of the workdays and of the previous workdays, NaN where missing.
+        """
+        workdays = list(workdays)
+        closes = self.lookup(symbol, workdays + list(previousWorkdays))
+        return (closes[:len(workdays)], closes[len(workdays):])
+
+
+    def size(self) -> int:
+        """Total number of prices in the store."""
+        return sum(len(dates) for dates, _ in self._series.values())
+
+
+    def nbytes(self) -> int:
+        """Memory used by the price arrays."""
+        return sum(dates.nbytes + closes.nbytes for dates, closes in self._series.values())
+
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._series
+
+
+
+def _read_store(store_file: str) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], Dict[str, float]]:
+    with np.load(store_file, allow_pickle=False) as data:
+        symbols = data["symbols"]
+        offsets = data["offsets"]
+        dates = data["dates"]
+        closes = data["closes"]
+        #stores saved before fetch times were recorded have none:
+        fetchedTimes = data["fetchedAt"] if "fetchedAt" in data.files else np.zeros(len(symbols))
+
+    series = {}
+    fetchedAt = {}
+    for i, symbol in enumerate(symbols):
+        if offsets[i + 1] > offsets[i]:
+            series[str(symbol)] = (dates[offsets[i]:offsets[i + 1]], closes[offsets[i]:offsets[i + 1]])
+        if fetchedTimes[i] > 0:
+            fetchedAt[str(symbol)] = float(fetchedTimes[i])
+    return (series, fetchedAt)
+
+
+def _write_store(store_file: str, series: Dict[str, Tuple[np.ndarray, np.ndarray]], fetchedAt: Dict[str, float]):
+    #a symbol fetched without any price still needs its row, to keep its fetch time:
+    series = {**{symbol: (np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64)) for symbol in fetchedAt}, **series}
+    symbols = list(series.keys())
+    lengths = [len(series[symbol][0]) for symbol in symbols]
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    dates = np.concatenate([series[symbol][0] for symbol in symbols]) if symbols else np.array([], dtype="datetime64[D]")
+    closes = np.concatenate([series[symbol][1] for symbol in symbols]) if symbols else np.array([], dtype=np.float64)
+
+    #np.savez appends .npz to names without it, so the temporary file keeps the suffix:
+    tmpFile = f"{store_file}.tmp.npz"
+    fetchedTimes = np.array([fetchedAt.get(symbol, 0.0) for symbol in symbols], dtype=np.float64)
+    np.savez(tmpFile, symbols=np.array(symbols, dtype=str), offsets=offsets, dates=dates, closes=closes, fetchedAt=fetchedTimes)
+    os.replace(tmpFile, store_file)
+    return
+
+
+def to_optional_floats(closes: np.ndarray) -> list:
+    """Convert a close price array to a list of floats, with None where the price is missing."""
+    return [None if np.isnan(close) else float(close) for close in closes]
@@ -0,0 +1,392 @@
+import os
+import json
+import time
+import heapq
+import atexit
+import random
+import asyncio
+import itertools
+import threading
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from utils.logUtil import setup_logger
+from utils.lockUtil import FileLock
+
+logger = setup_logger("rateUtil")
+
+
+#request priorities, lower goes first:
+Interactive = 0
+Background = 1
+
+#priority of the requests made in the current context, batch jobs set it to Background:
+requestPriority: ContextVar[int] = ContextVar("requestPriority", default=Interactive)
+
+AlphaVantage = "alphavantage"
+NewsApi = "newsapi"
+Finnhub = "finnhub"
+
+#free tier budgets: (requests per minute, requests per day or None if unlimited)
+DefaultBudgets = {
+    AlphaVantage: (5, 25),
+    NewsApi: (30, 100),
+    Finnhub: (60, None),
+}
+
+UsageFile = 'data/apiUsage.json'
+#seconds between saves of the usage counts, they are saved at exit and when a daily limit is reached as well:
+UsageSaveInterval = 10.0
+MaxRetries = 3
+BackoffBase = 2.0
+BackoffMax = 60.0
+
+
+class RateLimitExceeded(Exception):
+    """The daily budget of a provider is used up"""
+    pass
+
+
+class Throttled(Exception):
+    """A provider rejected a request for going over its rate limit"""
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UsageLog:
+    """
+    Requests made per provider today, persisted so the daily budget holds across runs.
+    Safe to use from several threads, the counts are saved every UsageSaveInterval seconds and at exit.
+    The usage file is read on first use, so creating the log does no file I/O.
+    Processes sharing the usage file add up their requests: a save adds the requests made since the last save
+    to the counts in the file, under a FileLock, and takes the sum as its own counts.
+    """
+    def __init__(self, usage_file: str):
+        self.usage_file = usage_file
+        self.date = datetime.now().strftime("%Y-%m-%d")
+        self.counts: Dict[str, int] = {}
+        self._saved: Dict[str, int] = {}  # counts as this process last read or wrote them
+        self._floors: Dict[str, int] = {}  # counts set since the last save, the file may not hold less
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._savedAt = time.monotonic()
+        atexit.register(self.flush)
+        return
+
+
+    def _load(self):
+        self._loaded = True
+        #later saves, the one at exit too, go to the file read here even if the working directory changes:
+        self.usage_file = os.path.abspath(self.usage_file)
+        #saves replace the file whole, it reads consistently without the lock:
+        self.counts = self._read()
+        self._saved = dict(self.counts)
+        return
+
+
+    def _read(self) -> Dict[str, int]:
+        """Today's counts in the usage file, empty if it is missing, unreadable or of another day."""
+        if not os.path.exists(self.usage_file):
+            return {}
+        try:
+            with open(self.usage_file, 'r') as f:
+                data = json.load(f)
+            if data.get("date") == self.date:
+                return data.get("counts", {})
+        except (json.JSONDecodeError, IOError):
+            logger.error(f"Failed to load api usage from {self.usage_file}")
+        return {}
+
+
+    def _roll_over(self):
+        if not self._loaded:
+            self._load()
+        today = datetime.now().strftime("%Y-%m-%d")
+        if today != self.date:
+            self.date = today
+            self.counts = {}
+            self._saved = {}
+            self._floors = {}
+        return
+
+
+    def get(self, provider: str) -> int:
+        with self._lock:
+            self._roll_over()
+            return self.counts.get(provider, 0)
+
+
+    def add(self, provider: str, count: int = 1):
+        with self._lock:
+            self._roll_over()
+            self.counts[provider] = self.counts.get(provider, 0) + count
+            self._dirty = True
+            if time.monotonic() - self._savedAt >= UsageSaveInterval:
+                self.save()
+        return
+
+
+    def set(self, provider: str, count: int):
+        with self._lock:
+            self._roll_over()
+            self.counts[provider] = count
+            self._floors[provider] = count
+            self.save()
+        return
+
+
+    def flush(self):
+        """Save the counts if they changed since the last save."""
+        with self._lock:
+            if self._dirty:
+                self.save()
+        return
+
+
+    def save(self):
+        with self._lock:
+            self._roll_over()
+            #a tmp file of its own, so no other writer of the usage file can truncate it halfway:
+            tmpFile = f"{self.usage_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with FileLock(self.usage_file):
+                    #the file holds what other processes saved since this one last read it:
+                    counts = self._read()
+                    for provider, count in self.counts.items():
+                        if provider not in self._floors:
+                            counts[provider] = counts.get(provider, 0) + count - self._saved.get(provider, 0)
+                    for provider, count in self._floors.items():
+                        counts[provider] = max(counts.get(provider, 0), count)
+                    with open(tmpFile, 'w') as f:
+                        json.dump({"date": self.date, "counts": counts}, f)
+                    os.replace(tmpFile, self.usage_file)
+            except IOError:
+                logger.error(f"Failed to save api usage to {self.usage_file}")
+                return
+            self.counts = counts
+            self._saved = dict(counts)
+            self._floors = {}
+            self._dirty = False
+            self._savedAt = time.monotonic()
+        return
+
+
+class ProviderLimiter:
+    """
+    Token bucket of one provider, refilled at 'per_minute' tokens per minute, plus its daily budget.
+    Waiting requests are granted tokens in priority order, then in arrival order.
+    The bucket is guarded by a lock, so threads calling acquire_blocking share it safely.
+    """
+    def __init__(self, name: str, per_minute: int, per_day: Optional[int], usage: UsageLog):
+        self.name = name
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.usage = usage
+
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._pausedUntil = 0.0
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        return
+
+
+    def remaining_today(self) -> Optional[int]:
+        if self.per_day is None:
+            return None
+        return max(0, self.per_day - self.usage.get(self.name))
+
+
+    def _take(self) -> bool:
+        with self._lock:
+            if self.remaining_today() == 0:
+                raise RateLimitExceeded(f"Daily budget of {self.per_day} requests for {self.name} is used up")
+
+            now = time.monotonic()
+            if now < self._pausedUntil:
+                return False
+
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            self.usage.add(self.name)
+            return True
+
+
+    def _wait_time(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._pausedUntil:
+                return self._pausedUntil - now
+            return max(0.0, (1 - self._tokens) * 60 / self.per_minute)
+
+
+    async def acquire(self, priority: Optional[int] = None):
+        """
+        Wait for a request slot.
+
+        Raises:
+            RateLimitExceeded: if the daily budget is used up.
+        """
+        priority = requestPriority.get() if priority is None else priority
+        if not self._waiters and self._take():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        await future
+        return
+
+
+    async def _dispatch(self):
+        while self._waiters:
+            if self._waiters[0][2].cancelled():
+                heapq.heappop(self._waiters)
+                continue
+
+            try:
+                granted = self._take()
+            except RateLimitExceeded as e:
+                while self._waiters:
+                    future = heapq.heappop(self._waiters)[2]
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            if granted:
+                future = heapq.heappop(self._waiters)[2]
+                if not future.done():
+                    future.set_result(None)
+                continue
+
+            await asyncio.sleep(self._wait_time())
+        return
+
+
+    def acquire_blocking(self):
+        """Wait for a request slot in synchronous code, see acquire."""
+        while not self._take():
+            time.sleep(self._wait_time())
+        return
+
+
+    def throttled(self, delay: float):
+        """The provider pushed back: hand out no tokens for 'delay' seconds and start again from an empty bucket."""
+        with self._lock:
+            self._pausedUntil = max(self._pausedUntil, time.monotonic() + delay)
+            self._tokens = 0
+            self._updated = self._pausedUntil
+        logger.warning(f"{self.name} throttled, pausing requests for {delay:.1f}s")
+        return
+
+
+    def exhaust_day(self):
+        """The provider reported its daily limit reached: stop sending requests until tomorrow."""
+        if self.per_day is not None:
+            self.usage.set(self.name, self.per_day)
+        logger.warning(f"{self.name} daily limit reached")
+        return
+
+
+class RateLimitScheduler:
+    """Rate limiters of all API providers, sharing one persisted usage log."""
+    def __init__(self, budgets: Dict[str, Tuple[int, Optional[int]]] = DefaultBudgets, usage_file: str = UsageFile):
+        self.usage = UsageLog(usage_file)
+        self.limiters = {name: ProviderLimiter(name, perMinute, perDay, self.usage) for name, (perMinute, perDay) in budgets.items()}
+        return
+
+
+    def set_budget(self, provider: str, per_minute: int, per_day: Optional[int]):
+        """Replace the budget of a provider, e.g. to lift it for local fixture servers."""
+        self.limiters[provider] = ProviderLimiter(provider, per_minute, per_day, self.usage)
+        return
+
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        return self.limiters[provider]
+
+
+    async def call(self, provider: str, func: Callable[..., Awaitable[Any]], *args, priority: Optional[int] = None,
+                   is_throttled: Optional[Callable[[Any], Optional[str]]] = None, **kwargs) -> Any:
+        """
+        Call 'func(*args, **kwargs)' within the budget of 'provider', retrying with exponential backoff when throttled.
+
+        Args:
+            provider (str): The provider name, one of the keys of the budgets.
+            func: The async function making the request.
+            priority (int): Interactive or Background, defaults to the priority of the current context.
+            is_throttled: Optional check of the result, returning None if it is fine,
+                "minute" if the request was throttled and "day" if the daily limit was reached.
+
+        Returns:
+            The result of the last attempt, or None if every attempt raised Throttled.
+
+        Raises:
+            RateLimitExceeded: if the daily budget is used up.
+        """
+        limiter = self.limiter(provider)
+        result = None
+        for attempt in range(MaxRetries + 1):
+            await limiter.acquire(priority)
+            try:
+                result = await func(*args, **kwargs)
+                verdict = is_throttled(result) if is_throttled is not None else None
+                retryAfter = None
+            except Throttled as e:
+                result = None
+                verdict = "minute"
+                retryAfter = e.retry_after
+
+            if verdict is None:
+                return result
+            if verdict == "day":
+                limiter.exhaust_day()
+                return result
+
+            delay = retryAfter if retryAfter is not None else backoff_delay(attempt)
+            limiter.throttled(delay)
+        return result
+
+
+    def call_blocking(self, provider: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Synchronous counterpart of call, for code running outside the event loop."""
+        limiter = self.limiter(provider)
+        for attempt in range(MaxRetries + 1):
+            limiter.acquire_blocking()
+            try:
+                return func(*args, **kwargs)
+            except Throttled as e:
+                if attempt == MaxRetries:
+                    raise
+                limiter.throttled(e.retry_after if e.retry_after is not None else backoff_delay(attempt))
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    #exponential backoff with full jitter
+    return random.uniform(0, min(BackoffMax, BackoffBase * (2 ** attempt)))
+
+
+def alpha_vantage_throttled(httpData: Optional[dict]) -> Optional[str]:
+    """Alpha Vantage answers throttled requests with status 200 and a message under 'Information' or 'Note'."""
+    if not isinstance(httpData, dict):
+        return None
+    message = (httpData.get('Information') or httpData.get('Note') or '').lower()
+    if not ('rate limit' in message or 'call frequency' in message or 'sparingly' in message):
+        return None
+    if 'per minute' in message or 'per second' in message:
+        return "minute"
+    return "day" if 'per day' in message else "minute"
+
+
+#shared by every API call of the process:
+scheduler = RateLimitScheduler()
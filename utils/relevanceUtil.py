@@ -0,0 +1,361 @@
+import os
+import re
+import json
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from utils.logUtil import setup_logger
+from utils.lockUtil import FileLock
+
+logger = setup_logger("relevanceUtil")
+
+
+#labeled examples: the seed fixture set, and the judgments of the LLM collected from real runs
+FixtureFile = 'data/relevanceFixtures.jsonl'
+JudgmentsFile = 'data/relevanceJudgments.jsonl'
+RelevanceModelFile = 'data/relevanceModel.npz'
+
+#news scoring below the threshold never reaches the LLM, 0 turns the filter off. Taken from
+#'python -m utils.relevanceUtil report': the lexicon and the cross-validated model keep all related fixtures up to 0.6,
+#the lowest threshold with that precision leaves the most margin for news unlike the fixtures:
+RelevanceThreshold = 0.2
+#percent of the dropped news still passed to the LLM, so the recall of the filter stays measurable:
+AuditPercent = 5
+#the LLM judges only the audited part of the dropped news, each of its judgments stands for this many:
+AuditWeight = 100 / AuditPercent
+#the judgments file keeps the newest judgments of this many distinct news:
+MaxJudgments = 20000
+#folds of the cross-validation of the report, examples are assigned to folds by their text:
+ReportFolds = 5
+
+MaxVocabulary = 2000
+MinTermCount = 2
+TrainEpochs = 300
+LearningRate = 0.5
+L2Penalty = 0.001
+
+#terms of news that move stock prices, weight is their contribution to the lexicon score:
+Lexicon = {
+    "shares": 0.3, "stock": 0.3, "stocks": 0.3, "investors": 0.2, "market": 0.1, "nasdaq": 0.3, "nyse": 0.3,
+    "earnings": 0.6, "revenue": 0.5, "profit": 0.5, "loss": 0.3, "quarter": 0.3, "quarterly": 0.4, "eps": 0.6,
+    "guidance": 0.6, "forecast": 0.4, "outlook": 0.3, "sales": 0.3, "margin": 0.3, "margins": 0.3,
+    "analyst": 0.4, "analysts": 0.4, "upgrade": 0.6, "downgrade": 0.6, "upgraded": 0.6, "downgraded": 0.6,
+    "target": 0.2, "rating": 0.3, "valuation": 0.3,
+    "surge": 0.5, "surged": 0.5, "soar": 0.5, "soared": 0.5, "jump": 0.4, "jumped": 0.4, "rally": 0.5, "rallied": 0.5,
+    "plunge": 0.5, "plunged": 0.5, "tumble": 0.5, "tumbled": 0.5, "slump": 0.5, "slumped": 0.5, "sink": 0.4, "sank": 0.4,
+    "fell": 0.3, "rose": 0.3, "drop": 0.3, "dropped": 0.3, "gain": 0.3, "gains": 0.3, "record": 0.2,
+    "acquisition": 0.5, "acquire": 0.5, "merger": 0.6, "deal": 0.3, "buyback": 0.6, "dividend": 0.6, "ipo": 0.5,
+    "lawsuit": 0.4, "sec": 0.4, "antitrust": 0.5, "probe": 0.4, "investigation": 0.4, "fine": 0.3, "recall": 0.4,
+    "tariff": 0.4, "tariffs": 0.4, "sanctions": 0.4, "layoffs": 0.5, "ceo": 0.3, "resigns": 0.5, "bankruptcy": 0.7,
+}
+#phrases score once, on top of their words:
+LexiconPhrases = {"price target": 0.5, "all-time high": 0.5, "market cap": 0.4, "wall street": 0.3, "stock split": 0.6}
+
+_tokenPattern = re.compile(r"[a-z][a-z0-9\-']*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _tokenPattern.findall(text.lower())
+
+
+def lexicon_score(text: str) -> float:
+    """Sum of the lexicon weights of the distinct terms and phrases in the text, capped at 1."""
+    lowered = text.lower()
+    score = sum(Lexicon.get(term, 0.0) for term in set(tokenize(lowered)))
+    score += sum(weight for phrase, weight in LexiconPhrases.items() if phrase in lowered)
+    return min(1.0, score)
+
+
+class RelevanceModel:
+    """
+    Logistic regression over L2-normalized TF-IDF features plus the lexicon score.
+    Without trained weights it falls back to the lexicon score alone.
+    """
+    def __init__(self, vocabulary: Optional[Dict[str, int]] = None, idf: Optional[np.ndarray] = None,
+                 weights: Optional[np.ndarray] = None, bias: float = 0.0):
+        self.vocabulary = vocabulary or {}
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+        return
+
+
+    def trained(self) -> bool:
+        return self.weights is not None
+
+
+    def features(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), len(self.vocabulary) + 1))
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                column = self.vocabulary.get(token)
+                if column is not None:
+                    matrix[row, column] += 1
+        if self.idf is not None and len(self.vocabulary):
+            matrix[:, :-1] *= self.idf
+            norms = np.linalg.norm(matrix[:, :-1], axis=1, keepdims=True)
+            matrix[:, :-1] /= np.where(norms == 0, 1, norms)
+        matrix[:, -1] = [lexicon_score(text) for text in texts]
+        return matrix
+
+
+    def score(self, texts: List[str]) -> np.ndarray:
+        """Probability that each text is related to a stock price change."""
+        if not self.trained():
+            return np.array([lexicon_score(text) for text in texts])
+        return _sigmoid(self.features(texts) @ self.weights + self.bias)
+
+
+    def save(self, model_file: str):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        tmpFile = f"{model_file}.tmp.npz"
+        np.savez(tmpFile, terms=np.array(terms, dtype=str), idf=self.idf, weights=self.weights, bias=np.array(self.bias))
+        os.replace(tmpFile, model_file)
+        return
+
+
+    @classmethod
+    def load(cls, model_file: str) -> "RelevanceModel":
+        """Load the trained model, or get the lexicon-only model if there is none."""
+        if not os.path.exists(model_file):
+            return cls()
+        try:
+            with np.load(model_file, allow_pickle=False) as data:
+                vocabulary = {str(term): i for i, term in enumerate(data["terms"])}
+                return cls(vocabulary, data["idf"], data["weights"], float(data["bias"]))
+        except (OSError, ValueError, KeyError):
+            logger.error(f"Failed to load relevance model from {model_file}")
+            return cls()
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-np.clip(x, -30, 30)))
+
+
+def train_model(examples: List[Tuple[str, bool, float]]) -> RelevanceModel:
+    """
+    Train the relevance model on (news, related, weight) examples by weighted batch gradient descent.
+    Runs offline, see the __main__ section.
+    """
+    texts = [text for text, _, _ in examples]
+    labels = np.array([1.0 if related else 0.0 for _, related, _ in examples])
+    weightOf = np.array([weight for _, _, weight in examples])
+
+    termCounts: Dict[str, int] = {}
+    documentCounts: Dict[str, int] = {}
+    for text in texts:
+        tokens = tokenize(text)
+        for token in tokens:
+            termCounts[token] = termCounts.get(token, 0) + 1
+        for token in set(tokens):
+            documentCounts[token] = documentCounts.get(token, 0) + 1
+
+    terms = sorted((term for term, count in termCounts.items() if count >= MinTermCount), key=lambda term: (-termCounts[term], term))
+    terms = terms[:MaxVocabulary]
+    vocabulary = {term: i for i, term in enumerate(terms)}
+    idf = np.array([np.log((1 + len(texts)) / (1 + documentCounts[term])) + 1 for term in terms])
+
+    model = RelevanceModel(vocabulary, idf)
+    matrix = model.features(texts)
+    weights = np.zeros(matrix.shape[1])
+    bias = 0.0
+    for _ in range(TrainEpochs):
+        error = (_sigmoid(matrix @ weights + bias) - labels) * weightOf
+        weights -= LearningRate * (matrix.T @ error / weightOf.sum() + L2Penalty * weights)
+        bias -= LearningRate * error.sum() / weightOf.sum()
+
+    model.weights = weights
+    model.bias = bias
+    return model
+
+
+def _audited(text: str) -> bool:
+    #deterministic sample of the dropped news, the same article is always in or out:
+    return zlib.crc32(text.encode("utf-8")) % 100 < AuditPercent
+
+
+_model: Optional[RelevanceModel] = None
+
+
+def get_relevance_model() -> RelevanceModel:
+    global _model
+    if _model is None:
+        _model = RelevanceModel.load(RelevanceModelFile)
+    return _model
+
+
+def filter_news(newsList: List[Dict[str, str]], threshold: float = RelevanceThreshold,
+                report: Optional[dict] = None) -> List[Dict[str, str]]:
+    """
+    Drop the news clearly unrelated to stock price changes before they reach the LLM.
+
+    Args:
+        newsList: News as dictionaries with a date and a news description.
+        threshold (float): Minimum relevance score to keep a news, 0 keeps everything.
+        report (dict): If given, report["audited"] is set to the descriptions of the dropped news kept for the audit.
+
+    Returns:
+        The kept news in their original order, including the audit sample of the dropped ones.
+    """
+    if report is not None:
+        report["audited"] = []
+    if threshold <= 0 or len(newsList) == 0:
+        return newsList
+
+    scores = get_relevance_model().score([news["news"] for news in newsList])
+    kept = [news for news, score in zip(newsList, scores) if score >= threshold or _audited(news["news"])]
+    if report is not None:
+        report["audited"] = [news["news"] for news, score in zip(newsList, scores) if score < threshold and _audited(news["news"])]
+    logger.info(f"Relevance filter kept {len(kept)} of {len(newsList)} news at threshold {threshold}")
+    return kept
+
+
+def read_examples(example_file: str) -> List[Tuple[str, bool, float]]:
+    """(news, related, weight) examples of a jsonl file, records without a weight weigh 1."""
+    if not os.path.exists(example_file):
+        return []
+    examples = []
+    with open(example_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                examples.append((record["news"], bool(record["related"]), float(record.get("weight", 1.0))))
+    return examples
+
+
+def record_judgments(newsList: List[Dict[str, str]], stockEvents: List[dict], audited: Iterable[str] = (),
+                     judgments_file: str = JudgmentsFile):
+    """
+    Append the judgments of the LLM on the news it was given, as labeled examples for training and evaluation.
+    A news already judged keeps its first judgment, and the file is cut down to the newest MaxJudgments.
+
+    A news is related if the LLM copied it into an event summary. The LLM keeps one event per date,
+    so other news of an event date are ambiguous and left out, news of dates without an event are unrelated.
+    The judgments of 'audited' news, the sample of the news the filter dropped, weigh AuditWeight.
+    """
+    summaries = {event["summary"].strip() for event in stockEvents}
+    eventDates = {event["time"] for event in stockEvents}
+    audited = {text.strip() for text in audited}
+
+    records = {}
+    for news in newsList:
+        text = news["news"].strip()
+        weight = {"weight": AuditWeight} if text in audited else {}
+        if text in records:
+            continue
+        if text in summaries:
+            records[text] = {"news": text, "related": True, **weight}
+        elif news["date"] not in eventDates:
+            records[text] = {"news": text, "related": False, **weight}
+
+    try:
+        with FileLock(judgments_file):
+            lines = []
+            if os.path.exists(judgments_file):
+                with open(judgments_file, 'r', encoding='utf-8') as f:
+                    lines = [line for line in f if line.strip()]
+            judged = {json.loads(line)["news"] for line in lines}
+            newLines = [json.dumps(record) + "\n" for text, record in records.items() if text not in judged]
+            if len(lines) + len(newLines) <= MaxJudgments:
+                with open(judgments_file, 'a', encoding='utf-8') as f:
+                    f.writelines(newLines)
+            else:
+                #drop the oldest judgments, the tmp file keeps the old ones whole until the new ones replace them:
+                tmpFile = f"{judgments_file}.tmp"
+                with open(tmpFile, 'w', encoding='utf-8') as f:
+                    f.writelines((lines + newLines)[-MaxJudgments:])
+                os.replace(tmpFile, judgments_file)
+    except (IOError, ValueError, KeyError):
+        logger.error(f"Failed to record relevance judgments to {judgments_file}")
+    return
+
+
+def _metrics(scores: np.ndarray, examples: List[Tuple[str, bool, float]], thresholds: Iterable[float]) -> List[dict]:
+    labels = np.array([related for _, related, _ in examples], dtype=bool)
+    weights = np.array([weight for _, _, weight in examples], dtype=float)
+
+    report = []
+    for threshold in thresholds:
+        kept = scores >= threshold
+        truePositives = float(weights[kept & labels].sum())
+        report.append({
+            "threshold": threshold,
+            "precision": truePositives / max(1e-9, float(weights[kept].sum())),
+            "recall": truePositives / max(1e-9, float(weights[labels].sum())),
+            "kept": float(weights[kept].sum() / weights.sum()) if len(examples) else 0.0,
+        })
+    return report
+
+
+def evaluate(model: RelevanceModel, examples: List[Tuple[str, bool, float]], thresholds: Iterable[float]) -> List[dict]:
+    """
+    Weighted precision and recall of the filter against the labels, and the share of news it keeps, at each threshold.
+    Audited news count as dropped, they measure the filter itself. Only meaningful on examples the model was not trained on.
+    """
+    return _metrics(model.score([text for text, _, _ in examples]), examples, thresholds)
+
+
+def cross_validate(examples: List[Tuple[str, bool, float]], groups: List[str], thresholds: Iterable[float],
+                   folds: int = ReportFolds) -> Dict[str, List[dict]]:
+    """
+    Evaluate the trained model on held-out data: every fold is scored by a model trained on the other folds.
+    An example is in the fold of the crc32 of its text, so repeated news never land on both sides.
+
+    Args:
+        groups: The name of the set each example comes from, the metrics are reported per set.
+
+    Returns:
+        The evaluate() report of each set.
+    """
+    foldOf = np.array([zlib.crc32(text.encode("utf-8")) % folds for text, _, _ in examples])
+    scores = np.zeros(len(examples))
+    for fold in range(folds):
+        heldOut = np.flatnonzero(foldOf == fold)
+        training = [examples[i] for i in np.flatnonzero(foldOf != fold)]
+        if len(heldOut) == 0 or len({related for _, related, _ in training}) < 2:
+            #a fold without both labels to learn from is scored by the lexicon alone:
+            scores[heldOut] = RelevanceModel().score([examples[i][0] for i in heldOut])
+            continue
+        scores[heldOut] = train_model(training).score([examples[i][0] for i in heldOut])
+
+    report = {}
+    for group in dict.fromkeys(groups):
+        members = [i for i, name in enumerate(groups) if name == group]
+        report[group] = _metrics(scores[members], [examples[i] for i in members], thresholds)
+    return report
+
+
+# Offline training and evaluation:
+#   python -m utils.relevanceUtil train
+#   python -m utils.relevanceUtil report [threshold ...]
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    fixtures = read_examples(FixtureFile)
+    judgments = read_examples(JudgmentsFile)
+
+    if command == "train":
+        model = train_model(fixtures + judgments)
+        model.save(RelevanceModelFile)
+        print(f"Trained on {len(fixtures)} fixtures and {len(judgments)} judgments, {len(model.vocabulary)} terms, saved to {RelevanceModelFile}")
+    else:
+        thresholds = [float(arg) for arg in sys.argv[2:]] or [0.1, 0.2, 0.25, 0.3, 0.4, 0.5, 0.6]
+
+        def print_report(title, rows):
+            print(f"\n{title}:")
+            print(f"{'threshold':>10} {'precision':>10} {'recall':>10} {'kept':>10}")
+            for row in rows:
+                print(f"{row['threshold']:>10.2f} {row['precision']:>10.2f} {row['recall']:>10.2f} {row['kept']:>10.0%}")
+
+        #the saved model was trained on all the examples, scoring it on them would say nothing, the report holds them out:
+        sets = [("fixtures", fixtures), ("LLM judgments", judgments)]
+        examples = fixtures + judgments
+        groups = [name for name, members in sets for _ in members]
+        crossValidated = cross_validate(examples, groups, thresholds) if examples else {}
+        print(f"Weighted metrics, audited judgments weigh {AuditWeight:g}, the filter threshold is {RelevanceThreshold:g}")
+        for name, members in sets:
+            if len(members) == 0:
+                continue
+            print_report(f"Lexicon only against {len(members)} {name}", evaluate(RelevanceModel(), members, thresholds))
+            print_report(f"Trained model against {len(members)} {name}, {ReportFolds}-fold cross-validated", crossValidated[name])
@@ -0,0 +1,234 @@
+import os
+import mmap
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from utils.logUtil import setup_logger
+
+logger = setup_logger("tickerStore")
+
+
+# File layout, all integers are little-endian uint32:
+#   magic (4 bytes) | count
+#   recordOffsets[count + 1]  start of each record in the blob, plus the end of the last one
+#   nameOffsets[count]        start of the name inside each record
+#   blob                      utf-8 ticker and name of every record, back to back
+# Records are sorted by ticker, so a ticker can be found by binary search without decoding the table.
+Magic = b"TKS1"
+_header = struct.Struct("<4sI")
+_uint = struct.Struct("<I")
+
+
+class TickerStore:
+    """
+    Read-only, memory-mapped table of (ticker, name) records.
+
+    Opening the store only maps the file, records are decoded on access. It behaves like a
+    sequence of (ticker, name) tuples, so it can be handed to CompanyIndex as is.
+    """
+    def __init__(self, store_file: str):
+        self.store_file = store_file
+        self._file = None
+        self._map = None
+        self._open()
+        return
+
+
+    def _open(self):
+        self._file = open(self.store_file, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self._count = _header.unpack_from(self._map, 0)
+        if magic != Magic:
+            self.close()
+            raise ValueError(f"{self.store_file} is not a ticker store")
+
+        self._recordBase = _header.size
+        self._nameBase = self._recordBase + (self._count + 1) * _uint.size
+        self._blobBase = self._nameBase + self._count * _uint.size
+        return
+
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return
+
+
+    def __len__(self) -> int:
+        return self._count
+
+
+    def _span(self, i: int) -> Tuple[int, int, int]:
+        start = _uint.unpack_from(self._map, self._recordBase + i * _uint.size)[0]
+        end = _uint.unpack_from(self._map, self._recordBase + (i + 1) * _uint.size)[0]
+        name = _uint.unpack_from(self._map, self._nameBase + i * _uint.size)[0]
+        return (self._blobBase + start, self._blobBase + name, self._blobBase + end)
+
+
+    def ticker(self, i: int) -> str:
+        start, name, _ = self._span(i)
+        return self._map[start:name].decode("utf-8")
+
+
+    def __getitem__(self, i: int) -> Tuple[str, str]:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("ticker store index out of range")
+
+        start, name, end = self._span(i)
+        return (self._map[start:name].decode("utf-8"), self._map[name:end].decode("utf-8"))
+
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for i in range(self._count):
+            yield self[i]
+
+
+    def find(self, ticker: str) -> Optional[str]:
+        """
+        Look up a company name by its ticker.
+
+        Args:
+            ticker (str): The stock ticker, case sensitive.
+
+        Returns:
+            The company name, or None if the ticker is not in the store.
+        """
+        key = ticker.encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            start, name, end = self._span(mid)
+            if self._map[start:name] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._count:
+            start, name, end = self._span(low)
+            if self._map[start:name] == key:
+                return self._map[name:end].decode("utf-8")
+        return None
+
+
+    def refresh(self, listing: Iterable[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Apply a new listing to the store: add new tickers, drop delisted ones and update renamed ones.
+        The file is only rewritten if something changed.
+
+        Args:
+            listing: The complete current listing as (ticker, name) pairs.
+
+        Returns:
+            A dict with the number of 'added', 'delisted' and 'renamed' tickers.
+        """
+        latest = dict(listing)
+
+        kept: List[Tuple[str, str]] = []
+        delisted = 0
+        renamed = 0
+        for ticker, name in self:
+            newName = latest.pop(ticker, None)
+            if newName is None:
+                delisted += 1
+                continue
+            if newName != name:
+                renamed += 1
+            kept.append((ticker, newName))
+
+        #whatever is left in the new listing was not in the store yet:
+        added = len(latest)
+        summary = {"added": added, "delisted": delisted, "renamed": renamed}
+        if added == 0 and delisted == 0 and renamed == 0:
+            return summary
+
+        #kept is still in ticker order, so only the new tickers need sorting before the merge:
+        records = _merge_sorted(kept, sorted(latest.items(), key=lambda item: item[0].encode("utf-8")))
+
+        self.close()
+        write_ticker_store(self.store_file, records)
+        self._open()
+
+        logger.info(f"Refreshed ticker store {self.store_file}: {summary}")
+        return summary
+
+
+
+def _merge_sorted(left: List[Tuple[str, str]], right: List[Tuple[str, str]]) -> Iterator[Tuple[str, str]]:
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        if left[i][0].encode("utf-8") <= right[j][0].encode("utf-8"):
+            yield left[i]
+            i += 1
+        else:
+            yield right[j]
+            j += 1
+    yield from left[i:]
+    yield from right[j:]
+
+
+def write_ticker_store(store_file: str, records: Iterable[Tuple[str, str]]):
+    """
+    Write (ticker, name) records to a ticker store file. The file is written to a temporary
+    file first and then renamed, so readers never see a partially written store.
+
+    Args:
+        store_file (str): The store file to write.
+        records: (ticker, name) pairs. They are sorted by ticker if they are not already.
+    """
+    encoded = [(ticker.encode("utf-8"), name.encode("utf-8")) for ticker, name in records]
+    if any(encoded[i][0] > encoded[i + 1][0] for i in range(len(encoded) - 1)):
+        encoded.sort(key=lambda record: record[0])
+
+    recordOffsets = bytearray()
+    nameOffsets = bytearray()
+    blob = bytearray()
+    for ticker, name in encoded:
+        recordOffsets += _uint.pack(len(blob))
+        nameOffsets += _uint.pack(len(blob) + len(ticker))
+        blob += ticker
+        blob += name
+    recordOffsets += _uint.pack(len(blob))
+
+    tmpFile = f"{store_file}.tmp"
+    with open(tmpFile, "wb") as f:
+        f.write(_header.pack(Magic, len(encoded)))
+        f.write(recordOffsets)
+        f.write(nameOffsets)
+        f.write(blob)
+    os.replace(tmpFile, store_file)
+
+    logger.info(f"Wrote {len(encoded)} tickers to {store_file}")
+    return
+
+
+def parse_listing(text: str) -> List[Tuple[str, str]]:
+    """
+    Parse a LISTING_STATUS csv (or data/tickers.csv) into (ticker, name) pairs,
+    keeping the first two columns and skipping the header line.
+    """
+    listing = []
+    lines = text.splitlines()
+    for line in lines[1:]:
+        columns = line.strip().split(",")
+        if len(columns) < 2 or not columns[0]:
+            continue
+        listing.append((columns[0], columns[1].strip()))
+    return listing
+
+
+# Usage
+if __name__ == "__main__":
+    import time
+
+    with open("data/tickers.csv", "r") as f:
+        write_ticker_store("data/tickers.bin", parse_listing(f.read()))
+
+    start = time.perf_counter()
+    store = TickerStore("data/tickers.bin")
+    print(f"Opened {len(store)} tickers in {(time.perf_counter() - start) * 1000:.3f} ms")
+    print(store.find("AAPL"), store[0], store[-1])
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import uuid
+import itertools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from utils.logUtil import setup_logger
+
+logger = setup_logger("traceUtil")
+
+
+#every traced run appends one "run" record and its spans here, see the summary at the end of this module:
+TraceFile = 'data/traces.jsonl'
+TracingEnabled = True
+
+
+class TraceRun:
+    """
+    Spans and counters of one run. Span times are seconds from the start of the run.
+
+    Span kinds:
+        llm: one LLM response of an agent, from its input or the last tool result to its output
+        tool: one tool call, from ToolCall to the ToolCallResult with the same tool id
+        http: one HTTP request
+    """
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.startedAt = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[dict] = []
+        self.counters: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        return
+
+
+    def add_span(self, kind: str, name: str, start: float, end: float, parent: Optional[int] = None, **attrs) -> int:
+        spanId = next(self._ids)
+        self.spans.append({"run": self.id, "kind": kind, "name": name, "span": spanId, "parent": parent,
+                           "start": round(start - self.start, 6), "duration": round(end - start, 6), **attrs})
+        return spanId
+
+
+    def count(self, counter: str, n: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+        return
+
+
+    def write(self, trace_file: str):
+        record = {"run": self.id, "kind": "run", "name": self.name, "startedAt": self.startedAt,
+                  "duration": round(time.perf_counter() - self.start, 6), "counters": self.counters, **self.attrs}
+        try:
+            with open(trace_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+                f.writelines(json.dumps(span) + "\n" for span in self.spans)
+        except IOError:
+            logger.error(f"Failed to write trace to {trace_file}")
+        return
+
+
+_currentRun: ContextVar[Optional[TraceRun]] = ContextVar("traceRun", default=None)
+
+
+@contextmanager
+def start_run(name: str, trace_file: str = TraceFile, **attrs) -> Iterator[Optional[TraceRun]]:
+    """
+    Trace everything done in this context, including the tasks it starts, as one run written to 'trace_file' at the end.
+    """
+    if not TracingEnabled:
+        yield None
+        return
+
+    run = TraceRun(name, **attrs)
+    token = _currentRun.set(run)
+    try:
+        yield run
+    finally:
+        _currentRun.reset(token)
+        run.write(trace_file)
+
+
+@contextmanager
+def span(kind: str, name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """
+    Record the time spent in this context as a span of the current run, nothing happens outside a run.
+    Yields the attributes of the span, so the caller can add to them.
+    """
+    run = _currentRun.get()
+    if run is None:
+        yield attrs
+        return
+
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        run.add_span(kind, name, start, time.perf_counter(), **attrs)
+
+
+def count(counter: str, n: int = 1):
+    """Add to a counter of the current run, e.g. "priceStore.hit" and "priceStore.miss" give a hit rate."""
+    run = _currentRun.get()
+    if run is not None:
+        run.count(counter, n)
+    return
+
+
+def _token_usage(raw: Any) -> Dict[str, int]:
+    #OpenAI compatible responses, like DeepSeek's, carry the token counts under 'usage':
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = {key: getattr(usage, key, None) for key in ("prompt_tokens", "completion_tokens")}
+    return {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if usage.get(key) is not None}
+
+
+class AgentEventTracer:
+    """
+    Turns the events of an AgentWorkflow stream into llm and tool spans of the current run.
+    A tool span is linked to the llm span that asked for it through the tool id.
+    """
+    def __init__(self):
+        self.run = _currentRun.get()
+        self._turnStart = time.perf_counter()
+        self._toolStarts: Dict[str, Tuple[float, Optional[int]]] = {}
+        self._requestedBy: Dict[str, int] = {}
+        return
+
+
+    def observe(self, event: Any):
+        if self.run is None:
+            return
+
+        #imported here, so tracing HTTP requests does not pull in llama_index:
+        from llama_index.core.agent.workflow import AgentInput, AgentOutput, ToolCall, ToolCallResult
+
+        now = time.perf_counter()
+        if isinstance(event, AgentInput):
+            self._turnStart = now
+        elif isinstance(event, AgentOutput):
+            toolIds = [call.tool_id for call in event.tool_calls]
+            spanId = self.run.add_span("llm", event.current_agent_name, self._turnStart, now,
+                                       tool_calls=toolIds, **_token_usage(event.raw))
+            for toolId in toolIds:
+                self._requestedBy[toolId] = spanId
+        elif isinstance(event, ToolCallResult):
+            start, parent = self._toolStarts.pop(event.tool_id, (self._turnStart, self._requestedBy.get(event.tool_id)))
+            self.run.add_span("tool", event.tool_name, start, now, parent, tool_id=event.tool_id)
+            #the next LLM response starts thinking once the tool results are in:
+            self._turnStart = now
+        elif isinstance(event, ToolCall):
+            self._toolStarts[event.tool_id] = (now, self._requestedBy.get(event.tool_id))
+        return
+
+
+def read_traces(trace_file: str) -> Tuple[List[dict], Dict[str, List[dict]]]:
+    """
+    Returns:
+        A tuple of the run records in file order and the spans of each run by run id.
+    """
+    runs = []
+    spans: Dict[str, List[dict]] = {}
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["kind"] == "run":
+                runs.append(record)
+            else:
+                spans.setdefault(record["run"], []).append(record)
+    return (runs, spans)
+
+
+def _covered(intervals: List[Tuple[float, float]]) -> float:
+    #time covered by the union of the intervals, concurrent spans count once:
+    total = 0.0
+    end = float("-inf")
+    for start, stop in sorted(intervals):
+        if stop > end:
+            total += stop - max(start, end)
+            end = stop
+    return total
+
+
+def critical_path(run: dict, spans: List[dict]) -> Dict[str, float]:
+    """Split the wall time of a run into LLM time, tool time (with the HTTP time inside tools) and the rest."""
+    def intervals(kind):
+        return [(s["start"], s["start"] + s["duration"]) for s in spans if s["kind"] == kind]
+
+    llm = _covered(intervals("llm"))
+    tools = _covered(intervals("tool"))
+    toolIntervals = intervals("tool")
+    httpInTools = _covered([(max(start, toolStart), min(stop, toolStop))
+                            for start, stop in intervals("http") for toolStart, toolStop in toolIntervals
+                            if start < toolStop and toolStart < stop])
+    return {"total": run["duration"], "llm": llm, "tools": tools, "httpInTools": httpInTools,
+            "other": max(0.0, run["duration"] - llm - tools)}
+
+
+def print_summary(trace_file: str = TraceFile, lastRuns: int = 10):
+    import numpy as np
+
+    if not os.path.exists(trace_file):
+        print(f"No traces in {trace_file}")
+        return
+    runs, spans = read_traces(trace_file)
+
+    print(f"Critical path of the last {min(lastRuns, len(runs))} of {len(runs)} runs, in seconds:")
+    print(f"{'run':<14}{'attributes':<28}{'total':>8}{'llm':>8}{'tools':>8}{'http':>8}{'other':>8}")
+    for run in runs[-lastRuns:]:
+        path = critical_path(run, spans.get(run["run"], []))
+        attrs = " ".join(f"{value}" for key, value in run.items() if key not in ("run", "kind", "name", "startedAt", "duration", "counters"))
+        print(f"{run['run']:<14}{attrs[:27]:<28}{path['total']:>8.2f}{path['llm']:>8.2f}{path['tools']:>8.2f}{path['httpInTools']:>8.2f}{path['other']:>8.2f}")
+
+    durations: Dict[Tuple[str, str], List[float]] = {}
+    tokens: Dict[str, List[int]] = {}
+    for runSpans in spans.values():
+        for s in runSpans:
+            durations.setdefault((s["kind"], s["name"]), []).append(s["duration"])
+            if s["kind"] == "llm" and "completion_tokens" in s:
+                tokens.setdefault(s["name"], []).append(s.get("prompt_tokens", 0) + s["completion_tokens"])
+
+    print(f"\nSpans across all runs, in seconds:")
+    print(f"{'kind':<6}{'name':<32}{'count':>7}{'p50':>8}{'p95':>8}{'total':>9}{'tokens/call':>13}")
+    for (kind, name), values in sorted(durations.items()):
+        p50, p95 = np.percentile(values, [50, 95])
+        perCall = f"{np.mean(tokens[name]):.0f}" if kind == "llm" and name in tokens else ""
+        print(f"{kind:<6}{name[:31]:<32}{len(values):>7}{p50:>8.3f}{p95:>8.3f}{sum(values):>9.2f}{perCall:>13}")
+
+    counters: Dict[str, int] = {}
+    for run in runs:
+        for counter, n in run.get("counters", {}).items():
+            counters[counter] = counters.get(counter, 0) + n
+    prefixes = sorted({counter.rsplit(".", 1)[0] for counter in counters})
+    if prefixes:
+        print(f"\nCache hit rates across all runs:")
+        for prefix in prefixes:
+            hits = counters.get(f"{prefix}.hit", 0)
+            lookups = sum(n for counter, n in counters.items() if counter.rsplit(".", 1)[0] == prefix)
+            print(f"{prefix:<20}{hits:>6} of {lookups:<6}{hits / max(1, lookups):>8.0%}")
+    return
+
+
+# Summary of the traces: python -m utils.traceUtil [trace file] [last runs]
+if __name__ == "__main__":
+    import sys
+
+    traceFile = sys.argv[1] if len(sys.argv) > 1 else TraceFile
+    lastRuns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print_summary(traceFile, lastRuns)